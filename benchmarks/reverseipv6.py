@@ -0,0 +1,133 @@
+"""
+Copyright (c) 2012, Nicholas Steicke
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this
+   list of conditions and the following disclaimer.
+2. Redistributions in binary form must reproduce the above copyright notice,
+   this list of conditions and the following disclaimer in the documentation
+   and/or other materials provided with the distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+The views and conclusions contained in the software and documentation are those
+of the authors and should not be interpreted as representing official policies,
+either expressed or implied, of the project author/s.
+"""
+
+import argparse
+import os.path
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import dns.message
+import dns.rdatatype
+import dns.reversename
+
+from providers import reverseipv6
+from utils import wire
+
+"""
+Times AutoReverseIpv6 synthesising answers, through getResponse and
+through getWireResponse both for names it has not answered before and for
+names in its cache of answers, and prints microseconds per query.
+
+    python benchmarks/reverseipv6.py [-n number]
+"""
+
+soa = {
+    'ns': 'localhost.',
+    'contact': 'hostmaster.example.',
+    'refresh': 7200,
+    'retry': 600,
+    'expire': 36000,
+    'minimum': 300,
+    'ttl': 7200
+}
+
+nameservers = ['localhost.', 'ns0.localhost.', 'ns1.localhost.']
+
+queries = [
+    (dns.rdatatype.AAAA,
+     lambda i: '2001-44b8-0236-8f00-0000-0000-%04x-%04x.v6.example.' % (
+         i >> 16, i & 0xffff)),
+    (dns.rdatatype.PTR,
+     lambda i: dns.reversename.from_address(
+         '2001:44b8:236:8f00::%x:%x' % (i >> 16, i & 0xffff))),
+    (dns.rdatatype.NS, lambda i: 'v6.example.'),
+    (dns.rdatatype.MX, lambda i: 'v6.example.'),
+]
+
+
+def timeQuery(provider, rdtype, makeName, number):
+    # every query asks for a different name, as clients mostly do
+    requests = [
+        dns.message.make_query(makeName(i), rdtype)
+        for i in range(number)
+    ]
+
+    full = timeit.timeit(
+        lambda: [provider.getResponse(r, None) for r in requests],
+        number=1
+    )
+
+    if not hasattr(provider, 'getWireResponse'):
+        return full, None, None
+
+    data = [r.to_wire() for r in requests]
+
+    def answer():
+        for d in data:
+            provider.getWireResponse(wire.parseQuery(d), d, None)
+
+    provider.answers.clear()
+    synthesised = timeit.timeit(answer, number=1)
+    cached = timeit.timeit(answer, number=1)
+
+    return full, synthesised, cached
+
+
+def main():
+    parser = argparse.ArgumentParser(description='AutoReverseIpv6 benchmark')
+    parser.add_argument('-n', '--number', type=int, default=10000)
+    args = parser.parse_args()
+
+    provider = reverseipv6.AutoReverseIpv6(
+        'v6.example.',
+        '2001:44b8:236:8f00::',
+        soa,
+        nameservers
+    )
+
+    print('{:<20} {:>12} {:>12} {:>12}'.format(
+        'query', 'getResponse', 'wire', 'wire cached'
+    ))
+    for rdtype, makeName in queries:
+        times = timeQuery(provider, rdtype, makeName, args.number)
+        print('{:<20} {:>12} {:>12} {:>12}'.format(
+            dns.rdatatype.to_text(rdtype),
+            *[
+                '-' if t is None else '{:.1f}us'.format(
+                    t / args.number * 1e6
+                )
+                for t in times
+            ]
+        ))
+
+
+if __name__ == '__main__':
+    main()
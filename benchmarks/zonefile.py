@@ -0,0 +1,168 @@
+"""
+Copyright (c) 2012, Nicholas Steicke
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this
+   list of conditions and the following disclaimer.
+2. Redistributions in binary form must reproduce the above copyright notice,
+   this list of conditions and the following disclaimer in the documentation
+   and/or other materials provided with the distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+The views and conclusions contained in the software and documentation are those
+of the authors and should not be interpreted as representing official policies,
+either expressed or implied, of the project author/s.
+"""
+
+import argparse
+import os.path
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import dns.message
+import dns.name
+import dns.rdatatype
+
+from providers import file
+from utils import wire
+
+"""
+Times ZoneFile answering queries, through getResponse and through the
+compiled wire format tables, and prints microseconds per query. ANY
+queries are also timed the way they were answered before ZoneFile listed
+the rdatasets at the node, by looking up every known type in turn.
+
+    python benchmarks/zonefile.py [zone file] [origin]
+"""
+
+examplePath = os.path.join(
+    os.path.dirname(__file__),
+    '..', 'providers', 'example.txt'
+)
+
+queries = [
+    ('e.example.', dns.rdatatype.A),
+    ('e.example.', dns.rdatatype.ANY),
+    ('c.example.', dns.rdatatype.AAAA),
+    ('x.y.z.example.', dns.rdatatype.MX),
+    ('x.e.example.', dns.rdatatype.A),
+]
+
+
+def perTypeRdataset(data, name, rdtype, first=True):
+    # the wildcard recursion each type was looked up through
+    try:
+        return data.find_rdataset(name, rdtype)
+    except KeyError:
+        if name.is_wild():
+            name = name.parent()
+        if not first:
+            name = name.parent()
+        name = dns.name.Name(['*']).concatenate(name)
+
+        return perTypeRdataset(data, name, rdtype, False)
+
+
+def perTypeAny(data, request):
+    response = dns.message.make_response(request)
+    name = request.question[0].name
+
+    for rdtype in dns.rdatatype.RdataType:
+        try:
+            rdataset = perTypeRdataset(data, name, rdtype)
+        except (KeyError, dns.name.NoParent):
+            continue
+
+        file.addRdataset(response, response.answer, name, rdataset)
+
+    return response
+
+
+def timeQuery(zone, name, rdtype, number):
+    request = dns.message.make_query(name, rdtype)
+    data = request.to_wire()
+
+    full = timeit.timeit(
+        lambda: zone.getResponse(request, None),
+        number=number
+    )
+
+    perType = None
+    if rdtype == dns.rdatatype.ANY:
+        perType = timeit.timeit(
+            lambda: perTypeAny(zone.state.data, request),
+            number=number
+        )
+
+    if zone.state.answers is None:
+        return full, None, perType
+
+    compiled = timeit.timeit(
+        lambda: zone.getWireResponse(wire.parseQuery(data), data, None),
+        number=number
+    )
+
+    return full, compiled, perType
+
+
+def main():
+    parser = argparse.ArgumentParser(description='ZoneFile benchmark')
+    parser.add_argument('zone', nargs='?', default=examplePath)
+    parser.add_argument('origin', nargs='?', default='example.')
+    parser.add_argument('-n', '--number', type=int, default=10000)
+    parser.add_argument('-q', '--query', action='append', default=[],
+                        help='name/type to time, e.g. www.example./A')
+    args = parser.parse_args()
+
+    todo = queries
+    if args.query:
+        todo = []
+        for query in args.query:
+            name, rdtype = query.rsplit('/', 1)
+            todo.append((name, dns.rdatatype.from_text(rdtype)))
+
+    zones = [
+        ('full ANY', file.ZoneFile(args.zone, args.origin, compiled=True)),
+        ('minimal ANY', file.ZoneFile(
+            args.zone,
+            args.origin,
+            compiled=True,
+            minimalAny=True
+        )),
+    ]
+
+    print('{:<12} {:<28} {:>12} {:>12} {:>12}'.format(
+        'zone', 'query', 'getResponse', 'compiled', 'per type'
+    ))
+    for label, zone in zones:
+        for name, rdtype in todo:
+            times = timeQuery(zone, name, rdtype, args.number)
+            print('{:<12} {:<28} {:>12} {:>12} {:>12}'.format(
+                label,
+                '{} {}'.format(name, dns.rdatatype.to_text(rdtype)),
+                *[
+                    '-' if t is None else '{:.1f}us'.format(
+                        t / args.number * 1e6
+                    )
+                    for t in times
+                ]
+            ))
+
+
+if __name__ == '__main__':
+    main()
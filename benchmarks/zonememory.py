@@ -0,0 +1,126 @@
+"""
+Copyright (c) 2012, Nicholas Steicke
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this
+   list of conditions and the following disclaimer.
+2. Redistributions in binary form must reproduce the above copyright notice,
+   this list of conditions and the following disclaimer in the documentation
+   and/or other materials provided with the distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+The views and conclusions contained in the software and documentation are those
+of the authors and should not be interpreted as representing official policies,
+either expressed or implied, of the project author/s.
+"""
+
+import argparse
+import gc
+import os
+import os.path
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import dns.name
+import dns.zone
+
+from utils import zoneparser, zonestore
+
+"""
+Generates a zone with a name per host, each holding an A, an AAAA and a
+TXT record, and prints the memory held by, and the peak while loading, a
+parsed dns.zone.Zone, a utils.zonestore.CompactStore converted from it and
+a CompactStore read straight from the file by utils.zoneparser.
+
+    python benchmarks/zonememory.py [-n hosts]
+"""
+
+
+def generate(f, hosts):
+    f.write('$ORIGIN bench.\n$TTL 300\n')
+    f.write('@ SOA ns hostmaster 1 7200 600 36000 300\n')
+    f.write('@ NS ns\nns A 192.0.2.1\n')
+    for i in range(hosts):
+        f.write('host{0} A 10.{1}.{2}.{3}\n'.format(
+            i, i >> 16 & 255, i >> 8 & 255, i & 255
+        ))
+        f.write('host{0} AAAA 2001:db8::{0:x}\n'.format(i))
+        f.write('host{0} TXT "host {0}"\n'.format(i))
+
+
+def measure(build):
+    gc.collect()
+    tracemalloc.start()
+    start = time.time()
+    result = build()
+    elapsed = time.time() - start
+    gc.collect()
+    size, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return result, size, peak, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='zone memory benchmark')
+    parser.add_argument('-n', '--hosts', type=int, default=20000)
+    args = parser.parse_args()
+
+    fd, path = tempfile.mkstemp()
+    try:
+        with os.fdopen(fd, 'w') as f:
+            generate(f, args.hosts)
+
+        origin = dns.name.from_text('bench.')
+        results = [
+            ('dns.zone', measure(
+                lambda: dns.zone.from_file(path, origin, relativize=False)
+            )),
+            ('converted', measure(
+                lambda: zonestore.CompactStore.fromZone(
+                    dns.zone.from_file(path, origin, relativize=False)
+                )
+            )),
+            ('streamed', measure(
+                lambda: zonestore.CompactStore.fromRecords(
+                    origin,
+                    zoneparser.readBatches(path, origin)
+                )
+            )),
+        ]
+    finally:
+        os.unlink(path)
+
+    records = args.hosts * 3
+    print('{:<10} {:>10} {:>12} {:>10} {:>8}'.format(
+        'store', 'held', 'per record', 'peak', 'time'
+    ))
+    for label, (result, size, peak, elapsed) in results:
+        print('{:<10} {:>7.1f}MiB {:>10.1f}B {:>7.1f}MiB {:>7.1f}s'.format(
+            label,
+            size / 1024 / 1024,
+            size / records,
+            peak / 1024 / 1024,
+            elapsed
+        ))
+
+
+if __name__ == '__main__':
+    main()
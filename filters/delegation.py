@@ -36,6 +36,7 @@ import dns.rdtypes.IN.AAAA
 
 import config.validator
 import utils.ipv6
+from utils import nametrie
 
 logger = logging.getLogger('DNS.Filter.Delegation')
 
@@ -63,6 +64,7 @@ class Delegation:
         self.zone = zone
         if type(zone) == str:
             self.zone = dns.name.from_text(zone)
+        self.zoneKey = nametrie.nameKey(self.zone)
 
         self.nameservers = []
         self.glue = {}
@@ -108,7 +110,7 @@ class Delegation:
                 self.zone,
                 self.nameservers[0].rdclass,
                 self.nameservers[0].rdtype,
-                self.nameservers[0].covers,
+                self.nameservers[0].covers(),
                 None,
                 True
             )
@@ -117,20 +119,30 @@ class Delegation:
                 nsRRset.add(ns, self.ttl)
 
             for name, glue in self.glue.items():
-                glueRRset = response.find_rrset(
-                    response.additional,
-                    name,
-                    glue[0].rdclass,
-                    glue[0].rdtype,
-                    glue[0].covers,
-                    None,
-                    True
-                )
+                # A and AAAA glue for a name go in rrsets of their own
                 for record in glue:
+                    glueRRset = response.find_rrset(
+                        response.additional,
+                        name,
+                        record.rdclass,
+                        record.rdtype,
+                        record.covers(),
+                        None,
+                        True
+                    )
                     glueRRset.add(record, self.ttl)
 
         return response
 
+    def appliesTo(self, nameKey):
+        '''
+        Whether the filter changes the answer for the name with the given
+        utils.nametrie key. Names outside the delegated zone are left to
+        the provider's wire format answers.
+        '''
+
+        return nameKey[:len(self.zoneKey)] == self.zoneKey
+
     def __eq__(self, other):
         return self.zone.__eq__(other.zone)
 
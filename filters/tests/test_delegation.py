@@ -29,4 +29,88 @@ either expressed or implied, of the project author/s.
 
 import unittest
 
+import dns.message
+import dns.rcode
+import dns.rdatatype
+import dns.reversename
+
 import filters.delegation
+import ndns
+import providers.reverseipv6
+from utils import nametrie
+
+soa = {
+    'ns': 'localhost.',
+    'contact': 'hostmaster.example.',
+    'refresh': 7200,
+    'retry': 600,
+    'expire': 36000,
+    'minimum': 300,
+    'ttl': 7200
+}
+
+
+class ReverseIPv6DelegationTest(unittest.TestCase):
+
+    def setUp(self):
+        self.delegation = filters.delegation.ReverseIPv6Delegation(
+            '2001:44b8:236:8f00:0000::',
+            ['ns1.example.'],
+            glue={'ns1.example.': ['::1', '192.0.2.1']}
+        )
+
+    def testFilter(self):
+        request = dns.message.make_query(
+            dns.reversename.from_address('2001:44b8:236:8f00::1'),
+            dns.rdatatype.PTR
+        )
+        response = self.delegation.filter(
+            request,
+            dns.message.make_response(request)
+        )
+
+        self.assertEqual(response.answer[0].name, self.delegation.zone)
+        self.assertEqual(response.answer[0].rdtype, dns.rdatatype.NS)
+        self.assertEqual(
+            sorted(rrset.rdtype for rrset in response.additional),
+            [dns.rdatatype.A, dns.rdatatype.AAAA]
+        )
+
+    def testAppliesTo(self):
+        for address, applies in (('2001:44b8:236:8f00::1', True),
+                                 ('2001:44b8:236:8f00:1::1', False)):
+            name = dns.reversename.from_address(address)
+            self.assertEqual(
+                self.delegation.appliesTo(nametrie.nameKey(name)),
+                applies
+            )
+
+    def testServer(self):
+        provider = providers.reverseipv6.AutoReverseIpv6(
+            'v6.example.',
+            '2001:44b8:236:8f00::',
+            soa,
+            ['ns0.example.']
+        )
+        provider.addFilter(self.delegation)
+        server = ndns.Ndns('::', 0)
+        server.registerProvider(provider)
+
+        def query(address):
+            q = dns.message.make_query(
+                dns.reversename.from_address(address),
+                dns.rdatatype.PTR
+            )
+            return dns.message.from_wire(
+                server.handleRequest(q.to_wire(), True, None)
+            )
+
+        response = query('2001:44b8:236:8f00::1')
+        self.assertEqual(response.rcode(), dns.rcode.NOERROR)
+        self.assertEqual(response.answer[0].rdtype, dns.rdatatype.NS)
+        self.assertEqual(provider.getStats()['misses'], 0)
+
+        # outside the delegation answers come from the wire path
+        response = query('2001:44b8:236:8f00:1::1')
+        self.assertEqual(response.answer[0].rdtype, dns.rdatatype.PTR)
+        self.assertEqual(provider.getStats()['misses'], 1)
@@ -29,17 +29,35 @@ of the authors and should not be interpreted as representing official policies,
 either expressed or implied, of the project author/s.
 """
 
+import os
+import gc
 import struct
 import socket
-import select
+import signal
+import selectors
 import queue
+import asyncio
 import threading
+import collections
+import itertools
+import time
+import concurrent.futures
+import argparse
 import logging
 
 import dns
+import dns.exception
+import dns.flags
 import dns.message
+import dns.opcode
+import dns.rcode
+import dns.rdatatype
 
 import utils
+from utils import cache
+from utils import fork
+from utils import nametrie
+from utils import wire
 
 logger = logging.getLogger('DNS')
 
@@ -51,62 +69,260 @@ class DnsError(Exception):
         self.message = message
 
 
+OVERLOAD_DROP = 'drop'
+OVERLOAD_SERVFAIL = 'servfail'
+OVERLOAD_REFUSED = 'refused'
+
+TRANSFER_TYPES = (dns.rdatatype.AXFR, dns.rdatatype.IXFR)
+
+# Largest UDP datagram, which queries carrying TSIG, large OPT records or
+# UPDATEs may come close to
+MAX_UDP_SIZE = 65535
+
+
+def responseTtl(response):
+    '''
+    Returns how long a response may be reused for, the lowest TTL of the
+    records it carries, with an SOA in the authority section limited to its
+    minimum field as for negative caching. Responses without records
+    return 0.
+    '''
+
+    ttls = []
+    for rrset in response.answer + response.authority + response.additional:
+        ttls.append(rrset.ttl)
+
+    for rrset in response.authority:
+        if rrset.rdtype == dns.rdatatype.SOA:
+            ttls.append(rrset[0].minimum)
+
+    if not ttls:
+        return 0
+
+    return min(ttls)
+
+
 class DnsRequestHandler(threading.Thread):
+    '''
+    Worker thread, answers requests taken from a RequestPool until it is
+    handed None.
+    '''
 
-    def __init__(self, ndns, request, isUdp, clientaddress):
-        self.raw_request = request
+    def __init__(self, ndns, pool):
         self.ndns = ndns
-        self.isUdp = isUdp
-        self.clientaddress = clientaddress
+        self.pool = pool
 
-        super().__init__()
+        super().__init__(daemon=True)
 
     def run(self):
-        request = dns.message.from_wire(self.raw_request, question_only=True)
-        response = dns.message.make_response(request)
+        while True:
+            item = self.pool.queue.get()
+            if item is None:
+                break
+
+            request, isUdp, clientaddress, queued = item
+            self.pool.recordWait(time.monotonic() - queued)
+
+            data, messages = self.ndns.answerFirst(request, isUdp,
+                                                   clientaddress)
+            self.ndns.queueResponse(data, isUdp, clientaddress, messages)
+
+
+class RequestPool:
+    '''
+    Fixed set of DnsRequestHandler threads fed from a bounded queue. When
+    the queue is full the server's overload policy decides what the client
+    gets back.
+    '''
+
+    def __init__(self, ndns, workers=8, depth=1024):
+        self.ndns = ndns
+        self.workers = workers
+        self.depth = depth
+
+        self.queue = queue.Queue(depth)
+        self.handlers = []
+
+        self.lock = threading.Lock()
+        self.submitted = 0
+        self.rejected = 0
+        self.answered = 0
+        self.waitTotal = 0.0
+        self.waitMax = 0.0
+        self.depthMax = 0
 
-        bestFitProvider = None
-        bestFitProviderDetails = None
+    def start(self):
+        for i in range(self.workers):
+            handler = DnsRequestHandler(self.ndns, self)
+            handler.start()
+            self.handlers.append(handler)
 
-        name = request.question[0].name
+    def stop(self):
+        for handler in self.handlers:
+            self.queue.put(None)
 
-        found = False
-        for provider in self.ndns.getProviders():
-            for zone in provider.getZones(self.clientaddress):
-                compare = name.fullcompare(zone)
+        for handler in self.handlers:
+            handler.join()
 
-                if compare[0] == dns.name.NAMERELN_EQUAL:
-                    bestFitProvider = provider
-                    bestFitProviderDetails = compare
-                    found = True
+        self.handlers = []
+
+    def submit(self, request, isUdp, clientaddress):
+        '''
+        Queues a request for the workers, returns False if the queue is full.
+        '''
+
+        try:
+            self.queue.put_nowait(
+                (request, isUdp, clientaddress, time.monotonic())
+            )
+        except queue.Full:
+            with self.lock:
+                self.rejected += 1
+            return False
+
+        depth = self.queue.qsize()
+        with self.lock:
+            self.submitted += 1
+            if depth > self.depthMax:
+                self.depthMax = depth
+
+        return True
+
+    def recordWait(self, wait):
+        with self.lock:
+            self.answered += 1
+            self.waitTotal += wait
+            if wait > self.waitMax:
+                self.waitMax = wait
+
+    def getStats(self):
+        with self.lock:
+            return {
+                'workers': self.workers,
+                'depth': self.queue.qsize(),
+                'depthLimit': self.depth,
+                'depthMax': self.depthMax,
+                'submitted': self.submitted,
+                'rejected': self.rejected,
+                'waitAvg': self.waitTotal / self.answered
+                if self.answered else 0.0,
+                'waitMax': self.waitMax,
+            }
+
+
+class TcpConnection:
+    '''
+    A client TCP connection. As per RFC 7766 a connection carries any number
+    of length prefixed queries, answered in whatever order they complete.
+
+    Complete messages are cut from the front of the input bytearray, which
+    CPython does by moving the start of the buffer rather than copying the
+    unread tail, so it behaves as a ring buffer.
+    '''
+
+    def __init__(self, sock, clientaddress):
+        self.sock = sock
+        self.clientaddress = clientaddress
+
+        self.inbuf = bytearray()
+        self.outbuf = bytearray()
+        self.responses = queue.SimpleQueue()
+        # the rest of the messages of each transfer being sent, oldest first
+        self.transfers = collections.deque()
+
+        self.pending = 0
+        self.closing = False
+        self.lastActive = time.monotonic()
+
+    def feed(self, data):
+        '''
+        Appends received bytes, returns the queries they complete.
+        '''
+
+        self.inbuf += data
+        self.lastActive = time.monotonic()
+
+        requests = []
+        offset = 0
+        end = len(self.inbuf)
+
+        with memoryview(self.inbuf) as view:
+            while end - offset >= 2:
+                length = view[offset] << 8 | view[offset + 1]
+                if end - offset - 2 < length:
                     break
-                elif compare[0] == dns.name.NAMERELN_SUBDOMAIN:
-                    if bestFitProvider is None:
-                        bestFitProvider = provider
-                        bestFitProviderDetails = compare
-                    elif compare[1] < bestFitProviderDetails[1]:
-                        bestFitProvider = provider
-                        bestFitProviderDetails = compare
-            if found:
+
+                requests.append(bytes(view[offset + 2:offset + 2 + length]))
+                offset += length + 2
+
+        if offset:
+            del self.inbuf[:offset]
+
+        return requests
+
+    def flush(self):
+        '''
+        Moves answers handed over by the workers into the output buffer and
+        writes as much of it as the socket takes. Returns True once the
+        buffer is empty and every transfer has been sent.
+        '''
+
+        while True:
+            try:
+                data, messages = self.responses.get_nowait()
+            except queue.Empty:
                 break
 
-        if bestFitProvider is not None:
-            resp = bestFitProvider.getResponse(request, self.clientaddress)
-            if resp is not None:
-                for f in bestFitProvider.getFilters():
-                    resp = f.filter(request, resp)
+            if messages is None:
+                self.pending -= 1
+            else:
+                self.transfers.append(messages)
+            if data is not None:
+                self.outbuf += data
 
-                response = resp
-        else:
-            response.set_rcode(dns.rcode.NXDOMAIN)
+        # The next message of a transfer is only built once the client has
+        # taken the last, so a slow secondary holds up one message rather
+        # than the whole zone
+        if not self.outbuf and self.transfers:
+            self.pull()
+
+        if self.outbuf:
+            try:
+                sent = self.sock.send(self.outbuf)
+            except (BlockingIOError, InterruptedError):
+                return False
+
+            del self.outbuf[:sent]
+            self.lastActive = time.monotonic()
+
+        return not self.outbuf and not self.transfers
+
+    def pull(self):
+        '''
+        Adds the next message of the oldest transfer to the output buffer.
+        '''
 
-        if self.isUdp:
-            self.ndns.udpOut.put((response.to_wire(), self.clientaddress))
+        messages = self.transfers[0]
+        try:
+            data = next(messages, None)
+        except Exception as e:
+            logger.error('Failed to transfer to %s: %s' % (
+                self.clientaddress,
+                e
+            ))
+            # a transfer cut short can only be told apart by the connection
+            # closing
+            self.closing = True
+            data = None
+
+        if data is None:
+            self.transfers.popleft()
+            self.pending -= 1
         else:
-            data = response.to_wire()
-            self.ndns.tcpOut[self.clientaddress].put(
-                struct.pack('!H', len(data)) + data
-            )
+            self.outbuf += struct.pack('!H', len(data)) + data
+
+    def idle(self):
+        return self.pending == 0 and not self.outbuf
 
 
 class Ndns:
@@ -114,161 +330,1252 @@ class Ndns:
     classdocs
     '''
 
-    def __init__(self, host='::', port=53):
+    def __init__(self, host='::', port=53, workers=8, queueDepth=1024,
+                 overload=OVERLOAD_SERVFAIL, reusePort=False, udpBatch=64,
+                 tcpIdleTimeout=10, ednsPayload=1232,
+                 cacheSize=32 * 1024 * 1024):
         '''
         Constructor
         '''
 
+        if overload not in (
+                OVERLOAD_DROP, OVERLOAD_SERVFAIL, OVERLOAD_REFUSED):
+            raise ValueError('Unknown overload policy %s' % (overload, ))
+
         self.host = host
         self.port = port
+        self.overload = overload
+        self.reusePort = reusePort
 
-        self.tcp = socket.socket(socket.AF_INET6, socket.SOCK_STREAM)
-        self.udp = socket.socket(socket.AF_INET6, socket.SOCK_DGRAM)
-
-        try:
-            self.udp.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_V6ONLY, 0)
-            self.tcp.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_V6ONLY, 0)
-        except AttributeError:
-            pass
-
-        self.udp.setblocking(False)
-        self.tcp.setblocking(False)
+        self.tcp = None
+        self.udp = None
 
         self.clients = {}
-        self.tcpOut = {}
         self.udpOut = queue.Queue()
-        self.tcpIn = {}
+        self.udpRetry = None
+
+        # Largest UDP response we are willing to send
+        self.ednsPayload = max(512, ednsPayload)
+
+        # Queries are received whole whatever size responses are capped at
+        self.udpBatch = udpBatch
+        self.udpBuffer = bytearray(MAX_UDP_SIZE)
+        self.udpView = memoryview(self.udpBuffer)
+
+        self.tcpIdleTimeout = tcpIdleTimeout
+        self.tcpBuffer = bytearray(65535)
+        self.tcpView = memoryview(self.tcpBuffer)
+        self.nextSweep = 0
 
         self.running = True
 
+        self.selector = None
+        self.writable = collections.deque()
+        self.woken = False
+        self.wakeIn = None
+        self.wakeOut = None
+
+        self.cache = None
+        if cacheSize:
+            self.cache = cache.ResponseCache(cacheSize)
+
         self.providers = []
+        self.maxViews = 1024
+        self.routes = (nametrie.NameTrie(), [], {})
+
+        self.pool = RequestPool(self, workers, queueDepth)
 
     def registerProvider(self, provider):
         self.providers.append(provider)
+        self.rebuildRoutes()
+
+        # Providers that can change their data while serving tell us so
+        if hasattr(provider, 'addListener'):
+            provider.addListener(self.providerChanged)
+
+    def unregisterProvider(self, provider):
+        self.providers.remove(provider)
+        self.rebuildRoutes()
+
+        if hasattr(provider, 'removeListener'):
+            provider.removeListener(self.providerChanged)
+
+    def providerChanged(self, provider):
+        '''
+        Called by a provider whose data has changed, drops every cached
+        response since any of them may have come from it.
+        '''
+
+        if self.cache is not None:
+            self.cache.clear()
 
     def getProviders(self):
         return self.providers
 
-    def run(self):
+    def rebuildRoutes(self):
+        '''
+        Rebuilds the zone routing table from the registered providers, call
+        again if a provider's zones change after it is registered.
+
+        Zones are read once here with a clientaddress of None. A provider
+        that serves different zones to different clients opts into per
+        view tables by implementing getView(clientaddress), returning a
+        hashable view; a table is built and kept for each combination of
+        views seen. When several providers serve the same zone the first
+        registered wins.
+        '''
+
+        routes = nametrie.NameTrie()
+        viewProviders = []
+
+        for provider in self.providers:
+            if hasattr(provider, 'getView'):
+                viewProviders.append(provider)
+            else:
+                for zone in provider.getZones(None):
+                    routes.setdefault(zone, provider)
+
+        # replaced as one so request threads never see a partial table
+        self.routes = (routes, viewProviders, {})
+
+    def buildViewRoutes(self, clientaddress):
+        routes = nametrie.NameTrie()
+
+        for provider in self.providers:
+            if hasattr(provider, 'getView'):
+                zones = provider.getZones(clientaddress)
+            else:
+                zones = provider.getZones(None)
+
+            for zone in zones:
+                routes.setdefault(zone, provider)
+
+        return routes
+
+    def findProvider(self, name, clientaddress):
+        '''
+        Returns the provider serving the closest zone enclosing name, or
+        None.
+        '''
+
+        return self.route(nametrie.nameKey(name), clientaddress)[0]
+
+    def route(self, nameKey, clientaddress):
+        '''
+        Returns the provider serving the closest zone enclosing the name
+        with the given utils.nametrie key, or None, along with the client's
+        views.
+        '''
+
+        routes, viewProviders, viewRoutes = self.routes
+
+        view = None
+        if viewProviders:
+            view = tuple(p.getView(clientaddress) for p in viewProviders)
+
+            routes = viewRoutes.get(view)
+            if routes is None:
+                routes = self.buildViewRoutes(clientaddress)
+                if len(viewRoutes) < self.maxViews:
+                    viewRoutes[view] = routes
+
+        match = routes.longestMatchKey(nameKey)
+        if match is None:
+            return None, view
+
+        return match[1], view
+
+    def bind(self):
+        '''
+        Creates, binds and listens on the UDP and TCP sockets. Sockets are
+        created here rather than in the constructor so that forked workers
+        each get their own.
+        '''
 
         logger.info('Bind and Listen')
 
-        self.udp.bind((self.host, self.port))
+        tcp = socket.socket(socket.AF_INET6, socket.SOCK_STREAM)
+        udp = socket.socket(socket.AF_INET6, socket.SOCK_DGRAM)
 
-        self.tcp.bind((self.host, self.port))
-        self.tcp.listen(5)
+        try:
+            udp.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_V6ONLY, 0)
+            tcp.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_V6ONLY, 0)
+        except AttributeError:
+            pass
 
-        logger.info('Starting Main Loop')
+        # Connections closed on idle leave the port in TIME_WAIT, which
+        # would otherwise stop a restarted server binding it
+        tcp.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
 
-        inputs = {}
-        outputs = {}
+        if self.reusePort:
+            udp.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            tcp.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
 
-        while self.running:
-            ins = list(inputs.values()) + [self.udp, self.tcp]
-            outs = list(outputs.values()) + [self.udp, self.tcp]
-            try:
-                (rlist, wlist, xlist) = select.select(ins, outs, [])
+        udp.setblocking(False)
+        tcp.setblocking(False)
 
-                del xlist
+        try:
+            udp.bind((self.host, self.port))
 
-                for s in rlist:
-                    if s == self.udp:
-                        # Max UDP DNS packet size
-                        data, clientaddress = s.recvfrom(512)
+            tcp.bind((self.host, self.port))
+            tcp.listen(5)
+        except OSError:
+            # don't hold on to half of the port
+            udp.close()
+            tcp.close()
+            raise
 
-                        if not data:
-                            continue
+        self.udp = udp
+        self.tcp = tcp
 
-                        handler = DnsRequestHandler(
-                            self,
-                            data,
-                            s == self.udp,
-                            clientaddress
+    def answer(self, data, isUdp, clientaddress):
+        '''
+        Answers a wire format query, returning the wire format messages of
+        the response. Only zone transfers take more than one.
+        '''
+
+        if wire.questionType(data) in TRANSFER_TYPES:
+            return self.transfer(data, isUdp, clientaddress)
+
+        return (self.handleRequest(data, isUdp, clientaddress), )
+
+    def answerFirst(self, data, isUdp, clientaddress):
+        '''
+        Builds the first message of the response to a wire format query.
+        Returns it and an iterator over the rest for a transfer, which the
+        connection pulls from as the client takes them, or None.
+        '''
+
+        try:
+            messages = iter(self.answer(data, isUdp, clientaddress))
+            first = next(messages)
+
+            # looking one message ahead tells single answers apart
+            second = next(messages, None)
+        except Exception as e:
+            logger.error('Failed to answer %s: %s' % (clientaddress, e))
+            return self.errorResponse(data, dns.rcode.SERVFAIL), None
+
+        if second is None:
+            return first, None
+
+        return first, itertools.chain((second, ), messages)
+
+    def transfer(self, data, isUdp, clientaddress):
+        '''
+        Answers an AXFR or IXFR from the provider serving the zone, if it
+        implements getTransfer(request, isUdp, clientaddress) returning the
+        messages of the transfer, or None to refuse it.
+        '''
+
+        request = dns.message.from_wire(data)
+        question = request.question[0]
+
+        if isUdp and question.rdtype == dns.rdatatype.AXFR:
+            # http://www.ietf.org/rfc/rfc5936.txt
+            # 4.2.
+            return (self.errorResponse(data, dns.rcode.FORMERR), )
+
+        provider = self.findProvider(question.name, clientaddress)
+
+        messages = None
+        if provider is not None and hasattr(provider, 'getTransfer'):
+            messages = provider.getTransfer(request, isUdp, clientaddress)
+
+        if messages is None:
+            logger.info('Refused transfer of %s to %s' % (
+                question.name,
+                clientaddress
+            ))
+            return (self.errorResponse(data, dns.rcode.REFUSED), )
+
+        logger.info('Transferring %s to %s' % (question.name, clientaddress))
+        return messages
+
+    def notify(self, request, response, clientaddress):
+        '''
+        Passes a NOTIFY to the provider serving the zone, if it implements
+        notify(request, clientaddress) returning whether it was accepted.
+        '''
+
+        # http://www.ietf.org/rfc/rfc1996.txt
+        # 3.7.
+        provider = self.findProvider(request.question[0].name, clientaddress)
+        if provider is None or not hasattr(provider, 'notify') \
+                or not provider.notify(request, clientaddress):
+            logger.info('Refused NOTIFY of %s from %s' % (
+                request.question[0].name,
+                clientaddress
+            ))
+            response.set_rcode(dns.rcode.REFUSED)
+
+        return response.to_wire()
+
+    def update(self, request, response, clientaddress):
+        '''
+        Passes an UPDATE to the provider serving the zone, if it implements
+        update(request, clientaddress) returning the rcode to answer with.
+        '''
+
+        # http://www.ietf.org/rfc/rfc2136.txt
+        # 3.1.
+        if len(request.question) != 1 \
+                or request.question[0].rdtype != dns.rdatatype.SOA:
+            response.set_rcode(dns.rcode.FORMERR)
+            return response.to_wire()
+
+        zone = request.question[0].name
+        provider = self.findProvider(zone, clientaddress)
+        if provider is None:
+            rcode = dns.rcode.NOTAUTH
+        elif not hasattr(provider, 'update'):
+            rcode = dns.rcode.NOTIMP
+        else:
+            rcode = provider.update(request, clientaddress)
+
+        if rcode != dns.rcode.NOERROR:
+            logger.info('Refused UPDATE of %s from %s with %s' % (
+                zone,
+                clientaddress,
+                dns.rcode.to_text(rcode)
+            ))
+
+        response.set_rcode(rcode)
+        return response.to_wire()
+
+    def handleRequest(self, data, isUdp, clientaddress):
+        '''
+        Answers a single wire format query and returns the wire format
+        response. Safe to call from any thread.
+        '''
+
+        # Plain queries are routed and looked up in the cache straight from
+        # the wire, only misses and anything unusual get fully parsed.
+        query = wire.parseQuery(data)
+
+        key = None
+        if query is not None:
+            # Taken before routing, an answer looked up while a provider
+            # changes must not be cached past the change
+            generation = self.cache.generation \
+                if self.cache is not None else None
+            bestFitProvider, view = self.route(query.nameKey, clientaddress)
+
+            if self.cache is not None and bestFitProvider is not None \
+                    and getattr(bestFitProvider, 'cacheable', True):
+                key = (
+                    query.qname,
+                    query.qtype,
+                    query.qclass,
+                    query.edns,
+                    self.maxResponseSize(query.edns, query.payload, isUdp),
+                    query.do,
+                    view
+                )
+
+                cached = self.cache.get(key)
+                if cached is not None:
+                    return wire.patchResponse(
+                        cached,
+                        data,
+                        query.questionEnd
+                    )
+
+            if query.edns <= 0 and bestFitProvider is not None \
+                    and hasattr(bestFitProvider, 'getWireResponse') \
+                    and not self.filtered(bestFitProvider, query.nameKey):
+                result = self.wireResponse(
+                    bestFitProvider,
+                    query,
+                    data,
+                    isUdp,
+                    clientaddress
+                )
+                if result is not None:
+                    if key is not None:
+                        self.cache.put(
+                            key,
+                            result[0],
+                            result[1],
+                            generation
                         )
+                    return result[0]
+
+        request = dns.message.from_wire(data)
+        response = dns.message.make_response(request)
+
+        if request.edns > 0:
+            # http://www.ietf.org/rfc/rfc6891.txt
+            # 6.1.3.
+            response.use_edns(0, 0, self.ednsPayload)
+            response.set_rcode(dns.rcode.BADVERS)
+            return response.to_wire()
+
+        if request.opcode() == dns.opcode.NOTIFY:
+            return self.notify(request, response, clientaddress)
+
+        if request.opcode() == dns.opcode.UPDATE:
+            return self.update(request, response, clientaddress)
+
+        if query is None:
+            bestFitProvider, view = self.route(
+                nametrie.nameKey(request.question[0].name),
+                clientaddress
+            )
+
+        if bestFitProvider is not None:
+            resp = bestFitProvider.getResponse(request, clientaddress)
+            if resp is not None:
+                for f in bestFitProvider.getFilters():
+                    resp = f.filter(request, resp)
+
+                response = resp
+        else:
+            response.set_rcode(dns.rcode.NXDOMAIN)
+
+        result = self.renderResponse(request, response, isUdp)
+
+        if key is not None and response.rcode() in (
+                dns.rcode.NOERROR, dns.rcode.NXDOMAIN):
+            self.cache.put(
+                key,
+                result,
+                responseTtl(response),
+                generation
+            )
+
+        return result
+
+    def filtered(self, provider, nameKey):
+        '''
+        Whether any of a provider's filters may change the answer for the
+        name with the given utils.nametrie key, which must then come from
+        the full path. Filters without appliesTo change every answer.
+        '''
+
+        for f in provider.getFilters():
+            if not hasattr(f, 'appliesTo') or f.appliesTo(nameKey):
+                return True
+
+        return False
+
+    def wireResponse(self, provider, query, data, isUdp, clientaddress):
+        '''
+        Asks a provider for a prebuilt wire format answer, returning it and
+        its TTL. Returns None if the provider has none, or if it needs
+        truncating, leaving the full path to handle it.
+        '''
+
+        answer = provider.getWireResponse(query, data, clientaddress)
+        if answer is None:
+            return None
+
+        result, ttl = answer
+        if query.edns == 0:
+            result = wire.addOpt(result, self.ednsPayload, query.do)
+
+        if len(result) > self.maxResponseSize(
+                query.edns,
+                query.payload,
+                isUdp):
+            return None
+
+        return result, ttl
+
+    def maxResponseSize(self, edns, payload, isUdp):
+        '''
+        UDP answers are limited to 512 bytes, or to the client's advertised
+        EDNS buffer size capped at ednsPayload.
+        '''
+
+        if not isUdp:
+            return 65535
+        elif edns >= 0:
+            return max(512, min(payload, self.ednsPayload))
+        else:
+            return 512
+
+    def renderResponse(self, request, response, isUdp):
+        '''
+        Converts a response to wire format, sized for the client. Anything
+        larger than the client takes loses its additional section, and
+        failing that is truncated to the question with TC set so the client
+        retries over TCP.
+        '''
+
+        rcode = response.rcode()
+
+        if request.edns >= 0:
+            response.use_edns(
+                0,
+                request.ednsflags & dns.flags.DO,
+                self.ednsPayload
+            )
+            response.set_rcode(rcode)
+        else:
+            response.use_edns(False)
+
+        maxSize = self.maxResponseSize(request.edns, request.payload, isUdp)
+
+        try:
+            return response.to_wire(max_size=maxSize)
+        except dns.exception.TooBig:
+            pass
+
+        response.additional = []
+        try:
+            return response.to_wire(max_size=maxSize)
+        except dns.exception.TooBig:
+            pass
+
+        # http://www.ietf.org/rfc/rfc2181.txt
+        # 9.
+        response.answer = []
+        response.authority = []
+        response.flags |= dns.flags.TC
+
+        return response.to_wire(max_size=maxSize)
+
+    def errorResponse(self, request, rcode):
+        '''
+        Returns a wire format answer carrying only rcode, or None if the
+        request can't be parsed.
+        '''
+
+        try:
+            request = dns.message.from_wire(request, question_only=True)
+        except Exception:
+            return None
+
+        response = dns.message.make_response(request)
+        response.set_rcode(rcode)
+
+        return response.to_wire()
+
+    def overloadResponse(self, request):
+        '''
+        Returns the wire format answer for a request that could not be
+        queued, or None if it should be dropped.
+        '''
+
+        if self.overload == OVERLOAD_DROP:
+            return None
+        elif self.overload == OVERLOAD_REFUSED:
+            return self.errorResponse(request, dns.rcode.REFUSED)
+        else:
+            return self.errorResponse(request, dns.rcode.SERVFAIL)
+
+    def submit(self, request, isUdp, clientaddress):
+        '''
+        Hands a request to the workers. Returns False if it was rejected
+        without an answer being queued.
+        '''
+
+        if self.pool.submit(request, isUdp, clientaddress):
+            return True
+
+        logger.debug('Request queue full, rejecting %s' % (clientaddress, ))
+
+        data = self.overloadResponse(request)
+        if data is None:
+            return False
+
+        self.queueResponse(data, isUdp, clientaddress)
+        return True
+
+    def queueResponse(self, data, isUdp, clientaddress, messages=None):
+        '''
+        Hands a wire format response to the main loop for sending, data is
+        None when a request could not be answered. messages iterates over
+        the rest of a response made of several.
+        '''
+
+        if isUdp:
+            if data is None:
+                return
+            self.udpOut.put((data, clientaddress))
+        else:
+            conn = self.clients.get(clientaddress)
+            if conn is None:
+                return
+
+            if data is not None:
+                data = struct.pack('!H', len(data)) + data
+            conn.responses.put((data, messages))
+
+        self.writable.append(None if isUdp else clientaddress)
+        self.wake()
+
+    def wake(self):
+        '''
+        Interrupts the select in the main loop, safe to call from any thread.
+        '''
+
+        if not self.woken and self.wakeOut is not None:
+            self.woken = True
+            try:
+                self.wakeOut.send(b'\0')
+            except OSError:
+                pass
+
+    def stop(self):
+        self.running = False
+        self.wake()
+
+    def setWriteInterest(self, s, enable):
+        key = self.selector.get_key(s)
+        if enable:
+            wanted = key.events | selectors.EVENT_WRITE
+        else:
+            wanted = key.events & ~selectors.EVENT_WRITE
+
+        if wanted != key.events:
+            self.selector.modify(s, wanted, key.data)
+
+    def updateWriteInterest(self):
+        '''
+        Registers write interest for every socket a response was queued for
+        since the last pass. Sockets are only watched for writability while
+        they have something to send, otherwise select would always return.
+        '''
 
-                        handler.start()
+        self.woken = False
 
-                        logger.info('Received UDP from %s' % (clientaddress, ))
+        while True:
+            try:
+                self.wakeIn.recv(4096)
+            except OSError:
+                break
+
+        while self.writable:
+            clientaddress = self.writable.popleft()
+            if clientaddress is None:
+                self.setWriteInterest(self.udp, True)
+            elif clientaddress in self.clients:
+                self.updateClient(self.clients[clientaddress])
+
+    def updateClient(self, conn):
+        '''
+        Watches a client connection for reads until the client closes its
+        side, and for writes while it has output waiting. A connection with
+        neither is left out of the selector until an answer is queued.
+        '''
+
+        events = 0
+        if not conn.closing:
+            events |= selectors.EVENT_READ
+        if conn.outbuf or conn.transfers or not conn.responses.empty():
+            events |= selectors.EVENT_WRITE
+
+        try:
+            key = self.selector.get_key(conn.sock)
+        except KeyError:
+            key = None
+
+        if key is None:
+            if events:
+                self.selector.register(conn.sock, events, conn.clientaddress)
+        elif not events:
+            self.selector.unregister(conn.sock)
+        elif events != key.events:
+            self.selector.modify(conn.sock, events, conn.clientaddress)
+
+    def closeClient(self, clientaddress):
+        logger.debug('Closing connection %s' % (clientaddress, ))
+
+        conn = self.clients.pop(clientaddress)
+        try:
+            self.selector.unregister(conn.sock)
+        except KeyError:
+            pass
+        conn.sock.close()
+
+    def sweepClients(self):
+        '''
+        Closes connections that have had nothing to do for tcpIdleTimeout.
+        '''
+
+        now = time.monotonic()
+        if now < self.nextSweep:
+            return
+        self.nextSweep = now + 1
+
+        for clientaddress, conn in list(self.clients.items()):
+            if conn.idle() and now - conn.lastActive > self.tcpIdleTimeout:
+                self.closeClient(clientaddress)
+
+    def run(self):
+        self.wakeIn, self.wakeOut = socket.socketpair()
+        self.wakeIn.setblocking(False)
+        self.wakeOut.setblocking(False)
+
+        self.bind()
+
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.udp, selectors.EVENT_READ)
+        self.selector.register(self.tcp, selectors.EVENT_READ)
+        self.selector.register(self.wakeIn, selectors.EVENT_READ)
+
+        self.pool.start()
+
+        logger.info('Starting Main Loop')
+
+        while self.running:
+            try:
+                timeout = 1 if self.clients else None
+
+                for key, events in self.selector.select(timeout):
+                    s = key.fileobj
+
+                    if s == self.wakeIn:
+                        self.updateWriteInterest()
+
+                    elif s == self.udp:
+                        if events & selectors.EVENT_READ:
+                            self.readUdp()
+                        if events & selectors.EVENT_WRITE:
+                            self.writeUdp()
 
                     elif s == self.tcp:
                         conn, clientaddress = s.accept()
-                        inputs[clientaddress] = conn
-                        outputs[clientaddress] = conn
-                        self.tcpOut[clientaddress] = queue.Queue()
-                        self.tcpIn[clientaddress] = None
+                        conn.setblocking(False)
+
+                        self.clients[clientaddress] = TcpConnection(
+                            conn,
+                            clientaddress
+                        )
+                        self.selector.register(
+                            conn,
+                            selectors.EVENT_READ,
+                            clientaddress
+                        )
 
                         logger.info('Accepted TCP from %s' % (clientaddress, ))
 
                     else:
-                        # http://www.ietf.org/rfc/rfc1035.txt
-                        # 4.2.2.
-
-                        data = s.recv(1024)
-                        caddr = s.getpeername()
-
-                        if not data:
-                            logger.debug(
-                                'Closing connection %s' % (s.getpeername(), )
-                            )
-
-                            del inputs[caddr]
-                            del outputs[caddr]
-                            del self.tcpOut[caddr]
-                            del self.tcpIn[caddr]
-                            s.close()
-                        else:
-                            if self.tcpIn[caddr] is None:
-                                length = struct.unpack('!H', data[:2])[0]
-                                data = data[2:]
-
-                                self.tcpIn[caddr] = {
-                                    'length': length,
-                                    'buff': b''
-                                }
-
-                            self.tcpIn[caddr]['buff'] += data
-
-                            if len(self.tcpIn[caddr]['buff']) == \
-                                    self.tcpIn[caddr]['length']:
-
-                                logger.debug(
-                                    'Got data from %s' % (s.getpeername(), )
-                                )
-
-                                handler = DnsRequestHandler(
-                                    self,
-                                    data,
-                                    False,
-                                    s.getpeername()
-                                )
-
-                                handler.start()
-
-                for s in wlist:
-                    if s == self.udp:
-                        if not self.udpOut.empty():
-                            s.sendto(*self.udpOut.get())
-                    elif s == self.tcp:
-                        pass
-                    else:
-                        clientaddress = s.getpeername()
-                        if clientaddress in self.tcpOut:
-                            if not self.tcpOut[clientaddress].empty():
-                                s.send(self.tcpOut[clientaddress].get())
-
-                                del inputs[clientaddress]
-                                del outputs[clientaddress]
-                                del self.tcpOut[clientaddress]
-                                s.close()
+                        conn = self.clients[key.data]
+                        try:
+                            if events & selectors.EVENT_READ:
+                                self.readTcp(conn)
+                            if events & selectors.EVENT_WRITE \
+                                    and key.data in self.clients:
+                                self.writeTcp(conn)
+                        except OSError:
+                            self.closeClient(key.data)
+
+                if self.clients:
+                    self.sweepClients()
 
             except KeyboardInterrupt:
                 self.running = False
+            except Exception:
+                # one bad event must not take the server down, only stop()
+                # or an interrupt end the loop
+                logger.exception('Error in the main loop')
+
+        self.pool.stop()
+
+        for clientaddress in list(self.clients.keys()):
+            self.closeClient(clientaddress)
+
+        self.selector.close()
+
+        self.tcp.close()
+        self.udp.close()
+        self.wakeIn.close()
+        self.wakeOut.close()
+
+    def readUdp(self):
+        '''
+        Drains up to udpBatch datagrams from the socket for one readiness
+        event, reading each into the same preallocated buffer.
+        '''
+
+        for i in range(self.udpBatch):
+            try:
+                size, ancdata, flags, clientaddress = self.udp.recvmsg_into(
+                    [self.udpBuffer]
+                )
+            except (BlockingIOError, InterruptedError):
+                break
+
+            if not size:
+                continue
+
+            if flags & socket.MSG_TRUNC:
+                logger.debug('Dropped oversized UDP from %s' % (
+                    clientaddress,
+                ))
+                continue
+
+            self.submit(bytes(self.udpView[:size]), True, clientaddress)
+
+            logger.info('Received UDP from %s' % (clientaddress, ))
+
+    def writeUdp(self):
+        '''
+        Sends every queued response, stopping early only if the socket
+        buffer fills up.
+        '''
+
+        while True:
+            if self.udpRetry is not None:
+                item = self.udpRetry
+                self.udpRetry = None
+            else:
+                try:
+                    item = self.udpOut.get_nowait()
+                except queue.Empty:
+                    break
+
+            try:
+                self.udp.sendto(*item)
+            except (BlockingIOError, InterruptedError):
+                self.udpRetry = item
+                return
+
+        self.setWriteInterest(self.udp, False)
+
+    def readTcp(self, conn):
+        # http://www.ietf.org/rfc/rfc1035.txt
+        # 4.2.2.
+        # http://www.ietf.org/rfc/rfc7766.txt
+        # 6.2.1.
+
+        try:
+            size = conn.sock.recv_into(self.tcpBuffer)
+        except (BlockingIOError, InterruptedError):
+            return
+
+        if not size:
+            # the client is done sending, finish answering what it asked
+            conn.closing = True
+            if conn.idle():
+                self.closeClient(conn.clientaddress)
+            else:
+                self.updateClient(conn)
+            return
+
+        for request in conn.feed(self.tcpView[:size]):
+            logger.debug('Got data from %s' % (conn.clientaddress, ))
+
+            conn.pending += 1
+            if not self.submit(request, False, conn.clientaddress):
+                conn.pending -= 1
+
+    def writeTcp(self, conn):
+        if not conn.flush():
+            return
+
+        if conn.closing and conn.idle():
+            self.closeClient(conn.clientaddress)
+        else:
+            self.updateClient(conn)
+
+
+class DnsDatagramProtocol(asyncio.DatagramProtocol):
+
+    def __init__(self, ndns):
+        self.ndns = ndns
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, clientaddress):
+        if not self.ndns.dispatch(
+                data,
+                True,
+                clientaddress,
+                self.sendResponse):
+            logger.debug('Request queue full, rejecting %s' % (
+                clientaddress,
+            ))
+
+            data = self.ndns.overloadResponse(data)
+            if data is not None:
+                self.sendResponse(data, clientaddress)
+
+    def sendResponse(self, data, clientaddress, messages=None):
+        if data is not None:
+            self.transport.sendto(data, clientaddress)
+
+
+class DnsStreamProtocol(asyncio.Protocol):
+
+    def __init__(self, ndns):
+        self.ndns = ndns
+        self.transport = None
+        self.clientaddress = None
+        self.buff = bytearray()
+        self.pending = 0
+        self.closing = False
+
+        # the rest of the messages of each transfer being sent, oldest first
+        self.transfers = collections.deque()
+        self.paused = False
+
+        # the queries being answered, cancelled if the client goes away
+        self.futures = set()
+        self.timer = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.clientaddress = transport.get_extra_info('peername')
+
+        logger.info('Accepted TCP from %s' % (self.clientaddress, ))
+        self.touch()
+
+    def touch(self):
+        '''
+        Restarts the idle timer, the connection is closed once it has had
+        nothing to do for tcpIdleTimeout.
+        '''
+
+        if self.timer is not None:
+            self.timer.cancel()
+
+        self.timer = self.ndns.loop.call_later(
+            self.ndns.tcpIdleTimeout,
+            self.expire
+        )
+
+    def expire(self):
+        self.timer = None
+
+        if self.pending == 0 and \
+                self.transport.get_write_buffer_size() == 0:
+            logger.debug('Closing idle connection %s' % (
+                self.clientaddress,
+            ))
+            self.transport.close()
+        else:
+            self.touch()
+
+    def data_received(self, data):
+        # http://www.ietf.org/rfc/rfc1035.txt
+        # 4.2.2.
+        self.buff += data
+        self.touch()
+
+        while len(self.buff) >= 2:
+            length = struct.unpack_from('!H', self.buff)[0]
+            if len(self.buff) < length + 2:
+                break
+
+            request = bytes(self.buff[2:length + 2])
+            del self.buff[:length + 2]
+
+            self.pending += 1
+            future = self.ndns.dispatch(
+                request,
+                False,
+                self.clientaddress,
+                self.sendResponse
+            )
+            if future is not None:
+                self.futures.add(future)
+                future.add_done_callback(self.futures.discard)
+                continue
+
+            logger.debug('Request queue full, rejecting %s' % (
+                self.clientaddress,
+            ))
+
+            data = self.ndns.overloadResponse(request)
+            if data is None:
+                self.pending -= 1
+                self.transport.close()
+                break
+
+            self.sendResponse(data, self.clientaddress)
+
+    def eof_received(self):
+        # keep the transport open until every query has been answered
+        self.closing = True
+        if self.pending == 0:
+            self.transport.close()
+        return True
+
+    def sendResponse(self, data, clientaddress, messages=None):
+        if self.transport.is_closing():
+            # the client is gone, what it had pending went with it
+            return
+
+        if messages is None:
+            self.pending -= 1
+
+        if data is not None:
+            self.transport.write(struct.pack('!H', len(data)) + data)
+            self.touch()
+
+        if messages is not None:
+            self.transfers.append(messages)
+            self.pull()
+
+        if self.closing and self.pending == 0:
+            self.transport.close()
+
+    def pull(self):
+        '''
+        Writes the messages of waiting transfers until the transport's
+        buffer fills, building each only as the client takes the last.
+        '''
+
+        while self.transfers and not self.paused \
+                and not self.transport.is_closing():
+            try:
+                data = next(self.transfers[0], None)
             except Exception as e:
-                self.running = False
+                logger.error('Failed to transfer to %s: %s' % (
+                    self.clientaddress,
+                    e
+                ))
+                self.transport.close()
+                return
+
+            if data is None:
+                self.transfers.popleft()
+                self.pending -= 1
+            else:
+                self.transport.write(struct.pack('!H', len(data)) + data)
+                self.touch()
+
+    def pause_writing(self):
+        self.paused = True
+
+    def resume_writing(self):
+        self.paused = False
+        self.pull()
+
+        if self.closing and self.pending == 0:
+            self.transport.close()
+
+    def connection_lost(self, exc):
+        logger.debug('Closing connection %s' % (self.clientaddress, ))
+
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+
+        # queries not yet started are dropped, and transfers under way
+        # are built no further
+        for future in list(self.futures):
+            future.cancel()
+        self.futures.clear()
+        self.transfers.clear()
+        self.pending = 0
+
+
+class AsyncNdns(Ndns):
+    '''
+    Ndns served from an asyncio event loop. Sockets are handled by the loop
+    and provider calls are made on a fixed size thread pool, at most
+    maxPending queries are in flight at once.
+    '''
+
+    def __init__(self, host='::', port=53, workers=8, maxPending=1024,
+                 **kwargs):
+        super().__init__(host, port, workers, maxPending, **kwargs)
+
+        self.workers = workers
+        self.maxPending = maxPending
+        self.pending = 0
+
+        self.executor = None
+        self.loop = None
+        self.stopped = None
+
+    def dispatch(self, request, isUdp, clientaddress, callback):
+        '''
+        Queues a request on the executor, callback is invoked on the event
+        loop with the wire format response. Returns the asyncio future of
+        the answer, or None if the request was rejected because too many
+        are already in flight.
+        '''
+
+        if self.pending >= self.maxPending:
+            return None
+
+        self.pending += 1
+
+        future = self.loop.run_in_executor(
+            self.executor,
+            self.answerFirst,
+            request,
+            isUdp,
+            clientaddress
+        )
+        future.add_done_callback(
+            lambda f: self.complete(f, request, clientaddress, callback)
+        )
+
+        return future
+
+    def complete(self, future, request, clientaddress, callback):
+        self.pending -= 1
+
+        if future.cancelled():
+            return
+
+        e = future.exception()
+        if e is not None:
+            logger.error('Failed to answer %s: %s' % (clientaddress, e))
+            callback(
+                self.errorResponse(request, dns.rcode.SERVFAIL),
+                clientaddress
+            )
+            return
+
+        data, messages = future.result()
+        callback(data, clientaddress, messages)
+
+    async def serve(self):
+        self.loop = asyncio.get_running_loop()
+        self.stopped = asyncio.Event()
+
+        self.bind()
+
+        udpTransport, _ = await self.loop.create_datagram_endpoint(
+            lambda: DnsDatagramProtocol(self),
+            sock=self.udp
+        )
+        tcpServer = await self.loop.create_server(
+            lambda: DnsStreamProtocol(self),
+            sock=self.tcp
+        )
+
+        logger.info('Starting Event Loop')
+
+        try:
+            await self.stopped.wait()
+        finally:
+            udpTransport.close()
+            tcpServer.close()
+            await tcpServer.wait_closed()
+
+    def stop(self):
+        self.running = False
+
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.stopped.set)
+
+    def run(self):
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.workers,
+            thread_name_prefix='ndns'
+        )
+
+        try:
+            asyncio.run(self.serve())
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.running = False
+            self.executor.shutdown(wait=False)
 
         self.tcp.close()
         self.udp.close()
 
+
+class WorkerSupervisor:
+    '''
+    Runs an Ndns server in several forked worker processes that share the
+    port through SO_REUSEPORT, leaving the kernel to spread queries between
+    them. Providers should be registered before run() so their data is
+    loaded once and shared copy-on-write with the workers. Workers that
+    exit while the supervisor is running are restarted.
+    '''
+
+    def __init__(self, ndns, workers, restartDelay=1.0):
+        self.ndns = ndns
+        self.workers = workers
+        self.restartDelay = restartDelay
+
+        self.children = {}
+        self.running = True
+
+    def spawn(self):
+        pid = os.fork()
+
+        if pid == 0:
+            # The supervisor's handlers and children belong to the parent, a
+            # worker only stops its own server, on Ctrl-C to the process
+            # group too
+            self.children = {}
+            self.running = False
+
+            status = 0
+            try:
+                for signum in (signal.SIGTERM, signal.SIGINT):
+                    signal.signal(signum, lambda *args: self.ndns.stop())
+                # restart what providers run alongside the server, threads
+                # don't survive the fork
+                fork.afterFork()
+                self.ndns.run()
+            except BaseException as e:
+                logger.error('Worker %d failed: %s' % (os.getpid(), e))
+                status = 1
+            finally:
+                os._exit(status)
+
+        logger.info('Started worker %d' % (pid, ))
+        self.children[pid] = time.monotonic()
+
+    def stop(self):
+        self.running = False
+
+        for pid in list(self.children.keys()):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def run(self):
+        self.ndns.reusePort = True
+
+        # Move everything loaded so far out of the collector's reach, so
+        # collections in the workers don't write to (and so copy) the pages
+        # holding provider data.
+        gc.collect()
+        gc.freeze()
+
+        previous = {}
+        if threading.current_thread() is threading.main_thread():
+            for signum in (signal.SIGTERM, signal.SIGINT):
+                previous[signum] = signal.signal(
+                    signum,
+                    lambda *args: self.stop()
+                )
+
+        try:
+            for i in range(self.workers):
+                self.spawn()
+
+            while self.children:
+                try:
+                    pid, status = os.wait()
+                except ChildProcessError:
+                    break
+
+                self.children.pop(pid, None)
+
+                if self.running:
+                    logger.warning('Worker %d exited with status %d' % (
+                        pid,
+                        status,
+                    ))
+                    time.sleep(self.restartDelay)
+
+                    if self.running:
+                        self.spawn()
+        finally:
+            for signum, handler in previous.items():
+                signal.signal(signum, handler)
+
+            gc.unfreeze()
+
+
 if __name__ == "__main__":
 
     logFormat = logging.Formatter(
@@ -284,11 +1591,118 @@ if __name__ == "__main__":
 
     from providers import file
     from providers import reverseipv6
+    from providers import secondary
+    from providers import sqlite
     from filters import delegation
     import os.path
-    import sys
 
-    s = Ndns('::', int(sys.argv[1]))
+    parser = argparse.ArgumentParser(description='ndns')
+    parser.add_argument('port', type=int, nargs='?', default=53)
+    parser.add_argument(
+        '--asyncio',
+        action='store_true',
+        help='serve from an asyncio event loop instead of select'
+    )
+    parser.add_argument(
+        '--threads',
+        type=int,
+        default=8,
+        help='number of threads answering queries'
+    )
+    parser.add_argument(
+        '--queue-depth',
+        type=int,
+        default=1024,
+        help='queries waiting for a thread before the server is overloaded'
+    )
+    parser.add_argument(
+        '--overload',
+        choices=[OVERLOAD_DROP, OVERLOAD_SERVFAIL, OVERLOAD_REFUSED],
+        default=OVERLOAD_SERVFAIL,
+        help='answer given to queries received while overloaded'
+    )
+    parser.add_argument(
+        '--edns-payload',
+        type=int,
+        default=1232,
+        help='largest UDP response sent to EDNS clients'
+    )
+    parser.add_argument(
+        '--cache-size',
+        type=int,
+        default=32,
+        help='MiB of responses to cache, 0 to disable'
+    )
+    parser.add_argument(
+        '--minimal-any',
+        action='store_true',
+        help='answer ANY queries with a single record set (RFC 8482)'
+    )
+    parser.add_argument(
+        '--watch',
+        action='store_true',
+        help='reload zone files when they change'
+    )
+    parser.add_argument(
+        '--allow-transfer',
+        action='append',
+        default=[],
+        metavar='NETWORK',
+        help='network allowed to AXFR and IXFR the zones, may be repeated'
+    )
+    parser.add_argument(
+        '--allow-update',
+        action='append',
+        default=[],
+        metavar='NETWORK',
+        help='network allowed to send dynamic updates to the zone files, '
+             'may be repeated; updates are journaled beside each zone file'
+    )
+    parser.add_argument(
+        '--secondary',
+        action='append',
+        default=[],
+        metavar='ZONE@PRIMARY[#PORT]',
+        help='zone to transfer from a primary and keep current, may be '
+             'repeated'
+    )
+    parser.add_argument(
+        '--sqlite',
+        metavar='PATH',
+        help='also serve the zones in an SQLite database'
+    )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=1,
+        help='number of server processes sharing the port'
+    )
+    args = parser.parse_args()
+
+    if args.allow_update and args.workers > 1:
+        # each worker would hold its own copy of the updated zones
+        parser.error('--allow-update needs a single worker')
+
+    if args.asyncio:
+        s = AsyncNdns(
+            '::',
+            args.port,
+            args.threads,
+            args.queue_depth,
+            overload=args.overload,
+            ednsPayload=args.edns_payload,
+            cacheSize=args.cache_size * 1024 * 1024
+        )
+    else:
+        s = Ndns(
+            '::',
+            args.port,
+            args.threads,
+            args.queue_depth,
+            overload=args.overload,
+            ednsPayload=args.edns_payload,
+            cacheSize=args.cache_size * 1024 * 1024
+        )
     path = os.path.join(
         os.path.dirname(__file__),
         'providers' + os.sep + 'example.txt'
@@ -331,6 +1745,32 @@ if __name__ == "__main__":
         v6revLookup
     )
 
-    s.registerProvider(file.ZoneFile(path, 'example.'))
-
-    s.run()
+    # zone files are parsed side by side in worker processes
+    zones = file.loadZoneFiles(
+        [(path, 'example.')],
+        minimalAny=args.minimal_any,
+        watch=args.watch,
+        allowTransfer=args.allow_transfer,
+        allowUpdate=args.allow_update
+    )
+    for zone in zones:
+        s.registerProvider(zone)
+
+    for spec in args.secondary:
+        zone, primary = spec.split('@', 1)
+        primary, port = (primary.split('#', 1) + ['53'])[:2]
+        s.registerProvider(secondary.SecondaryZone(
+            zone,
+            primary,
+            int(port),
+            minimalAny=args.minimal_any,
+            allowTransfer=args.allow_transfer
+        ))
+
+    if args.sqlite:
+        s.registerProvider(sqlite.SqliteZones(args.sqlite))
+
+    if args.workers > 1:
+        WorkerSupervisor(s, args.workers).run()
+    else:
+        s.run()
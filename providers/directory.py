@@ -0,0 +1,309 @@
+"""
+Copyright (c) 2012, Nicholas Steicke
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this
+   list of conditions and the following disclaimer.
+2. Redistributions in binary form must reproduce the above copyright notice,
+   this list of conditions and the following disclaimer in the documentation
+   and/or other materials provided with the distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+The views and conclusions contained in the software and documentation are those
+of the authors and should not be interpreted as representing official policies,
+either expressed or implied, of the project author/s.
+"""
+
+import collections
+import concurrent.futures
+import logging
+import os
+import os.path
+import threading
+import time
+
+import dns.exception
+import dns.message
+import dns.name
+import dns.rcode
+
+from providers.file import ZoneFile
+from utils import nametrie
+
+"""
+Serves every zone file in a directory, each named after its zone with a
+suffix, for example example.com.zone. Only the file names are read at
+start up, zones are loaded when first queried and the least recently
+queried are dropped again once the loaded zones take more memory than
+allowed.
+"""
+
+logger = logging.getLogger('DNS.Directory')
+
+# Longest wait before loading a zone that keeps failing to load again
+MAX_RETRY_INTERVAL = 300.0
+
+
+def zoneSize(provider):
+    '''
+    Returns roughly how many bytes a loaded ZoneFile holds, its store and
+    the transfers of it in progress.
+    '''
+
+    return provider.state.store.getSize() + provider.getTransferSize()
+
+
+class ZoneDirectory:
+    def __init__(self, path, suffix='.zone', maxBytes=256 * 1024 * 1024,
+                 retryInterval=5.0, **options):
+        '''
+        options are passed on to each providers.file.ZoneFile, zones are
+        always held in compact stores unless they are snapshots. A zone
+        that fails to load is answered with SERVFAIL for retryInterval
+        seconds before it is loaded again, twice as long after each
+        further failure.
+        '''
+
+        logger.info("Serving zones from '{}'".format(path))
+
+        self.path = path
+        self.suffix = suffix
+        self.maxBytes = maxBytes
+        self.retryInterval = retryInterval
+        self.options = dict(options, compact=True)
+
+        self.filters = []
+        self.listeners = []
+
+        self.lock = threading.Lock()
+        self.loaded = collections.OrderedDict()
+        self.size = 0
+
+        # Futures of the zones being loaded, which other queries for the
+        # zone wait on, and when zones that failed to load may be tried
+        # again along with the current wait
+        self.loading = {}
+        self.failed = {}
+
+        self.loads = 0
+        self.loadFailures = 0
+        self.evictions = 0
+
+        self.index()
+
+    def index(self):
+        '''
+        Builds the map of zone names to files from the directory listing.
+        '''
+
+        files = {}
+        names = nametrie.NameTrie()
+        for entry in os.scandir(self.path):
+            if not entry.name.endswith(self.suffix) \
+                    or entry.name.startswith('.') or not entry.is_file():
+                continue
+
+            zone = entry.name[:len(entry.name) - len(self.suffix)]
+            try:
+                name = dns.name.from_text(zone)
+            except dns.exception.DNSException:
+                logger.warning("Skipping '{}'".format(entry.path))
+                continue
+
+            if names.get(name) is not None:
+                logger.warning("Skipping '{}', '{}' is already served".format(
+                    entry.path,
+                    name
+                ))
+                continue
+
+            names.insert(name, name)
+            files[name] = entry.path
+
+        self.files = files
+        self.names = names
+        self.zones = list(files.keys())
+
+    def getZones(self, clientaddress):
+        return self.zones
+
+    def findZone(self, nameKey):
+        '''
+        Returns the loaded ZoneFile for the zone enclosing the name with
+        the given utils.nametrie key, loading it if needed, or None if
+        there is no such zone or it failed to load.
+        '''
+
+        match = self.names.longestMatchKey(nameKey)
+        if match is None:
+            return None
+
+        zone = match[1]
+        with self.lock:
+            provider = self.loaded.get(zone)
+            if provider is not None:
+                self.loaded.move_to_end(zone)
+                return provider
+
+            failed = self.failed.get(zone)
+            if failed is not None and failed[0] > time.monotonic():
+                return None
+
+            future = self.loading.get(zone)
+            if future is not None:
+                loader = False
+            else:
+                loader = True
+                future = concurrent.futures.Future()
+                self.loading[zone] = future
+
+        # Loaded without holding the lock so that queries for zones
+        # already loaded carry on meanwhile, other queries for this zone
+        # wait for the one load.
+        if not loader:
+            return future.result()
+
+        provider = None
+        try:
+            provider = self.loadZone(zone)
+        finally:
+            with self.lock:
+                del self.loading[zone]
+            future.set_result(provider)
+
+        return provider
+
+    def loadZone(self, zone):
+        '''
+        Loads a zone into the loaded zones, evicting the least recently
+        used as needed. Returns the ZoneFile, or None if it failed to load.
+        '''
+
+        try:
+            provider = ZoneFile(self.files[zone], zone.to_text(),
+                                **self.options)
+        except Exception as e:
+            with self.lock:
+                interval = self.retryInterval
+                failed = self.failed.get(zone)
+                if failed is not None:
+                    interval = min(failed[1] * 2, MAX_RETRY_INTERVAL)
+
+                self.failed[zone] = (time.monotonic() + interval, interval)
+                self.loadFailures += 1
+
+            logger.error(
+                "Loading zone '{}' from '{}' failed, retrying in {}s: "
+                "{}".format(zone, self.files[zone], interval, e)
+            )
+            return None
+
+        provider.addListener(self.changed)
+
+        dropped = []
+        with self.lock:
+            self.failed.pop(zone, None)
+            self.loaded[zone] = provider
+            self.loads += 1
+
+            # transfers in progress come and go, so what the loaded zones
+            # hold is counted afresh
+            self.size = sum(
+                zoneSize(loaded) for loaded in self.loaded.values()
+            )
+
+            while self.size > self.maxBytes and len(self.loaded) > 1:
+                evicted, old = self.loaded.popitem(last=False)
+                self.size -= zoneSize(old)
+                self.evictions += 1
+                dropped.append(old)
+                logger.debug("Evicted zone '{}'".format(evicted))
+
+        # a dropped zone's watcher would otherwise keep it alive
+        for old in dropped:
+            old.removeListener(self.changed)
+            old.close()
+
+        return provider
+
+    def changed(self, provider):
+        for listener in list(self.listeners):
+            listener(self)
+
+    def addListener(self, listener):
+        '''
+        Has listener(provider) called after any loaded zone has been
+        reloaded.
+        '''
+
+        self.listeners.append(listener)
+
+    def removeListener(self, listener):
+        self.listeners.remove(listener)
+
+    def close(self):
+        with self.lock:
+            loaded = list(self.loaded.values())
+            self.loaded.clear()
+            self.size = 0
+
+        for provider in loaded:
+            provider.close()
+
+    def getWireResponse(self, query, data, clientaddress):
+        provider = self.findZone(query.nameKey)
+        if provider is None:
+            return None
+
+        return provider.getWireResponse(query, data, clientaddress)
+
+    def getResponse(self, request, clientaddress):
+        provider = self.findZone(
+            nametrie.nameKey(request.question[0].name)
+        )
+        if provider is None:
+            response = dns.message.make_response(request)
+            response.set_rcode(dns.rcode.SERVFAIL)
+            return response
+
+        return provider.getResponse(request, clientaddress)
+
+    def getTransfer(self, request, isUdp, clientaddress):
+        provider = self.findZone(
+            nametrie.nameKey(request.question[0].name)
+        )
+        if provider is None:
+            return None
+
+        return provider.getTransfer(request, isUdp, clientaddress)
+
+    def getStats(self):
+        with self.lock:
+            return {
+                'zones': len(self.zones),
+                'loaded': len(self.loaded),
+                'bytes': self.size,
+                'maxBytes': self.maxBytes,
+                'loads': self.loads,
+                'loadFailures': self.loadFailures,
+                'evictions': self.evictions,
+            }
+
+    def getFilters(self):
+        return self.filters
+
+    def addFilter(self, dnsfilter):
+        self.filters.append(dnsfilter)
@@ -27,110 +27,1056 @@ of the authors and should not be interpreted as representing official policies,
 either expressed or implied, of the project author/s.
 """
 
+import collections
+import concurrent.futures
+import ipaddress
 import logging
+import threading
+import time
+import weakref
 
+import dns.flags
 import dns.name
 import dns.zone
 import dns.message
+import dns.rcode
+import dns.rdataclass
 import dns.rdatatype
 
+from utils import journal, nametrie, snapshot, update, wire, xfr
+from utils import zoneparser, zonestore
+from utils.watch import FileWatcher
+
 """
 This is a very basic dns provider that reads a zone file and
-loads it into memory.
+loads it into memory, or serves a snapshot written by utils.snapshot
+straight from the file.
+
+Zones can accept dynamic updates from the networks in allowUpdate. Each
+update is applied to a copy of the zone in memory and appended to a
+journal file, by default the zone file's path with .jnl added, which is
+replayed over the zone file or snapshot when it is next loaded. The copy
+is only served once the journal file holds the update. checkpoint writes
+the zone out as a snapshot, serves it from then on and empties the
+journal.
 """
 
 logger = logging.getLogger('DNS.File')
 
+# Types whose targets have their addresses added to the additional section
+# http://www.ietf.org/rfc/rfc1035.txt
+# 3.3.9., 3.3.11. and http://www.ietf.org/rfc/rfc2782.txt
+ADDITIONAL = {
+    dns.rdatatype.MX: 'exchange',
+    dns.rdatatype.NS: 'target',
+    dns.rdatatype.SRV: 'target',
+}
+ADDRESSES = (dns.rdatatype.A, dns.rdatatype.AAAA)
+
+# Longest chain of CNAMEs followed within the zone
+MAX_CHAIN = 8
+
+
+def addRdataset(response, section, name, rdataset):
+    '''
+    Adds the records of rdataset to section of response under name.
+    '''
+
+    rrset = response.find_rrset(
+        section,
+        name,
+        rdataset.rdclass,
+        rdataset.rdtype,
+        rdataset.covers,
+        None,
+        True
+    )
+
+    for item in rdataset:
+        rrset.add(item, rdataset.ttl)
+
+
+def clientAddress(clientaddress):
+    '''
+    Returns the ipaddress address of a client's socket address, IPv4 for
+    IPv4 clients of a dual stack socket.
+    '''
+
+    address = ipaddress.ip_address(clientaddress[0].split('%')[0])
+    if address.version == 6 and address.ipv4_mapped is not None:
+        address = address.ipv4_mapped
+
+    return address
+
+
+def affects(key, lookup):
+    '''
+    Whether adding, removing or changing the owner name with utils.nametrie
+    key can change what a lookup of the name with key lookup finds: the
+    name itself or a name below it, an empty non-terminal above it, or a
+    name matching a wildcard.
+    '''
+
+    # http://www.ietf.org/rfc/rfc4592.txt
+    # 2.2.
+    if lookup[:len(key)] == key or key[:len(lookup)] == lookup:
+        return True
+
+    return key[-1] == nametrie.WILDCARD and lookup[:len(key) - 1] == key[:-1]
+
+
+def parseZone(file, zone):
+    '''
+    Reads a zone file into a compact store and returns it as snapshot
+    bytes, which are far cheaper to send between processes than the store.
+    '''
+
+    store = zonestore.CompactStore.fromRecords(
+        dns.name.from_text(zone),
+        zoneparser.readBatches(file, zone)
+    )
+
+    return snapshot.dumpsStore(store)
+
+
+def loadZoneFiles(zones, workers=None, **options):
+    '''
+    Loads [(file, zone), ...] into ZoneFiles, passing options on to each.
+    With more than one zone file to parse they are parsed side by side in a
+    pool of worker processes, so that start up takes about as long as the
+    largest zone rather than all of them. Each parsed zone is then held as
+    the options ask for, as it would be had the ZoneFile read it itself.
+    '''
+
+    texts = [file for file, zone in zones if not snapshot.isSnapshot(file)]
+    if len(texts) <= 1:
+        return [ZoneFile(file, zone, **options) for file, zone in zones]
+
+    pending = []
+    with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+        for file, zone in zones:
+            if snapshot.isSnapshot(file):
+                pending.append((file, zone, None))
+            else:
+                pending.append((file, zone, pool.submit(parseZone, file,
+                                                        zone)))
+
+        providers = []
+        for file, zone, future in pending:
+            store = None
+            if future is not None:
+                store = snapshot.loadsStore(future.result())
+                if not options.get('compact'):
+                    # a compact store decodes nodes on every lookup
+                    store = zonestore.TrieStore.fromStore(store)
+
+            providers.append(ZoneFile(file, zone, store=store, **options))
+
+    return providers
+
+
+class ZoneState:
+    '''
+    One loaded copy of a zone: its store, the parsed dns.zone.Zone when
+    there is one, and its compiled answers. Reloading builds a new state
+    and replaces the old one as a whole, so a request that takes
+    ZoneFile.state once sees a single consistent copy.
+    '''
+
+    __slots__ = (
+        'data', 'store', 'soa', 'answers', 'nodata', 'nxdomain',
+        'lookups', 'negatives', 'transfers'
+    )
+
+    def __init__(self, data, store):
+        self.data = data
+        self.store = store
+        self.soa = store.soa
+
+        # utils.xfr.Streams of this copy, shared by the secondaries
+        # transferring it at the same time. Held only by the transfers
+        # reading them, so their bodies go once the last one is done.
+        self.transfers = weakref.WeakValueDictionary()
+
+        self.answers = None
+        self.nodata = None
+        self.nxdomain = None
+
+        # The utils.nametrie keys of the other names each compiled name's
+        # answers were looked up at, and the names with the SOA in a
+        # negative answer
+        self.lookups = None
+        self.negatives = None
+
+
+class PendingUpdate:
+    '''
+    An update whose journal record isn't on disk yet: its number in the
+    journal file, the change, and the ZoneState it makes. rcode is set
+    once the update has been served or lost.
+    '''
+
+    __slots__ = ('sequence', 'delta', 'state', 'rcode')
+
+    def __init__(self, sequence, delta, state):
+        self.sequence = sequence
+        self.delta = delta
+        self.state = state
+        self.rcode = None
+
 
 class ZoneFile:
-    def __init__(self, file, zone):
+    def __init__(self, file, zone, compiled=False, minimalAny=False,
+                 compact=False, watch=False, watchInterval=1.0,
+                 store=None, allowTransfer=None,
+                 journalSize=journal.DEFAULT_DELTAS, allowUpdate=None,
+                 updateJournal=None):
         logger.info("Serving zone '{}' from '{}'".format(zone, file))
 
+        self.file = file
         self.zone = dns.name.from_text(zone)
-        self.data = dns.zone.from_file(
-            file,
-            origin=zone,
-            relativize=False
-        )
+        self.compiled = compiled
+        self.compact = compact
 
         self.filters = []
+        self.minimalAny = minimalAny
 
-    def getZones(self, clientaddress):
-        return [self.zone]
+        self.listeners = []
+        self.lock = threading.Lock()
+        self.reloads = 0
+        self.reloadFailures = 0
+        self.reloadTime = 0.0
+        self.lastDiff = (0, 0, 0)
 
-    def getRdatasetWildcardRecursion(self, name, rdtype, first=True):
-        try:
-            rdataset = self.data.find_rdataset(
-                name,
-                rdtype
+        # networks that may transfer the zone, none by default
+        self.allowTransfer = [
+            ipaddress.ip_network(network)
+            for network in allowTransfer or ()
+        ]
+        self.transfers = 0
+
+        self.journal = None
+        if journalSize:
+            self.journal = journal.Journal(journalSize)
+
+        # networks that may update the zone, none by default
+        self.allowUpdate = [
+            ipaddress.ip_network(network)
+            for network in allowUpdate or ()
+        ]
+        self.updates = 0
+        self.updateFailures = 0
+        self.updateLock = threading.Lock()
+
+        if self.allowUpdate and updateJournal is None \
+                and isinstance(file, str):
+            updateJournal = file + '.jnl'
+
+        self.updateJournal = None
+        if self.allowUpdate and updateJournal is not None:
+            self.updateJournal = journal.JournalFile(updateJournal,
+                                                     self.zone)
+
+        self.state = self.load(store)
+
+        # Updates are made on top of head, the served state with the
+        # updates still waiting for the journal file applied
+        self.head = self.state
+        self.unsynced = collections.deque()
+
+        self.watcher = None
+        if watch:
+            self.watcher = FileWatcher(
+                file,
+                lambda path: self.reload(),
+                watchInterval
             )
-        except KeyError as e:
-            if name.is_wild():
-                name = name.parent()
-            name.relativize(self.zone)
-            if not first:
-                name = name.parent()
-            name = dns.name.Name(['*']).concatenate(name)
+            self.watcher.start()
 
-            rdataset = self.getRdatasetWildcardRecursion(name, rdtype, False)
+    def read(self):
+        '''
+        Reads the zone file or snapshot, returning its store and the parsed
+        dns.zone.Zone if there is one.
+        '''
 
-        return rdataset
+        file = self.file
+        if isinstance(file, str) and snapshot.isSnapshot(file):
+            store = snapshot.SnapshotStore(file)
+            if store.origin != self.zone:
+                raise ValueError('Snapshot %s is for %s' % (
+                    file,
+                    store.origin
+                ))
 
-    def getResponse(self, request, clientaddress):
-        response = dns.message.make_response(request)
+            return store, None
 
-        for question in response.question:
-            rdtypes = [question.rdtype]
+        if self.compact:
+            # read record by record, never holding the whole zone as
+            # dnspython objects
+            return zonestore.CompactStore.fromRecords(
+                self.zone,
+                zoneparser.readBatches(file, self.zone)
+            ), None
 
-            if question.rdtype == dns.rdatatype.ANY:
-                rdtypes = dns.rdatatype._by_value.keys()
+        data = dns.zone.from_file(
+            file,
+            origin=self.zone,
+            relativize=False
+        )
+        return zonestore.TrieStore(data), data
 
-            for rdtype in rdtypes:
-                try:
-                    rdataset = self.getRdatasetWildcardRecursion(
-                        question.name,
-                        rdtype
-                    )
+    def load(self, store=None):
+        '''
+        Reads the zone file or snapshot into a new ZoneState, or wraps a
+        store that has already been loaded.
+        '''
+
+        data = None
+        if store is None:
+            store, data = self.read()
+        elif isinstance(store, zonestore.TrieStore):
+            data = store.data
+
+        if self.allowUpdate:
+            # updates are made to copies of the zone's nodes, which only a
+            # TrieStore holds
+            if not isinstance(store, zonestore.TrieStore):
+                store = zonestore.TrieStore.fromStore(store)
+
+            store = self.replay(store)
+            data = store.data
+
+        state = ZoneState(data, store)
+        if self.compiled:
+            self.compile(state)
 
-                    rrset = response.find_rrset(
-                        response.answer,
-                        question.name,
-                        rdataset.rdclass,
-                        rdataset.rdtype,
-                        rdataset.covers,
-                        None,
-                        True
+        return state
+
+    def reload(self):
+        '''
+        Loads the zone again and swaps it in if it loads cleanly, then
+        tells the listeners. Requests keep being answered from the old copy
+        until the swap. Returns whether the zone was replaced.
+        '''
+
+        start = time.monotonic()
+        with self.updateLock:
+            try:
+                state = self.load()
+            except Exception as e:
+                with self.lock:
+                    self.reloadFailures += 1
+                logger.error(
+                    "Reloading zone '{}' from '{}' failed: {}".format(
+                        self.zone,
+                        self.file,
+                        e
                     )
+                )
+                return False
+
+            old = self.state
+            added, removed, changed = zonestore.diff(old.store, state.store)
+            if self.journal is not None:
+                self.record(old, state, added or removed or changed)
 
-                    for item in rdataset:
-                        rrset.add(item, rdataset.ttl)
+            # loading wrote out and replayed every update still waiting
+            for pending in self.unsynced:
+                pending.rcode = dns.rcode.NOERROR
+                if self.updateJournal.isLost(pending.sequence):
+                    pending.rcode = dns.rcode.SERVFAIL
+            self.unsynced.clear()
 
-                except (KeyError, dns.name.NoParent) as e:
-                    pass
+            self.state = state
+            self.head = state
 
-        if len(response.answer) <= 1:
-            response.set_rcode(dns.rcode.NXDOMAIN)
+        elapsed = time.monotonic() - start
+        with self.lock:
+            self.reloads += 1
+            self.reloadTime = elapsed
+            self.lastDiff = (len(added), len(removed), len(changed))
 
-            rdataset = self.getRdatasetWildcardRecursion(
+        logger.info(
+            "Reloaded zone '{}' in {:.3f}s, {} names added, {} removed, "
+            "{} changed".format(
                 self.zone,
-                dns.rdatatype.SOA
+                elapsed,
+                len(added),
+                len(removed),
+                len(changed)
             )
+        )
+
+        for listener in list(self.listeners):
+            listener(self)
+
+        return True
+
+    def record(self, old, new, modified):
+        '''
+        Adds the change from state old to state new to the journal. A
+        change the serial doesn't move forward for can't be sent as a delta,
+        so the journal starts again from the new version.
+        '''
+
+        if not journal.serialGreater(journal.serialOf(new.soa),
+                                     journal.serialOf(old.soa)):
+            if modified:
+                self.journal.clear()
+            return
+
+        removed, added = zonestore.changes(old.store, new.store)
+        self.journal.append(old.soa, new.soa, removed, added)
+
+    def replay(self, store):
+        '''
+        Applies the updates in the journal file that carry on from the
+        store's serial, and returns the updated store. Updates older than
+        the store are already in it and skipped.
+        '''
+
+        if self.updateJournal is None:
+            return store
+
+        serial = journal.serialOf(store.soa)
+        deltas = []
+        for delta in self.updateJournal.read():
+            if journal.serialOf(delta.oldSoa) == serial:
+                deltas.append(delta)
+                serial = journal.serialOf(delta.newSoa)
 
-            rrset = response.find_rrset(
-                response.authority,
+        if not deltas:
+            return store
+
+        logger.info("Replaying {} updates to zone '{}' from '{}'".format(
+            len(deltas),
+            self.zone,
+            self.updateJournal.path
+        ))
+
+        # replayed updates can still be sent by IXFR
+        if self.journal is not None:
+            for delta in deltas:
+                self.journal.append(delta.oldSoa, delta.newSoa,
+                                    delta.removed, delta.added)
+
+        return store.apply(deltas)
+
+    def updateAllowed(self, clientaddress):
+        if clientaddress is None:
+            return False
+
+        address = clientAddress(clientaddress)
+        return any(
+            address.version == network.version and address in network
+            for network in self.allowUpdate
+        )
+
+    def update(self, request, clientaddress):
+        '''
+        Applies a DNS UPDATE of the zone and returns the rcode of the
+        response. Updates are applied one at a time to a copy of the zone,
+        which is only swapped in once the journal file holds the update.
+        Journal writes of updates that arrive together share one fsync.
+        '''
+
+        # http://www.ietf.org/rfc/rfc2136.txt
+        # 3.1.
+        if request.question[0].name != self.zone:
+            return dns.rcode.NOTAUTH
+
+        if not self.updateAllowed(clientaddress):
+            return dns.rcode.REFUSED
+
+        with self.updateLock:
+            old = self.head
+            nodes = old.store.data.nodes
+            rdclass = old.soa.rdclass
+
+            rcode = update.checkPrerequisites(
+                nodes,
                 self.zone,
-                rdataset.rdclass,
-                rdataset.rdtype,
-                rdataset.covers,
+                rdclass,
+                request.prerequisite
+            )
+            if rcode == dns.rcode.NOERROR:
+                rcode = update.prescan(self.zone, rdclass, request.update)
+            if rcode != dns.rcode.NOERROR:
+                return rcode
+
+            delta = update.changes(nodes, self.zone, old.soa,
+                                   request.update)
+            if delta is None:
+                return dns.rcode.NOERROR
+
+            store = old.store.apply([delta])
+            state = ZoneState(store.data, store)
+            if self.compiled:
+                self.recompile(old, state, [delta])
+
+            self.head = state
+            if self.updateJournal is None:
+                pending = PendingUpdate(None, delta, state)
+                self.unsynced.append(pending)
+                self.settle()
+            else:
+                pending = PendingUpdate(
+                    self.updateJournal.append(delta),
+                    delta,
+                    state
+                )
+                self.unsynced.append(pending)
+
+        if pending.sequence is not None:
+            try:
+                self.updateJournal.sync(pending.sequence)
+            except OSError as e:
+                logger.error(
+                    "Writing updates to zone '{}' failed: {}".format(
+                        self.zone,
+                        e
+                    )
+                )
+
+            with self.updateLock:
+                self.settle()
+
+        if pending.rcode != dns.rcode.NOERROR:
+            with self.lock:
+                self.updateFailures += 1
+            return dns.rcode.SERVFAIL
+
+        for listener in list(self.listeners):
+            listener(self)
+
+        with self.lock:
+            self.updates += 1
+
+        return dns.rcode.NOERROR
+
+    def settle(self):
+        '''
+        Serves the waiting updates whose journal records are on disk, in
+        order. An update whose record was lost fails, along with every
+        update made on top of it. Call holding updateLock.
+        '''
+
+        while self.unsynced:
+            pending = self.unsynced[0]
+
+            if pending.sequence is not None:
+                if self.updateJournal.isLost(pending.sequence):
+                    for lost in self.unsynced:
+                        lost.rcode = dns.rcode.SERVFAIL
+                    self.unsynced.clear()
+                    self.head = self.state
+                    return
+
+                if pending.sequence > self.updateJournal.synced:
+                    return
+
+            self.unsynced.popleft()
+            delta = pending.delta
+            if self.journal is not None:
+                self.journal.append(delta.oldSoa, delta.newSoa,
+                                    delta.removed, delta.added)
+
+            self.state = pending.state
+            pending.rcode = dns.rcode.NOERROR
+
+    def checkpoint(self, path):
+        '''
+        Writes the zone as it stands to a snapshot at path and serves the
+        zone from it, then empties the journal file the snapshot now holds
+        the updates of.
+        '''
+
+        # the watcher is stopped first, as a reload it has started waits
+        # for updateLock
+        watcher = self.watcher
+        if watcher is not None:
+            watcher.stop()
+
+        try:
+            with self.updateLock:
+                if self.updateJournal is not None:
+                    self.updateJournal.flush()
+                    self.settle()
+
+                snapshot.write(self.state.store.data, path)
+
+                # reloads must read the updates back from the snapshot
+                self.file = path
+                if self.updateJournal is not None:
+                    self.updateJournal.truncate()
+        finally:
+            if watcher is not None:
+                self.watcher = FileWatcher(
+                    self.file,
+                    lambda path: self.reload(),
+                    watcher.interval
+                )
+                self.watcher.start()
+
+    def close(self):
+        if self.watcher is not None:
+            self.watcher.stop()
+            self.watcher = None
+
+        if self.updateJournal is not None:
+            self.updateJournal.close()
+
+    def addListener(self, listener):
+        '''
+        Has listener(provider) called after the zone has been reloaded.
+        '''
+
+        self.listeners.append(listener)
+
+    def removeListener(self, listener):
+        self.listeners.remove(listener)
+
+    def getTransferSize(self):
+        '''
+        Returns how many bytes the bodies of transfers in progress hold.
+        '''
+
+        streams = [ref() for ref in self.state.transfers.valuerefs()]
+
+        return sum(stream.size for stream in streams if stream is not None)
+
+    def getStats(self):
+        with self.lock:
+            return {
+                'names': len(self.state.store),
+                'reloads': self.reloads,
+                'reloadFailures': self.reloadFailures,
+                'reloadTime': self.reloadTime,
+                'added': self.lastDiff[0],
+                'removed': self.lastDiff[1],
+                'changed': self.lastDiff[2],
+                'transfers': self.transfers,
+                'journal': len(self.journal) if self.journal else 0,
+                'updates': self.updates,
+                'updateFailures': self.updateFailures,
+                'journalSyncs': self.updateJournal.syncs
+                if self.updateJournal is not None else 0,
+            }
+
+    def anyRdatasets(self, node):
+        '''
+        Returns the rdatasets answering an ANY query at node, all of them
+        or with minimalAny only the first one.
+        '''
+
+        # http://www.ietf.org/rfc/rfc8482.txt
+        # 4.1.
+        if self.minimalAny:
+            return node.rdatasets[:1]
+
+        return node.rdatasets
+
+    def lookup(self, state, name, rdtype, lookups=None):
+        '''
+        Finds the rdatasets answering name and rdtype, following CNAMEs
+        that stay within the zone (http://www.ietf.org/rfc/rfc1034.txt
+        4.3.2. step 3). Returns the rcode, the answer as a list of (owner,
+        rdataset), whether the zone's SOA belongs in the authority section,
+        and the name and node the chain ended at, the node being None if
+        the chain left the zone or the name does not exist. An rdtype of
+        None follows the chain to its end without matching anything there.
+        The utils.nametrie keys of the names looked up are added to the set
+        lookups if given.
+        '''
+
+        answer = []
+        seen = set()
+        while len(seen) <= MAX_CHAIN and name not in seen:
+            key = nametrie.nameKey(name)
+            if lookups is not None:
+                lookups.add(key)
+
+            found = state.store.findKey(key)
+            if found is None:
+                return dns.rcode.NXDOMAIN, answer, True, name, None
+
+            node = found.node
+            if rdtype == dns.rdatatype.ANY:
+                rdatasets = self.anyRdatasets(node)
+            else:
+                rdatasets = [
+                    rdataset
+                    for rdataset in node.rdatasets
+                    if rdataset.rdtype == rdtype
+                ]
+
+            if rdatasets:
+                answer.extend((name, rdataset) for rdataset in rdatasets)
+                return dns.rcode.NOERROR, answer, False, name, node
+
+            cname = None
+            for rdataset in node.rdatasets:
+                if rdataset.rdtype == dns.rdatatype.CNAME:
+                    cname = rdataset
+
+            if cname is None:
+                return dns.rcode.NOERROR, answer, True, name, node
+
+            answer.append((name, cname))
+            seen.add(name)
+            name = cname[0].target
+            if not name.is_subdomain(self.zone):
+                break
+
+        return dns.rcode.NOERROR, answer, False, name, None
+
+    def additional(self, state, answer, lookups=None):
+        '''
+        Returns the in zone A and AAAA rdatasets of the names the MX, NS and
+        SRV records in answer point at, as (owner, rdataset). The
+        utils.nametrie keys of the names looked up are added to the set
+        lookups if given.
+        '''
+
+        targets = []
+        for owner, rdataset in answer:
+            field = ADDITIONAL.get(rdataset.rdtype)
+            if field is None:
+                continue
+
+            for rdata in rdataset:
+                target = getattr(rdata, field)
+                if target.is_subdomain(self.zone) and target not in targets:
+                    targets.append(target)
+
+        additional = []
+        for target in targets:
+            key = nametrie.nameKey(target)
+            if lookups is not None:
+                lookups.add(key)
+
+            found = state.store.findKey(key)
+            if found is None:
+                continue
+
+            additional.extend(
+                (target, rdataset)
+                for rdataset in found.node.rdatasets
+                if rdataset.rdtype in ADDRESSES
+            )
+
+        return additional
+
+    def compileAnswer(self, state, rcode, qname, answer, negative,
+                      lookups=None):
+        '''
+        Turns the result of lookup for qname into a utils.wire.Answer, with
+        the additional section filled in.
+        '''
+
+        def owner(name):
+            if name == qname:
+                return wire.POINTER_QNAME
+            return name.to_wire()
+
+        authority = []
+        if negative:
+            authority.append((self.zone.to_wire(), state.soa))
+
+        return wire.Answer(
+            rcode,
+            [(owner(name), rdataset) for name, rdataset in answer],
+            authority,
+            [
+                (name.to_wire(), rdataset)
+                for name, rdataset in self.additional(state, answer, lookups)
+            ]
+        )
+
+    def compile(self, state):
+        '''
+        Prepares wire format answers for every type at every name in the
+        state's zone, with their additional records and in zone CNAME
+        chains already followed, plus NODATA and NXDOMAIN answers carrying
+        the zone's SOA, so that getWireResponse is a dictionary lookup.
+        Answers point back at the question name instead of repeating the
+        owner, which lets wildcard answers serve any name they match.
+        '''
+
+        answers = {}
+        lookups = {}
+        negatives = set()
+        for record in state.store.records():
+            types, looked, negative = self.compileName(state, record)
+
+            answers[record.wire] = types
+            if looked:
+                lookups[record.name] = looked
+            if negative:
+                negatives.add(record.name)
+
+        self.compileNegative(state)
+        state.answers = answers
+        state.lookups = lookups
+        state.negatives = negatives
+
+    def recompile(self, old, state, deltas):
+        '''
+        Compiles state, made from the compiled state old by deltas, a list
+        of utils.journal.Delta. Only the names the deltas change are
+        compiled again, with the names whose answers looked them up and
+        those holding the SOA, every other answer is shared with old.
+        '''
+
+        changed = set()
+        for delta in deltas:
+            changed.update(name for name, rdataset in delta.removed)
+            changed.update(name for name, rdataset in delta.added)
+        keys = [nametrie.nameKey(name) for name in changed]
+
+        # The apex holds the SOA, which negative answers carry too
+        apex = nametrie.nameKey(self.zone)
+        affected = set(changed)
+        affected.add(self.zone)
+        affected.update(old.negatives)
+        for name, looked in old.lookups.items():
+            if apex in looked or any(
+                    affects(key, lookup)
+                    for key in keys
+                    for lookup in looked):
+                affected.add(name)
+
+        answers = dict(old.answers)
+        lookups = dict(old.lookups)
+        negatives = set(old.negatives)
+        for name in affected:
+            answers.pop(name.canonicalize().to_wire(), None)
+            lookups.pop(name, None)
+            negatives.discard(name)
+
+            record = state.store.names.get(name)
+            if record is None:
+                continue
+
+            types, looked, negative = self.compileName(state, record)
+
+            answers[record.wire] = types
+            if looked:
+                lookups[name] = looked
+            if negative:
+                negatives.add(name)
+
+        self.compileNegative(state)
+        state.answers = answers
+        state.lookups = lookups
+        state.negatives = negatives
+
+    def compileNegative(self, state):
+        negative = [(self.zone.to_wire(), state.soa)]
+        state.nodata = wire.Answer(dns.rcode.NOERROR, authority=negative)
+        state.nxdomain = wire.Answer(dns.rcode.NXDOMAIN, authority=negative)
+
+    def compileName(self, state, record):
+        '''
+        Prepares the answers for every type at one name, as compile does.
+        Returns them, the other names looked up for them, and whether one
+        is negative, so carries the SOA. Names without a CNAME leave the
+        answer for types they lack to the state's NODATA answer.
+        '''
+
+        name = record.name
+        node = record.node
+        lookups = set()
+
+        types = {}
+        negative = False
+        if any(rdataset.rdtype == dns.rdatatype.CNAME
+               for rdataset in node.rdatasets):
+            # Every type asked for is answered from the end of the
+            # chain, bar the types held at the alias itself
+            rcode, chain, negative, end, endNode = self.lookup(
+                state,
+                name,
                 None,
-                True
+                lookups
+            )
+            if endNode is not None:
+                for rdtype in set(r.rdtype for r in endNode.rdatasets):
+                    types[rdtype] = self.compileAnswer(
+                        state,
+                        dns.rcode.NOERROR,
+                        name,
+                        chain + [
+                            (end, rdataset)
+                            for rdataset in endNode.rdatasets
+                            if rdataset.rdtype == rdtype
+                        ],
+                        False,
+                        lookups
+                    )
+
+            types[None] = self.compileAnswer(state, rcode, name, chain,
+                                             negative, lookups)
+
+        # RRSIGs covering different types share an rdtype
+        for rdtype in set(r.rdtype for r in node.rdatasets):
+            types[rdtype] = self.compileAnswer(
+                state,
+                dns.rcode.NOERROR,
+                name,
+                [
+                    (name, rdataset)
+                    for rdataset in node.rdatasets
+                    if rdataset.rdtype == rdtype
+                ],
+                False,
+                lookups
+            )
+
+        if node.rdatasets:
+            types[dns.rdatatype.ANY] = self.compileAnswer(
+                state,
+                dns.rcode.NOERROR,
+                name,
+                [
+                    (name, rdataset)
+                    for rdataset in self.anyRdatasets(node)
+                ],
+                False,
+                lookups
+            )
+
+        lookups.discard(nametrie.nameKey(name))
+        return types, lookups, negative
+
+    def getWireResponse(self, query, data, clientaddress):
+        '''
+        Answers a utils.wire.Query from the compiled tables, returning the
+        wire format response and its TTL, or None to have getResponse
+        answer instead.
+        '''
+
+        state = self.state
+        if state.answers is None or query.qclass != dns.rdataclass.IN:
+            return None
+
+        types = state.answers.get(query.qname)
+        if types is None:
+            found = state.store.findKey(query.nameKey)
+            if found is None:
+                answer = state.nxdomain
+                return answer.render(query, data), answer.ttl
+
+            if found is zonestore.EMPTY:
+                answer = state.nodata
+                return answer.render(query, data), answer.ttl
+
+            types = state.answers[found.wire]
+
+        answer = types.get(query.qtype)
+        if answer is None:
+            answer = types.get(None, state.nodata)
+
+        return answer.render(query, data), answer.ttl
+
+    def getZones(self, clientaddress):
+        return [self.zone]
+
+    def getResponse(self, request, clientaddress):
+        response = dns.message.make_response(request)
+        response.flags |= dns.flags.AA
+
+        state = self.state
+        for question in response.question:
+            rcode, answer, negative, end, node = self.lookup(
+                state,
+                question.name,
+                question.rdtype
             )
+            if rcode != dns.rcode.NOERROR:
+                response.set_rcode(rcode)
 
-            for item in rdataset:
-                rrset.add(item, rdataset.ttl)
+            for name, rdataset in answer:
+                addRdataset(response, response.answer, name, rdataset)
+
+            for name, rdataset in self.additional(state, answer):
+                addRdataset(response, response.additional, name, rdataset)
+
+            if negative:
+                addRdataset(response, response.authority, self.zone,
+                            state.soa)
 
         return response
 
+    def transferAllowed(self, clientaddress):
+        if clientaddress is None:
+            return False
+
+        address = clientAddress(clientaddress)
+        return any(
+            address.version == network.version and address in network
+            for network in self.allowTransfer
+        )
+
+    def getTransfer(self, request, isUdp, clientaddress):
+        '''
+        Returns the wire format messages of an AXFR or IXFR of the zone
+        asked for by request, or None if the client may not have it.
+        Transfers are built once per loaded copy of the zone and shared.
+        '''
+
+        question = request.question[0]
+        if question.name != self.zone \
+                or not self.transferAllowed(clientaddress):
+            return None
+
+        state = self.state
+        serial = journal.serialOf(state.soa)
+        key = ('axfr', )
+        deltas = None
+
+        if question.rdtype == dns.rdatatype.IXFR:
+            # http://www.ietf.org/rfc/rfc1995.txt
+            # 3. the client's version is the SOA in the authority section
+            clientSerial = None
+            for rrset in request.authority:
+                if rrset.rdtype == dns.rdatatype.SOA:
+                    clientSerial = rrset[0].serial
+
+            if clientSerial is not None:
+                if isUdp or not journal.serialGreater(serial,
+                                                      clientSerial):
+                    # up to date, or told to use TCP, by the SOA alone
+                    # http://www.ietf.org/rfc/rfc1995.txt
+                    # 2.
+                    key = ('soa', )
+                elif self.journal is not None:
+                    deltas = self.journal.since(clientSerial, serial)
+                    if deltas is not None:
+                        key = ('ixfr', clientSerial)
+
+        if isUdp and key[0] != 'soa':
+            # http://www.ietf.org/rfc/rfc5936.txt
+            # 4.2.
+            return None
+
+        with self.lock:
+            self.transfers += 1
+
+            stream = state.transfers.get(key)
+            if stream is None:
+                if key[0] == 'soa':
+                    records = [(self.zone.to_wire(), state.soa)]
+                elif key[0] == 'ixfr':
+                    records = xfr.ixfrRecords(self.zone, state.soa, deltas)
+                else:
+                    records = xfr.axfrRecords(state.store)
+
+                stream = xfr.Stream(xfr.chunk(records))
+                state.transfers[key] = stream
+
+        return xfr.messages(request, stream)
+
     def getFilters(self):
         return self.filters
 
@@ -28,37 +28,64 @@
 # (for which PTR records work).
 #
 
-import logging
-import datetime
 import bisect
+import collections
+import datetime
+import logging
+import threading
 
+import dns.message
 import dns.name
-import dns.rdtypes.ANY.NS
-import dns.rdtypes.ANY.SOA
-import dns.rdtypes.ANY.PTR
-import dns.rdtypes.IN.AAAA
+import dns.rcode
+import dns.rdata
 import dns.rdataclass
+import dns.rdataset
 import dns.rdatatype
+import dns.rdtypes.ANY.NS
+import dns.rdtypes.ANY.PTR
+import dns.rdtypes.ANY.SOA
+import dns.rrset
 
 import utils.ipv6
+from utils import nametrie, wire
 
 logger = logging.getLogger('DNS.AutoRv6')
 
+# Synthesised answers kept unless told otherwise
+DEFAULT_CACHE_SIZE = 10000
+
+
+def makeRRset(name, rdtype, ttl, items):
+    '''
+    Returns an RRset of name holding the rdatas that are the keys of the
+    dict items. Copying the dict of a prepared rdataset this way reuses the
+    hashes of its rdatas, which are otherwise worked out from their wire
+    format as each is added.
+    '''
+
+    rrset = dns.rrset.RRset(name, dns.rdataclass.IN, rdtype)
+    rrset.ttl = ttl
+    rrset.items = dict(items)
+
+    return rrset
+
 
 class AutoReverseIpv6:
 
-    def __init__(self, basedomain, v6prefix, soa, nameservers):
+    def __init__(self, basedomain, v6prefix, soa, nameservers,
+                 cacheSize=DEFAULT_CACHE_SIZE):
         logger.info('Serving auto generated reveser zone {} for {}'.format(
             v6prefix,
             basedomain
         ))
 
-        self._answers = {}
         self.basedomain = dns.name.from_text(basedomain)
         self.v6prefix = v6prefix
         self.filters = []
 
         self.zone = utils.ipv6.prefixToReverseName(v6prefix)
+        self.zoneKey = nametrie.nameKey(self.zone)
+        self.prefix = utils.ipv6.prefixToAddress(v6prefix)
 
         self.nameservers = []
         for nameserver in nameservers:
@@ -84,132 +111,237 @@ class AutoReverseIpv6:
 
         self.soaTtl = soa['ttl']
 
+        self.nsRdataset = dns.rdataset.from_rdata_list(
+            self.soaTtl,
+            self.nameservers
+        )
+        self.soaRdataset = dns.rdataset.from_rdata(self.soaTtl, self.soa)
+
+        # The answers that are the same throughout a zone, and the wire
+        # format pieces AAAA and PTR answers are put together from
+        self.templates = {
+            zone: self.zoneTemplates(zone)
+            for zone in (self.zone, self.basedomain)
+        }
+        self.aaaaRecord = wire.POINTER_QNAME + wire.RECORD.pack(
+            dns.rdatatype.AAAA,
+            dns.rdataclass.IN,
+            self.soaTtl,
+            16
+        )
+        self.basedomainWire = self.basedomain.to_wire()
+        self.nsAuthority = wire.packRdataset(
+            self.zone.to_wire(),
+            self.nsRdataset
+        )
+
+        # Synthesised wire format answers by question, least recently used
+        # first
+        self.answers = collections.OrderedDict()
+        self.cacheSize = cacheSize
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def zoneTemplates(self, zone):
+        owner = zone.to_wire()
+        negative = [(owner, self.soaRdataset)]
+
+        return {
+            dns.rdatatype.NS: wire.Answer(
+                dns.rcode.NOERROR,
+                [(owner, self.nsRdataset)],
+                authoritative=False
+            ),
+            dns.rdatatype.SOA: wire.Answer(
+                dns.rcode.NOERROR,
+                [(owner, self.soaRdataset)],
+                authoritative=False
+            ),
+            dns.rcode.NXDOMAIN: wire.Answer(
+                dns.rcode.NXDOMAIN,
+                authority=negative,
+                authoritative=False
+            ),
+            dns.rcode.NOTIMP: wire.Answer(
+                dns.rcode.NOTIMP,
+                authority=negative,
+                authoritative=False
+            ),
+        }
+
     def getZones(self, clientaddress):
         zones = [self.zone, self.basedomain]
         return zones
 
+    def resolve(self, nameKey, rdtype):
+        '''
+        Works out the answer to a question for the name with the given
+        utils.nametrie key. Returns the rcode, the zone the name falls in,
+        and for NOERROR the type answered with and, for AAAA and PTR, the
+        address or the host label of the answer.
+        '''
+
+        inReverse = nameKey[:len(self.zoneKey)] == self.zoneKey
+        zone = self.zone if inReverse else self.basedomain
+
+        if not inReverse and rdtype in (dns.rdatatype.AAAA,
+                                        dns.rdatatype.ANY):
+            address = None
+            if nameKey:
+                address = utils.ipv6.labelToAddress(nameKey[-1])
+
+            if address is None or not address.startswith(self.prefix):
+                return dns.rcode.NXDOMAIN, zone, None, None
+
+            return dns.rcode.NOERROR, zone, dns.rdatatype.AAAA, address
+
+        if inReverse and rdtype in (dns.rdatatype.PTR, dns.rdatatype.ANY):
+            # nibbles follow ip6 and arpa, most significant first
+            label = utils.ipv6.nibblesToLabel(nameKey[2:])
+            if label is None:
+                return dns.rcode.NXDOMAIN, zone, None, None
+
+            return dns.rcode.NOERROR, zone, dns.rdatatype.PTR, label
+
+        if rdtype in (dns.rdatatype.NS, dns.rdatatype.SOA):
+            return dns.rcode.NOERROR, zone, rdtype, None
+
+        return dns.rcode.NOTIMP, zone, None, None
+
+    def synthesize(self, nameKey, rdtype):
+        '''
+        Returns the utils.wire.Answer to a question for the name with the
+        given utils.nametrie key, and whether it is particular to the name.
+        '''
+
+        rcode, zone, answerType, value = self.resolve(nameKey, rdtype)
+
+        if answerType == dns.rdatatype.AAAA:
+            return wire.Answer.fromBody(
+                rcode,
+                1,
+                0,
+                self.aaaaRecord + value,
+                self.soaTtl,
+                authoritative=False
+            ), True
+
+        if answerType == dns.rdatatype.PTR:
+            target = bytes((len(value), )) + value + self.basedomainWire
+            return wire.Answer.fromBody(
+                rcode,
+                1,
+                len(self.nsRdataset),
+                wire.POINTER_QNAME + wire.RECORD.pack(
+                    dns.rdatatype.PTR,
+                    dns.rdataclass.IN,
+                    self.soaTtl,
+                    len(target)
+                ) + target + self.nsAuthority,
+                self.soaTtl,
+                authoritative=False
+            ), True
+
+        if answerType is None:
+            return self.templates[zone][rcode], False
+
+        return self.templates[zone][answerType], False
+
+    def getWireResponse(self, query, data, clientaddress):
+        '''
+        Answers a utils.wire.Query straight in wire format, returning the
+        response and its TTL, or None to have getResponse answer instead.
+        '''
+
+        if query.qclass != dns.rdataclass.IN:
+            return None
+
+        key = (query.qname, query.qtype)
+        with self.lock:
+            answer = self.answers.get(key)
+            if answer is not None:
+                self.answers.move_to_end(key)
+                self.hits += 1
+
+        if answer is None:
+            answer, particular = self.synthesize(query.nameKey, query.qtype)
+
+            if particular and self.cacheSize:
+                with self.lock:
+                    self.misses += 1
+                    self.answers[key] = answer
+                    while len(self.answers) > self.cacheSize:
+                        self.answers.popitem(last=False)
+
+        return answer.render(query, data), answer.ttl
+
     def getResponse(self, request, clientaddress):
         response = dns.message.make_response(request)
 
         for question in request.question:
-            zone = None
-            if question.name.is_subdomain(self.zone):
-                zone = self.zone
-            else:
-                zone = self.basedomain
-
-            if (question.rdtype == dns.rdatatype.AAAA
-                    or question.rdtype == dns.rdatatype.ANY) \
-                    and zone == self.basedomain:
-                v6bits = self.v6prefix.strip(':').split(':')
-                v6bits = [x.rjust(4, '0').encode() for x in v6bits]
-
-                questionBits = question.name.labels[0].split(b'-')
-                if questionBits[:len(v6bits)] == v6bits:
-                    aaaa = dns.rdtypes.IN.AAAA.AAAA(
-                        dns.rdataclass.IN,
-                        dns.rdatatype.AAAA,
-                        (b':'.join(questionBits)).decode('UTF-8')
-                    )
-
-                    aaaaRRset = response.find_rrset(
-                        response.answer,
-                        question.name,
-                        aaaa.rdclass,
-                        aaaa.rdtype,
-                        aaaa.covers,
-                        None,
-                        True
-                    )
-
-                    aaaaRRset.add(aaaa, self.soaTtl)
-
-                else:
-                    response.set_rcode(dns.rcode.NXDOMAIN)
-
-            elif (question.rdtype == dns.rdatatype.PTR
-                    or question.rdtype == dns.rdatatype.ANY) \
-                    and zone == self.zone:
-                subdomain = list(question.name.labels[:-3])
-                subdomain.reverse()  # cause, you know PRT is backwards
-                subdomain = b''.join(subdomain)
-                subdomain = [
-                    subdomain[i:i + 4] for i in range(0, len(subdomain), 4)
-                ]
-                subdomain = b'-'.join(subdomain)
+            rcode, zone, rdtype, value = self.resolve(
+                nametrie.nameKey(question.name),
+                question.rdtype
+            )
 
-                ptr = dns.rdtypes.ANY.PTR.PTR(
-                    question.rdclass,
-                    dns.rdatatype.PTR,
-                    dns.name.Name([subdomain] + list(self.basedomain.labels))
+            if rcode != dns.rcode.NOERROR:
+                response.set_rcode(rcode)
+                response.authority.append(
+                    makeRRset(zone, dns.rdatatype.SOA, self.soaTtl,
+                              self.soaRdataset.items)
                 )
 
-                ptrRRset = response.find_rrset(
-                    response.answer,
-                    question.name,
-                    ptr.rdclass,
-                    ptr.rdtype,
-                    ptr.covers,
-                    None,
-                    True
+            elif rdtype == dns.rdatatype.AAAA:
+                aaaa = dns.rdata.from_wire(
+                    dns.rdataclass.IN,
+                    dns.rdatatype.AAAA,
+                    value,
+                    0,
+                    len(value)
                 )
-
-                ptrRRset.add(ptr, self.soaTtl)
-
-                nsRRset = response.find_rrset(
-                    response.authority,
-                    zone,
-                    self.nameservers[0].rdclass,
-                    self.nameservers[0].rdtype,
-                    self.nameservers[0].covers,
-                    None,
-                    True
+                response.answer.append(
+                    makeRRset(question.name, dns.rdatatype.AAAA,
+                              self.soaTtl, {aaaa: None})
                 )
 
-                for ns in self.nameservers:
-                    nsRRset.add(ns, self.soaTtl)
-
-            elif question.rdtype == dns.rdatatype.NS:
-                nsRRset = response.find_rrset(
-                    response.answer,
-                    zone,
-                    self.nameservers[0].rdclass,
-                    self.nameservers[0].rdtype,
-                    self.nameservers[0].covers,
-                    None,
-                    True
+            elif rdtype == dns.rdatatype.PTR:
+                ptr = dns.rdtypes.ANY.PTR.PTR(
+                    dns.rdataclass.IN,
+                    dns.rdatatype.PTR,
+                    dns.name.Name((value, ) + self.basedomain.labels)
+                )
+                response.answer.append(
+                    makeRRset(question.name, dns.rdatatype.PTR,
+                              self.soaTtl, {ptr: None})
                 )
-                for ns in self.nameservers:
-                    nsRRset.add(ns, self.soaTtl)
-
-            elif question.rdtype == dns.rdatatype.SOA:
-                soaRRset = response.find_rrset(
-                    response.answer,
-                    zone,
-                    self.soa.rdclass,
-                    self.soa.rdtype,
-                    self.soa.covers,
-                    None,
-                    True
+                response.authority.append(
+                    makeRRset(zone, dns.rdatatype.NS, self.soaTtl,
+                              self.nsRdataset.items)
                 )
-                soaRRset.add(self.soa, self.soaTtl)
 
-            else:
-                soaRRset = response.find_rrset(
-                    response.authority,
-                    zone,
-                    self.soa.rdclass,
-                    self.soa.rdtype,
-                    self.soa.covers,
-                    None,
-                    True
+            elif rdtype == dns.rdatatype.NS:
+                response.answer.append(
+                    makeRRset(zone, dns.rdatatype.NS, self.soaTtl,
+                              self.nsRdataset.items)
                 )
-                soaRRset.add(self.soa, self.soaTtl)
 
-                response.set_rcode(dns.rcode.NOTIMP)
+            else:
+                response.answer.append(
+                    makeRRset(zone, dns.rdatatype.SOA, self.soaTtl,
+                              self.soaRdataset.items)
+                )
 
         return response
 
+    def getStats(self):
+        with self.lock:
+            return {
+                'cached': len(self.answers),
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
     def addFilter(self, f):
         bisect.insort_right(self.filters, f)
 
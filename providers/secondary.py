@@ -0,0 +1,329 @@
+"""
+Copyright (c) 2012, Nicholas Steicke
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this
+   list of conditions and the following disclaimer.
+2. Redistributions in binary form must reproduce the above copyright notice,
+   this list of conditions and the following disclaimer in the documentation
+   and/or other materials provided with the distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+The views and conclusions contained in the software and documentation are those
+of the authors and should not be interpreted as representing official policies,
+either expressed or implied, of the project author/s.
+"""
+
+import ipaddress
+import logging
+import threading
+import time
+import weakref
+
+import dns.exception
+import dns.message
+import dns.query
+import dns.rcode
+import dns.rdatatype
+
+from providers.file import ZoneFile, ZoneState, clientAddress
+from utils import fork, journal, xfr, zonestore
+
+"""
+Serves a zone transferred from a primary server. The whole zone is
+transferred by AXFR at start up, after which it is kept current by IXFR
+when the SOA refresh timer fires, the primary sends a NOTIFY, or a
+refresh fails and the retry timer fires. Changes sent by IXFR are applied
+to a copy of the zone that shares everything they leave alone.
+"""
+
+logger = logging.getLogger('DNS.Secondary')
+
+# Running zones, whose refresh threads are started again in forked workers
+secondaries = weakref.WeakSet()
+
+
+class SecondaryZone(ZoneFile):
+    def __init__(self, zone, primary, port=53, timeout=10.0, start=True,
+                 **options):
+        '''
+        primary is the address of the server to transfer the zone from.
+        options are passed on to providers.file.ZoneFile.
+        '''
+
+        self.primary = ipaddress.ip_address(primary)
+        self.port = port
+        self.timeout = timeout
+
+        self.wakeup = threading.Event()
+        self.running = False
+        self.thread = None
+
+        self.expired = False
+        self.lastRefresh = time.monotonic()
+        self.refreshes = 0
+        self.refreshFailures = 0
+        self.incremental = 0
+        self.notifies = 0
+
+        super().__init__('{}#{}'.format(primary, port), zone, **options)
+
+        if start:
+            self.start()
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        secondaries.add(self)
+
+    def afterFork(self):
+        # Only the forking thread survives in the child, the refresh
+        # thread and anything it held have to be made anew.
+        self.wakeup = threading.Event()
+        self.start()
+
+    def close(self):
+        secondaries.discard(self)
+        self.running = False
+        self.wakeup.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+        super().close()
+
+    def receive(self, rdtype, serial=0):
+        '''
+        Transfers the zone from the primary, returning the answer records.
+        '''
+
+        rrsets = []
+        for message in dns.query.xfr(
+                str(self.primary),
+                self.zone,
+                rdtype,
+                port=self.port,
+                timeout=self.timeout,
+                relativize=False,
+                serial=serial,
+                raise_on_serial_went_backwards=False):
+            rrsets.extend(message.answer)
+
+        return rrsets
+
+    def load(self, store=None):
+        '''
+        Transfers the whole zone into a new ZoneState, or wraps a store
+        that has already been loaded.
+        '''
+
+        if store is None:
+            soa, data, deltas = xfr.readTransfer(
+                self.zone,
+                self.receive(dns.rdatatype.AXFR)
+            )
+            if data is None:
+                raise dns.exception.FormError('AXFR sent only an SOA')
+
+            store = zonestore.TrieStore(data)
+
+        state = ZoneState(store.data, store)
+        if self.compiled:
+            self.compile(state)
+
+        return state
+
+    def refresh(self):
+        '''
+        Brings the zone up to date with the primary, asking for only what
+        changed since the serial held. Returns whether the zone changed.
+        '''
+
+        start = time.monotonic()
+        old = self.state
+        serial = journal.serialOf(old.soa)
+
+        soa, data, deltas = xfr.readTransfer(
+            self.zone,
+            self.receive(dns.rdatatype.IXFR, serial)
+        )
+
+        with self.lock:
+            self.refreshes += 1
+            self.lastRefresh = time.monotonic()
+            self.expired = False
+
+        if not journal.serialGreater(journal.serialOf(soa), serial):
+            return False
+
+        if data is None and not continues(serial, soa, deltas):
+            # applied to any other serial the deltas would corrupt the zone
+            logger.warning(
+                "IXFR of zone '{}' does not lead from serial {} to {}, "
+                "transferring the whole zone".format(
+                    self.zone,
+                    serial,
+                    journal.serialOf(soa)
+                )
+            )
+            state = self.load()
+            soa = state.soa
+            data = state.data
+            if self.journal is not None:
+                self.record(old, state, True)
+        elif data is not None:
+            state = self.load(zonestore.TrieStore(data))
+            if self.journal is not None:
+                self.record(old, state, True)
+        else:
+            store = old.store.apply(deltas)
+            state = ZoneState(store.data, store)
+            if self.compiled:
+                self.recompile(old, state, deltas)
+            if self.journal is not None:
+                for delta in deltas:
+                    self.journal.append(delta.oldSoa, delta.newSoa,
+                                        delta.removed, delta.added)
+
+        self.state = state
+
+        elapsed = time.monotonic() - start
+        with self.lock:
+            self.reloads += 1
+            self.reloadTime = elapsed
+            if data is None:
+                self.incremental += 1
+
+        logger.info("Refreshed zone '{}' to serial {} by {} in {:.3f}s".format(
+            self.zone,
+            journal.serialOf(soa),
+            'AXFR' if data is not None else 'IXFR',
+            elapsed
+        ))
+
+        self.changed()
+        return True
+
+    def changed(self):
+        for listener in list(self.listeners):
+            listener(self)
+
+    def run(self):
+        '''
+        Refreshes the zone on the timers from its SOA until closed.
+        '''
+
+        # http://www.ietf.org/rfc/rfc1034.txt
+        # 4.3.5.
+        failing = False
+        while self.running:
+            soa = self.state.soa[0]
+            self.wakeup.wait(soa.retry if failing else soa.refresh)
+            self.wakeup.clear()
+            if not self.running:
+                break
+
+            try:
+                self.refresh()
+                failing = False
+            except Exception as e:
+                failing = True
+                with self.lock:
+                    self.refreshFailures += 1
+                logger.warning("Refreshing zone '{}' from {} failed: {}"
+                               .format(self.zone, self.primary, e))
+
+            if failing and not self.expired \
+                    and time.monotonic() - self.lastRefresh > soa.expire:
+                logger.error("Zone '{}' has expired".format(self.zone))
+                self.expired = True
+                self.changed()
+
+    def notify(self, request, clientaddress):
+        '''
+        Called for a NOTIFY of the zone, starts a refresh if it came from
+        the primary. Returns whether it was accepted.
+        '''
+
+        # http://www.ietf.org/rfc/rfc1996.txt
+        # 3.10.
+        if request.question[0].name != self.zone or clientaddress is None \
+                or clientAddress(clientaddress) != self.primary:
+            return False
+
+        with self.lock:
+            self.notifies += 1
+
+        self.wakeup.set()
+        return True
+
+    def getStats(self):
+        stats = super().getStats()
+        with self.lock:
+            stats.update({
+                'serial': journal.serialOf(self.state.soa),
+                'expired': self.expired,
+                'refreshes': self.refreshes,
+                'refreshFailures': self.refreshFailures,
+                'incremental': self.incremental,
+                'notifies': self.notifies,
+            })
+
+        return stats
+
+    def getWireResponse(self, query, data, clientaddress):
+        if self.expired:
+            return None
+
+        return super().getWireResponse(query, data, clientaddress)
+
+    def getResponse(self, request, clientaddress):
+        if self.expired:
+            response = dns.message.make_response(request)
+            response.set_rcode(dns.rcode.SERVFAIL)
+            return response
+
+        return super().getResponse(request, clientaddress)
+
+    def getTransfer(self, request, isUdp, clientaddress):
+        if self.expired:
+            return None
+
+        return super().getTransfer(request, isUdp, clientaddress)
+
+
+def continues(serial, soa, deltas):
+    '''
+    Whether deltas, a list of utils.journal.Delta, lead one after another
+    from the zone at serial to the one with soa.
+    '''
+
+    for delta in deltas:
+        if journal.serialOf(delta.oldSoa) != serial:
+            return False
+        serial = journal.serialOf(delta.newSoa)
+
+    return serial == journal.serialOf(soa)
+
+
+def restartSecondaries():
+    for secondary in list(secondaries):
+        if secondary.running:
+            secondary.afterFork()
+
+
+fork.register(restartSecondaries)
@@ -0,0 +1,492 @@
+"""
+Copyright (c) 2012, Nicholas Steicke
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this
+   list of conditions and the following disclaimer.
+2. Redistributions in binary form must reproduce the above copyright notice,
+   this list of conditions and the following disclaimer in the documentation
+   and/or other materials provided with the distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+The views and conclusions contained in the software and documentation are those
+of the authors and should not be interpreted as representing official policies,
+either expressed or implied, of the project author/s.
+"""
+
+import collections
+import logging
+import os.path
+import sqlite3
+import threading
+import time
+import urllib.request
+import weakref
+
+import dns.flags
+import dns.message
+import dns.name
+import dns.node
+import dns.rcode
+import dns.rdata
+import dns.rdataclass
+import dns.rdatatype
+
+from providers.file import addRdataset
+from utils import fork, nametrie, zonestore
+
+"""
+Serves zones kept in an SQLite database, one row per record:
+
+    name    the owner's labels from the root down, each ended by a NUL, so
+            that every name below another sorts straight after it
+    type    the record type's number
+    ttl     the record's TTL
+    rdata   the record data in presentation format, with absolute names
+
+A zone is every name at or below an owner with an SOA record. Names are
+found on an index of (name, type): the closest encloser of a name that
+isn't there is the one its neighbours in the index have in common, so
+wildcards and empty non-terminals take two range queries at most.
+
+Each thread reading the database gets its own read only connection.
+Answers are cached until another connection commits a change, which is
+seen by checking PRAGMA data_version every checkInterval seconds, both
+by a thread of its own, so that the server's cache is cleared even while
+every query is answered from it, and by queries reaching the provider.
+A checkInterval of 0 checks on every query and starts no thread.
+"""
+
+logger = logging.getLogger('DNS.SQLite')
+
+# Open providers, whose connections and thread are made anew in forked
+# workers
+openProviders = weakref.WeakSet()
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS records (
+    name BLOB NOT NULL,
+    type INTEGER NOT NULL,
+    ttl INTEGER NOT NULL,
+    rdata TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS records_name_type ON records (name, type);
+'''
+
+SELECT_ZONES = 'SELECT name FROM records WHERE type = ?'
+SELECT_NAME = 'SELECT type, ttl, rdata FROM records WHERE name = ?'
+SELECT_AFTER = 'SELECT name FROM records WHERE name > ? ' \
+    'ORDER BY name LIMIT 1'
+SELECT_BEFORE = 'SELECT name FROM records WHERE name < ? ' \
+    'ORDER BY name DESC LIMIT 1'
+INSERT = 'INSERT INTO records (name, type, ttl, rdata) VALUES (?, ?, ?, ?)'
+
+WILDCARD = nametrie.WILDCARD + b'\x00'
+
+
+def escapeLabel(label):
+    return label.replace(b'\x01', b'\x01\x02').replace(b'\x00', b'\x01\x01')
+
+
+def keyColumn(key):
+    '''
+    Returns the name column for a utils.nametrie key. Labels are escaped
+    so that NUL only ever ends one.
+    '''
+
+    return b''.join(escapeLabel(label) + b'\x00' for label in key)
+
+
+def columnName(column):
+    '''
+    Returns the dns.name.Name stored in a name column.
+    '''
+
+    labels = [
+        label.replace(b'\x01\x01', b'\x00').replace(b'\x01\x02', b'\x01')
+        for label in column.split(b'\x00')[:-1]
+    ]
+    labels.reverse()
+    labels.append(b'')
+
+    return dns.name.Name(labels)
+
+
+def createSchema(db):
+    db.executescript(SCHEMA)
+
+
+def addZone(db, data):
+    '''
+    Writes the records of a dns.zone.Zone into the database.
+    '''
+
+    db.executemany(INSERT, (
+        (
+            keyColumn(nametrie.nameKey(name.derelativize(data.origin))),
+            rdataset.rdtype,
+            rdataset.ttl,
+            rdata.to_text(origin=data.origin, relativize=False)
+        )
+        for name, node in data.nodes.items()
+        for rdataset in node.rdatasets
+        for rdata in rdataset
+    ))
+
+
+class SqliteZones:
+    def __init__(self, path, cacheSize=10000, checkInterval=1.0):
+        logger.info("Serving zones from '{}'".format(path))
+
+        self.uri = 'file:{}?mode=ro'.format(
+            urllib.request.pathname2url(os.path.abspath(path))
+        )
+        self.checkInterval = checkInterval
+
+        self.filters = []
+        self.listeners = []
+
+        self.local = threading.local()
+        self.connections = []
+
+        self.lock = threading.Lock()
+        self.cache = collections.OrderedDict()
+        self.cacheSize = cacheSize
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+        self.running = False
+        self.thread = None
+        openProviders.add(self)
+
+        self.loadZones()
+
+        if checkInterval > 0:
+            self.start()
+
+    def start(self):
+        self.running = True
+        self.wakeup = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        '''
+        Looks for changes every checkInterval seconds until closed.
+        '''
+
+        db = None
+        while self.running:
+            self.wakeup.wait(self.checkInterval)
+            if not self.running:
+                break
+
+            try:
+                if db is None:
+                    db = self.connection()
+                else:
+                    self.check(db)
+            except sqlite3.Error as e:
+                logger.warning("Checking '{}' for changes failed: {}"
+                               .format(self.uri, e))
+
+    def afterFork(self):
+        # Connections must not be shared with the parent, and only the
+        # forking thread survives in the child
+        with self.lock:
+            self.connections = []
+        self.local = threading.local()
+
+        if self.running:
+            self.start()
+
+    def connection(self):
+        '''
+        Returns this thread's connection, first dropping every cached
+        answer if the database has changed since it last looked.
+        '''
+
+        local = self.local
+        db = getattr(local, 'db', None)
+        now = time.monotonic()
+
+        if db is None:
+            # the statements used are few and fixed, so each is prepared
+            # once per connection and kept in its statement cache
+            db = sqlite3.connect(self.uri, uri=True, check_same_thread=False)
+            local.db = db
+            local.version = db.execute('PRAGMA data_version').fetchone()[0]
+            local.nextCheck = now + self.checkInterval
+
+            with self.lock:
+                self.connections.append(db)
+
+            # the cache may hold answers from before this connection's
+            # first version
+            if self.cache:
+                self.invalidate()
+        elif now >= local.nextCheck:
+            local.nextCheck = now + self.checkInterval
+            self.check(db)
+
+        return db
+
+    def check(self, db):
+        '''
+        Drops every cached answer if the database has changed since this
+        thread's connection db last looked.
+        '''
+
+        local = self.local
+        version = db.execute('PRAGMA data_version').fetchone()[0]
+        if version != local.version:
+            local.version = version
+            self.invalidate()
+
+    def invalidate(self):
+        # The server's cache may still hold answers the provider's own
+        # cache has already let go of
+        with self.lock:
+            self.cache.clear()
+            self.invalidations += 1
+
+        for listener in list(self.listeners):
+            listener(self)
+
+    def loadZones(self):
+        '''
+        Reads the list of zones from the database. Call again, then
+        Ndns.rebuildRoutes, after zones are added or removed.
+        '''
+
+        zones = nametrie.NameTrie()
+        names = []
+        for (column, ) in self.connection().execute(
+                SELECT_ZONES,
+                (dns.rdatatype.SOA, )):
+            name = columnName(column)
+            zones.insert(name, name)
+            names.append(name)
+
+        self.zones = zones
+        self.zoneNames = names
+
+    def addListener(self, listener):
+        '''
+        Has listener(provider) called when the database has changed.
+        '''
+
+        self.listeners.append(listener)
+
+    def removeListener(self, listener):
+        self.listeners.remove(listener)
+
+    def close(self):
+        openProviders.discard(self)
+        self.running = False
+        if self.thread is not None:
+            self.wakeup.set()
+            self.thread.join()
+            self.thread = None
+
+        with self.lock:
+            connections = self.connections
+            self.connections = []
+
+        for db in connections:
+            db.close()
+
+        self.local = threading.local()
+
+    def fetch(self, db, column):
+        '''
+        Returns the records at the name column as a dns.node.Node, or None
+        if there are none.
+        '''
+
+        rows = db.execute(SELECT_NAME, (column, )).fetchall()
+        if not rows:
+            return None
+
+        node = dns.node.Node()
+        for rdtype, ttl, text in rows:
+            rdata = dns.rdata.from_text(
+                dns.rdataclass.IN,
+                rdtype,
+                text,
+                dns.name.root,
+                False
+            )
+            node.find_rdataset(
+                dns.rdataclass.IN,
+                rdtype,
+                rdata.covers(),
+                True
+            ).add(rdata, ttl)
+
+        return node
+
+    def findNode(self, db, key, depth):
+        '''
+        Returns the dns.node.Node answering for the name with the given
+        utils.nametrie key in the zone depth labels deep: the name itself,
+        the wildcard below its closest encloser, an empty node for empty
+        non-terminals, or None if the name does not exist.
+        '''
+
+        column = keyColumn(key)
+        node = self.fetch(db, column)
+        if node is not None:
+            return node
+
+        after = db.execute(SELECT_AFTER, (column, )).fetchone()
+        if after is not None and after[0].startswith(column):
+            return zonestore.EMPTY.node
+
+        # http://www.ietf.org/rfc/rfc4592.txt
+        # 3.3.1. the closest encloser is the longest name shared with
+        # either neighbour in name order
+        escaped = [escapeLabel(label) for label in key]
+        closest = 0
+        before = db.execute(SELECT_BEFORE, (column, )).fetchone()
+        for neighbour in (before, after):
+            if neighbour is not None:
+                closest = max(closest, zonestore.commonDepth(
+                    escaped,
+                    neighbour[0].split(b'\x00')[:-1]
+                ))
+
+        if closest < depth:
+            return None
+
+        return self.fetch(db, keyColumn(key[:closest]) + WILDCARD)
+
+    def lookup(self, zone, name, rdtype):
+        '''
+        Returns the rcode, answer and authority for name and rdtype, each
+        section a list of (name, rdataset), from the cache if it can.
+        '''
+
+        key = nametrie.nameKey(name)
+        cacheKey = (key, rdtype)
+
+        # looks for changes before trusting the cache
+        db = self.connection()
+
+        with self.lock:
+            cached = self.cache.get(cacheKey)
+            if cached is not None:
+                self.cache.move_to_end(cacheKey)
+                self.hits += 1
+                return cached
+
+            self.misses += 1
+
+        zoneKey = nametrie.nameKey(zone)
+        node = self.findNode(db, key, len(zoneKey))
+
+        rcode = dns.rcode.NOERROR
+        rdatasets = []
+        if node is None:
+            rcode = dns.rcode.NXDOMAIN
+        elif rdtype == dns.rdatatype.ANY:
+            rdatasets = node.rdatasets
+        else:
+            rdatasets = [
+                rdataset
+                for rdataset in node.rdatasets
+                if rdataset.rdtype == rdtype
+            ]
+
+            if not rdatasets:
+                # http://www.ietf.org/rfc/rfc1034.txt
+                # 4.3.2. step 3 a, the CNAME is answered in place of the
+                # type asked for
+                rdatasets = [
+                    rdataset
+                    for rdataset in node.rdatasets
+                    if rdataset.rdtype == dns.rdatatype.CNAME
+                ]
+
+        answer = [(name, rdataset) for rdataset in rdatasets]
+        authority = []
+        if not answer:
+            apex = self.fetch(db, keyColumn(zoneKey))
+            soa = apex.get_rdataset(dns.rdataclass.IN, dns.rdatatype.SOA)
+            authority.append((zone, soa))
+
+        result = (rcode, answer, authority)
+        with self.lock:
+            self.cache[cacheKey] = result
+            while len(self.cache) > self.cacheSize:
+                self.cache.popitem(last=False)
+
+        return result
+
+    def getZones(self, clientaddress):
+        return self.zoneNames
+
+    def getResponse(self, request, clientaddress):
+        response = dns.message.make_response(request)
+        response.flags |= dns.flags.AA
+
+        for question in response.question:
+            match = self.zones.longestMatch(question.name)
+            if match is None:
+                response.set_rcode(dns.rcode.REFUSED)
+                continue
+
+            rcode, answer, authority = self.lookup(
+                match[1],
+                question.name,
+                question.rdtype
+            )
+            if rcode != dns.rcode.NOERROR:
+                response.set_rcode(rcode)
+
+            for name, rdataset in answer:
+                addRdataset(response, response.answer, name, rdataset)
+
+            for name, rdataset in authority:
+                addRdataset(response, response.authority, name, rdataset)
+
+        return response
+
+    def getStats(self):
+        with self.lock:
+            return {
+                'zones': len(self.zoneNames),
+                'connections': len(self.connections),
+                'cached': len(self.cache),
+                'hits': self.hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations,
+            }
+
+    def getFilters(self):
+        return self.filters
+
+    def addFilter(self, dnsfilter):
+        self.filters.append(dnsfilter)
+
+
+def reopenProviders():
+    for provider in list(openProviders):
+        provider.afterFork()
+
+
+fork.register(reopenProviders)
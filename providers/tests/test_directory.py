@@ -0,0 +1,244 @@
+"""
+Copyright (c) 2012, Nicholas Steicke
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this
+   list of conditions and the following disclaimer.
+2. Redistributions in binary form must reproduce the above copyright notice,
+   this list of conditions and the following disclaimer in the documentation
+   and/or other materials provided with the distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+The views and conclusions contained in the software and documentation are those
+of the authors and should not be interpreted as representing official policies,
+either expressed or implied, of the project author/s.
+"""
+
+
+import os
+import os.path
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+import dns.message
+import dns.name
+import dns.rcode
+import dns.rdatatype
+
+import ndns
+from providers import directory
+from utils import nametrie
+
+zoneTemplate = '''
+$TTL 300
+@       SOA     ns hostmaster 1 2000 2000 1814400 60
+        NS      ns
+ns      A       {}
+'''
+
+
+class ZoneDirectoryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        zones = {
+            'a.test.zone': '192.0.2.1',
+            'b.test.zone': '192.0.2.2',
+            'sub.a.test.zone': '192.0.2.3',
+        }
+        for filename, address in zones.items():
+            self.write(filename, zoneTemplate.format(address))
+
+        self.write('notes.txt', 'not a zone')
+        self.write('.hidden.zone', 'not a zone')
+
+        self.provider = directory.ZoneDirectory(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def write(self, filename, text):
+        with open(os.path.join(self.path, filename), 'w') as f:
+            f.write(text)
+
+    def query(self, name, rdtype=dns.rdatatype.A):
+        return self.provider.getResponse(
+            dns.message.make_query(name, rdtype),
+            None
+        )
+
+    def testIndex(self):
+        self.assertEqual(
+            sorted(self.provider.getZones(None)),
+            sorted(dns.name.from_text(name) for name in (
+                'a.test.', 'b.test.', 'sub.a.test.'
+            ))
+        )
+        self.assertEqual(self.provider.getStats()['loaded'], 0)
+
+    def testLazyLoad(self):
+        r = self.query('ns.a.test.')
+
+        self.assertEqual(r.answer[0][0].address, '192.0.2.1')
+        self.assertEqual(self.provider.getStats()['loaded'], 1)
+
+        r = self.query('ns.sub.a.test.')
+
+        self.assertEqual(r.answer[0][0].address, '192.0.2.3')
+
+        r = self.query('ns.a.test.')
+
+        stats = self.provider.getStats()
+        self.assertEqual(stats['loaded'], 2)
+        self.assertEqual(stats['loads'], 2)
+        self.assertGreater(stats['bytes'], 0)
+
+    def testEviction(self):
+        self.provider.maxBytes = 1
+
+        self.query('ns.a.test.')
+        self.query('ns.b.test.')
+        r = self.query('ns.a.test.')
+
+        self.assertEqual(r.answer[0][0].address, '192.0.2.1')
+
+        stats = self.provider.getStats()
+        self.assertEqual(stats['loaded'], 1)
+        self.assertEqual(stats['loads'], 3)
+        self.assertEqual(stats['evictions'], 2)
+
+    def testEvictionCloses(self):
+        provider = directory.ZoneDirectory(self.path, maxBytes=1,
+                                           watch=True)
+        self.addCleanup(provider.close)
+
+        zone = provider.findZone(nametrie.nameKey(
+            dns.name.from_text('a.test.')
+        ))
+        self.assertIsNotNone(zone.watcher)
+
+        provider.findZone(nametrie.nameKey(
+            dns.name.from_text('b.test.')
+        ))
+
+        self.assertIsNone(zone.watcher)
+        self.assertEqual(zone.listeners, [])
+
+    def testTransferCounted(self):
+        self.provider = directory.ZoneDirectory(
+            self.path,
+            allowTransfer=['192.0.2.0/24']
+        )
+        a = self.provider.findZone(nametrie.nameKey(
+            dns.name.from_text('a.test.')
+        ))
+        messages = a.getTransfer(
+            dns.message.make_query('a.test.', dns.rdatatype.AXFR),
+            False,
+            ('192.0.2.53', 5353)
+        )
+        next(messages)
+
+        b = self.provider.findZone(nametrie.nameKey(
+            dns.name.from_text('b.test.')
+        ))
+
+        # the transfer under way is counted against the budget
+        self.assertGreater(a.getTransferSize(), 0)
+        self.assertEqual(
+            self.provider.getStats()['bytes'],
+            a.state.store.getSize() + a.getTransferSize() +
+            b.state.store.getSize()
+        )
+
+    def testSingleLoad(self):
+        loadZone = self.provider.loadZone
+
+        def slowLoad(zone):
+            time.sleep(0.1)
+            return loadZone(zone)
+
+        self.provider.loadZone = slowLoad
+
+        key = nametrie.nameKey(dns.name.from_text('ns.a.test.'))
+        found = []
+        threads = [
+            threading.Thread(
+                target=lambda: found.append(self.provider.findZone(key))
+            )
+            for i in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(found), 4)
+        self.assertIsNotNone(found[0])
+        self.assertTrue(all(zone is found[0] for zone in found))
+        self.assertEqual(self.provider.getStats()['loads'], 1)
+
+    def testLoadFailure(self):
+        self.write('bad.test.zone', 'this is not a zone\n')
+        self.provider = directory.ZoneDirectory(self.path,
+                                                retryInterval=60)
+        bad = dns.name.from_text('bad.test.')
+
+        with self.assertLogs('DNS.Directory', 'ERROR'):
+            self.assertEqual(self.query('ns.bad.test.').rcode(),
+                             dns.rcode.SERVFAIL)
+
+        # answered without parsing the file again until the retry
+        self.assertEqual(self.query('ns.bad.test.').rcode(),
+                         dns.rcode.SERVFAIL)
+        self.assertEqual(self.provider.getStats()['loadFailures'], 1)
+
+        self.provider.failed[bad] = (0, 60)
+        with self.assertLogs('DNS.Directory', 'ERROR'):
+            self.query('ns.bad.test.')
+        self.assertEqual(self.provider.failed[bad][1], 120)
+
+        self.write('bad.test.zone', zoneTemplate.format('192.0.2.4'))
+        self.provider.failed[bad] = (0, 120)
+        r = self.query('ns.bad.test.')
+
+        self.assertEqual(r.answer[0][0].address, '192.0.2.4')
+        self.assertEqual(self.provider.failed, {})
+
+    def testListeners(self):
+        changed = []
+        self.provider.addListener(changed.append)
+
+        zone = self.provider.findZone(
+            nametrie.nameKey(dns.name.from_text('a.test.'))
+        )
+        self.assertTrue(zone.reload())
+
+        self.assertEqual(changed, [self.provider])
+
+    def testServer(self):
+        server = ndns.Ndns('::', 0)
+        server.registerProvider(self.provider)
+
+        q = dns.message.make_query('missing.b.test.', dns.rdatatype.A)
+        r = dns.message.from_wire(
+            server.handleRequest(q.to_wire(), True, None)
+        )
+
+        self.assertEqual(r.rcode(), dns.rcode.NXDOMAIN)
@@ -27,6 +27,937 @@ of the authors and should not be interpreted as representing official policies,
 either expressed or implied, of the project author/s.
 """
 
+import errno
+import io
+import os
+import tempfile
+import threading
 import unittest
 
 import providers.file
+import os.path
+
+import dns.exception
+import dns.flags
+import dns.message
+import dns.name
+import dns.rcode
+import dns.rdatatype
+import dns.rrset
+import dns.update
+
+from utils import snapshot, wire, zonestore
+
+examplePath = os.path.join(
+    os.path.dirname(__file__),
+    '..', 'example.txt'
+)
+
+
+class CompiledZoneFileTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.zone = providers.file.ZoneFile(
+            examplePath,
+            'example.',
+            compiled=True
+        )
+
+    def wireQuery(self, name, rdtype):
+        q = dns.message.make_query(name, rdtype)
+        data = q.to_wire()
+        answer = self.zone.getWireResponse(
+            wire.parseQuery(data),
+            data,
+            None
+        )
+        if answer is None:
+            return None, None
+
+        return dns.message.from_wire(answer[0]), answer[1]
+
+    def testMatchesGetResponse(self):
+        for name, node in self.zone.state.data.nodes.items():
+            for rdataset in node.rdatasets:
+                r, ttl = self.wireQuery(name, rdataset.rdtype)
+                expected = self.zone.getResponse(
+                    dns.message.make_query(name, rdataset.rdtype),
+                    None
+                )
+
+                self.assertEqual(r.rcode(), dns.rcode.NOERROR)
+                self.assertTrue(r.flags & dns.flags.AA)
+                self.assertEqual(r.answer, expected.answer)
+
+    def testCasePreserved(self):
+        r, ttl = self.wireQuery('E.Example.', dns.rdatatype.A)
+
+        self.assertEqual(r.answer[0].name.labels, (b'E', b'Example', b''))
+        self.assertEqual(len(r.answer[0]), 4)
+        self.assertEqual(ttl, 300)
+
+    def testNoData(self):
+        r, ttl = self.wireQuery('c.example.', dns.rdatatype.AAAA)
+
+        self.assertEqual(r.rcode(), dns.rcode.NOERROR)
+        self.assertEqual(r.answer, [])
+        self.assertEqual(r.authority[0].rdtype, dns.rdatatype.SOA)
+        self.assertEqual(ttl, 300)
+
+    def testWildcard(self):
+        r, ttl = self.wireQuery('a.zz.example.', dns.rdatatype.MX)
+
+        self.assertEqual(r.rcode(), dns.rcode.NOERROR)
+        self.assertEqual(r.answer[0].name.to_text(), 'a.zz.example.')
+        self.assertEqual(r.answer[0].rdtype, dns.rdatatype.MX)
+
+    def testNxDomain(self):
+        # the wildcard doesn't reach below an existing name
+        r, ttl = self.wireQuery('x.e.example.', dns.rdatatype.MX)
+
+        self.assertEqual(r.rcode(), dns.rcode.NXDOMAIN)
+        self.assertEqual(r.authority[0].rdtype, dns.rdatatype.SOA)
+
+    def testAny(self):
+        r, ttl = self.wireQuery('e.example.', dns.rdatatype.ANY)
+        expected = self.zone.getResponse(
+            dns.message.make_query('e.example.', dns.rdatatype.ANY),
+            None
+        )
+
+        self.assertEqual(len(r.answer), 3)
+        self.assertEqual(r.answer, expected.answer)
+
+    def testMinimalAny(self):
+        zone = providers.file.ZoneFile(
+            examplePath,
+            'example.',
+            compiled=True,
+            minimalAny=True
+        )
+        q = dns.message.make_query('e.example.', dns.rdatatype.ANY)
+        data = q.to_wire()
+        r = dns.message.from_wire(
+            zone.getWireResponse(wire.parseQuery(data), data, None)[0]
+        )
+
+        self.assertEqual(len(r.answer), 1)
+        self.assertEqual(r.answer, zone.getResponse(q, None).answer)
+
+    def testCnameOutOfZone(self):
+        # the chain leaves the zone, so only the CNAME is answered
+        r, ttl = self.wireQuery('b.example.', dns.rdatatype.A)
+
+        self.assertEqual(r.rcode(), dns.rcode.NOERROR)
+        self.assertEqual(len(r.answer), 1)
+        self.assertEqual(r.answer[0].rdtype, dns.rdatatype.CNAME)
+        self.assertEqual(r.authority, [])
+
+    def testMatchesGetResponseChains(self):
+        zone = providers.file.ZoneFile(io.StringIO(testZone), 'test.',
+                                       compiled=True)
+        queries = [
+            ('alias.test.', dns.rdatatype.A),
+            ('alias.test.', dns.rdatatype.MX),
+            ('alias.test.', dns.rdatatype.CNAME),
+            ('deep.test.', dns.rdatatype.A),
+            ('dangling.test.', dns.rdatatype.A),
+            ('loop1.test.', dns.rdatatype.A),
+            ('mail.test.', dns.rdatatype.MX),
+            ('test.', dns.rdatatype.NS),
+            ('test.', dns.rdatatype.ANY),
+        ]
+
+        for name, rdtype in queries:
+            q = dns.message.make_query(name, rdtype)
+            data = q.to_wire()
+            expected = zone.getResponse(q, None)
+            r = dns.message.from_wire(
+                zone.getWireResponse(wire.parseQuery(data), data, None)[0]
+            )
+
+            self.assertEqual(r.rcode(), expected.rcode())
+            self.assertEqual(r.answer, expected.answer)
+            self.assertEqual(r.authority, expected.authority)
+            self.assertEqual(r.additional, expected.additional)
+
+    def testNotCompiled(self):
+        zone = providers.file.ZoneFile(examplePath, 'example.')
+        q = dns.message.make_query('c.example.', dns.rdatatype.A)
+        data = q.to_wire()
+
+        self.assertIsNone(
+            zone.getWireResponse(wire.parseQuery(data), data, None)
+        )
+
+
+testZone = '''
+$ORIGIN test.
+$TTL 300
+@               SOA     ns hostmaster 1 2000 2000 1814400 60
+                NS      ns
+ns              A       192.0.2.1
+*.wild          TXT     "wild"
+a.ent           A       192.0.2.2
+alias           CNAME   ns
+deep            CNAME   alias
+dangling        CNAME   missing
+loop1           CNAME   loop2
+loop2           CNAME   loop1
+mail            MX      10 ns
+                MX      20 mx.example.net.
+'''
+
+
+class ZoneFileTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.zone = providers.file.ZoneFile(io.StringIO(testZone), 'test.')
+
+    def query(self, name, rdtype):
+        return self.zone.getResponse(
+            dns.message.make_query(name, rdtype),
+            None
+        )
+
+    def testAnswer(self):
+        r = self.query('NS.test.', dns.rdatatype.A)
+
+        self.assertEqual(r.rcode(), dns.rcode.NOERROR)
+        self.assertTrue(r.flags & dns.flags.AA)
+        self.assertEqual(r.answer[0][0].address, '192.0.2.1')
+
+    def testNoData(self):
+        r = self.query('ns.test.', dns.rdatatype.MX)
+
+        self.assertEqual(r.rcode(), dns.rcode.NOERROR)
+        self.assertEqual(r.answer, [])
+        self.assertEqual(r.authority[0].rdtype, dns.rdatatype.SOA)
+
+    def testEmptyNonTerminal(self):
+        r = self.query('ent.test.', dns.rdatatype.A)
+
+        self.assertEqual(r.rcode(), dns.rcode.NOERROR)
+        self.assertEqual(r.answer, [])
+
+    def testNxDomain(self):
+        for name in ('nothing.test.', 'b.ent.test.', 'x.ns.test.'):
+            r = self.query(name, dns.rdatatype.A)
+
+            self.assertEqual(r.rcode(), dns.rcode.NXDOMAIN)
+            self.assertEqual(r.authority[0].rdtype, dns.rdatatype.SOA)
+
+    def testWildcard(self):
+        for name in ('x.wild.test.', 'y.x.wild.test.'):
+            r = self.query(name, dns.rdatatype.TXT)
+
+            self.assertEqual(r.rcode(), dns.rcode.NOERROR)
+            self.assertEqual(r.answer[0].name.to_text(), name)
+            self.assertEqual(r.answer[0][0].strings, (b'wild', ))
+
+        r = self.query('x.wild.test.', dns.rdatatype.A)
+
+        self.assertEqual(r.rcode(), dns.rcode.NOERROR)
+        self.assertEqual(r.answer, [])
+
+    def testWildcardLabelOnly(self):
+        # wildcards only match below the closest encloser
+        r = self.query('wild.test.', dns.rdatatype.TXT)
+
+        self.assertEqual(r.rcode(), dns.rcode.NOERROR)
+        self.assertEqual(r.answer, [])
+
+    def testAny(self):
+        r = self.query('test.', dns.rdatatype.ANY)
+
+        self.assertEqual(
+            sorted(rrset.rdtype for rrset in r.answer),
+            [dns.rdatatype.NS, dns.rdatatype.SOA]
+        )
+
+        r = self.query('ent.test.', dns.rdatatype.ANY)
+
+        self.assertEqual(r.rcode(), dns.rcode.NOERROR)
+        self.assertEqual(r.answer, [])
+
+    def testCname(self):
+        r = self.query('alias.test.', dns.rdatatype.A)
+
+        self.assertEqual(
+            [rrset.rdtype for rrset in r.answer],
+            [dns.rdatatype.CNAME, dns.rdatatype.A]
+        )
+        self.assertEqual(r.answer[1].name.to_text(), 'ns.test.')
+
+    def testCnameChain(self):
+        r = self.query('deep.test.', dns.rdatatype.A)
+
+        self.assertEqual(
+            [rrset.name.to_text() for rrset in r.answer],
+            ['deep.test.', 'alias.test.', 'ns.test.']
+        )
+
+        r = self.query('alias.test.', dns.rdatatype.CNAME)
+
+        self.assertEqual(len(r.answer), 1)
+
+    def testCnameNoData(self):
+        r = self.query('alias.test.', dns.rdatatype.MX)
+
+        self.assertEqual(r.rcode(), dns.rcode.NOERROR)
+        self.assertEqual(len(r.answer), 1)
+        self.assertEqual(r.authority[0].rdtype, dns.rdatatype.SOA)
+
+    def testCnameNxDomain(self):
+        # http://www.ietf.org/rfc/rfc6604.txt
+        # 3. the rcode is that of the last name in the chain
+        r = self.query('dangling.test.', dns.rdatatype.A)
+
+        self.assertEqual(r.rcode(), dns.rcode.NXDOMAIN)
+        self.assertEqual(r.answer[0].rdtype, dns.rdatatype.CNAME)
+        self.assertEqual(r.authority[0].rdtype, dns.rdatatype.SOA)
+
+    def testCnameLoop(self):
+        r = self.query('loop1.test.', dns.rdatatype.A)
+
+        self.assertEqual(r.rcode(), dns.rcode.NOERROR)
+        self.assertEqual(len(r.answer), 2)
+
+    def testAdditional(self):
+        r = self.query('mail.test.', dns.rdatatype.MX)
+
+        self.assertEqual(len(r.answer[0]), 2)
+        self.assertEqual(len(r.additional), 1)
+        self.assertEqual(r.additional[0].name.to_text(), 'ns.test.')
+        self.assertEqual(r.additional[0][0].address, '192.0.2.1')
+
+        r = self.query('test.', dns.rdatatype.NS)
+
+        self.assertEqual(r.additional[0].name.to_text(), 'ns.test.')
+
+
+class StoreMatchMixin:
+
+    def testMatchesText(self):
+        queries = [
+            ('e.example.', dns.rdatatype.A),
+            ('e.example.', dns.rdatatype.ANY),
+            ('c.example.', dns.rdatatype.AAAA),
+            ('b.example.', dns.rdatatype.A),
+            ('x.y.example.', dns.rdatatype.MX),
+            ('x.e.example.', dns.rdatatype.A),
+            ('ns.s.example.', dns.rdatatype.A),
+        ]
+
+        for name, rdtype in queries:
+            q = dns.message.make_query(name, rdtype)
+            expected = self.text.getResponse(q, None)
+            r = self.zone.getResponse(q, None)
+
+            self.assertEqual(r.rcode(), expected.rcode())
+            self.assertEqual(r.answer, expected.answer)
+            self.assertEqual(r.authority, expected.authority)
+
+            data = q.to_wire()
+            answer = self.zone.getWireResponse(
+                wire.parseQuery(data),
+                data,
+                None
+            )
+            if answer is not None:
+                r = dns.message.from_wire(answer[0])
+
+                self.assertEqual(r.rcode(), expected.rcode())
+                self.assertEqual(r.answer, expected.answer)
+
+
+class SnapshotZoneFileTest(StoreMatchMixin, unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.text = providers.file.ZoneFile(examplePath, 'example.')
+
+        fd, cls.path = tempfile.mkstemp()
+        os.close(fd)
+        snapshot.write(cls.text.state.data, cls.path)
+        cls.zone = providers.file.ZoneFile(cls.path, 'example.',
+                                           compiled=True)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.zone.state.store.close()
+        os.unlink(cls.path)
+
+    def testWrongOrigin(self):
+        self.assertRaises(
+            ValueError,
+            providers.file.ZoneFile,
+            self.path,
+            'example.com.'
+        )
+
+
+class CompactZoneFileTest(StoreMatchMixin, unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.text = providers.file.ZoneFile(examplePath, 'example.')
+        cls.zone = providers.file.ZoneFile(examplePath, 'example.',
+                                           compiled=True, compact=True)
+
+
+class ReloadTest(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp()
+        os.close(fd)
+        self.write(testZone)
+
+        self.zone = providers.file.ZoneFile(self.path, 'test.',
+                                            compiled=True)
+        self.reloaded = []
+        self.zone.addListener(self.reloaded.append)
+
+    def tearDown(self):
+        self.zone.close()
+        os.unlink(self.path)
+
+    def write(self, text):
+        with open(self.path, 'w') as f:
+            f.write(text)
+
+    def query(self, name, rdtype):
+        return self.zone.getResponse(
+            dns.message.make_query(name, rdtype),
+            None
+        )
+
+    def testReload(self):
+        old = self.zone.state
+        self.write(testZone.replace('192.0.2.1', '192.0.2.9')
+                   + 'new A 192.0.2.3\n')
+
+        self.assertTrue(self.zone.reload())
+        self.assertIsNot(self.zone.state, old)
+        self.assertEqual(self.reloaded, [self.zone])
+
+        r = self.query('ns.test.', dns.rdatatype.A)
+        self.assertEqual(r.answer[0][0].address, '192.0.2.9')
+        self.assertIsNotNone(self.zone.state.answers)
+
+        stats = self.zone.getStats()
+        self.assertEqual(stats['reloads'], 1)
+        self.assertEqual(stats['added'], 1)
+        self.assertEqual(stats['removed'], 0)
+        self.assertEqual(stats['changed'], 1)
+
+    def testFailedReload(self):
+        old = self.zone.state
+        self.write('this is not a zone\n')
+
+        with self.assertLogs('DNS.File', 'ERROR'):
+            self.assertFalse(self.zone.reload())
+
+        self.assertIs(self.zone.state, old)
+        self.assertEqual(self.reloaded, [])
+        self.assertEqual(self.zone.getStats()['reloadFailures'], 1)
+
+        r = self.query('ns.test.', dns.rdatatype.A)
+        self.assertEqual(r.answer[0][0].address, '192.0.2.1')
+
+    def testWatch(self):
+        zone = providers.file.ZoneFile(self.path, 'test.', watch=True,
+                                       watchInterval=0.05)
+        reloaded = threading.Event()
+        zone.addListener(lambda provider: reloaded.set())
+        try:
+            self.write(testZone + 'new A 192.0.2.3\n')
+
+            self.assertTrue(reloaded.wait(5))
+            r = zone.getResponse(
+                dns.message.make_query('new.test.', dns.rdatatype.A),
+                None
+            )
+            self.assertEqual(r.answer[0][0].address, '192.0.2.3')
+        finally:
+            zone.close()
+
+
+class LoadZoneFilesTest(unittest.TestCase):
+
+    def testLoad(self):
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            with open(path, 'w') as f:
+                f.write(testZone)
+
+            text, test = providers.file.loadZoneFiles(
+                [(examplePath, 'example.'), (path, 'test.')],
+                workers=2,
+                compiled=True
+            )
+        finally:
+            os.unlink(path)
+
+        # served as fast as a zone the ZoneFile parsed itself
+        self.assertIsInstance(text.state.store, zonestore.TrieStore)
+        self.assertIsNotNone(text.state.data)
+        self.assertIsNotNone(text.state.answers)
+        self.assertEqual(test.zone, dns.name.from_text('test.'))
+
+        expected = providers.file.ZoneFile(examplePath, 'example.')
+        for name, rdtype in (('e.example.', dns.rdatatype.A),
+                             ('x.y.example.', dns.rdatatype.MX),
+                             ('x.e.example.', dns.rdatatype.A)):
+            q = dns.message.make_query(name, rdtype)
+            r = text.getResponse(q, None)
+
+            self.assertEqual(r.rcode(), expected.getResponse(q, None).rcode())
+            self.assertEqual(r.answer, expected.getResponse(q, None).answer)
+
+    def testCompact(self):
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            with open(path, 'w') as f:
+                f.write(testZone)
+
+            text, test = providers.file.loadZoneFiles(
+                [(examplePath, 'example.'), (path, 'test.')],
+                workers=2,
+                compact=True
+            )
+        finally:
+            os.unlink(path)
+
+        self.assertIsInstance(text.state.store, zonestore.CompactStore)
+
+        q = dns.message.make_query('e.example.', dns.rdatatype.A)
+        expected = providers.file.ZoneFile(examplePath, 'example.')
+        self.assertEqual(text.getResponse(q, None).answer,
+                         expected.getResponse(q, None).answer)
+
+    def testSingleZone(self):
+        zone, = providers.file.loadZoneFiles([(examplePath, 'example.')])
+
+        self.assertIsInstance(zone.state.store, zonestore.TrieStore)
+
+    def testError(self):
+        fd, path = tempfile.mkstemp()
+        os.write(fd, b'this is not a zone\n')
+        os.close(fd)
+        try:
+            self.assertRaises(
+                dns.exception.SyntaxError,
+                providers.file.loadZoneFiles,
+                [(path, 'test.')]
+            )
+        finally:
+            os.unlink(path)
+
+
+class TransferTest(unittest.TestCase):
+
+    client = ('::ffff:192.0.2.53', 5353, 0, 0)
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp()
+        os.close(fd)
+        self.write(testZone)
+
+        self.zone = providers.file.ZoneFile(
+            self.path,
+            'test.',
+            allowTransfer=['192.0.2.0/24']
+        )
+
+    def tearDown(self):
+        os.unlink(self.path)
+
+    def write(self, text):
+        with open(self.path, 'w') as f:
+            f.write(text)
+
+    def transfer(self, rdtype, serial=None, isUdp=False, client=client):
+        q = dns.message.make_query('test.', rdtype)
+        if serial is not None:
+            q.authority.append(dns.rrset.from_text(
+                'test.', 300, 'IN', 'SOA',
+                'ns.test. hostmaster.test. %d 2 3 4 5' % (serial, )
+            ))
+
+        messages = self.zone.getTransfer(q, isUdp, client)
+        if messages is None:
+            return None
+
+        return [
+            rrset
+            for data in messages
+            for rrset in dns.message.from_wire(
+                data,
+                one_rr_per_rrset=True
+            ).answer
+        ]
+
+    def testAxfr(self):
+        answer = self.transfer(dns.rdatatype.AXFR)
+
+        self.assertEqual(answer[0].rdtype, dns.rdatatype.SOA)
+        self.assertEqual(answer[-1].rdtype, dns.rdatatype.SOA)
+
+        records = sum(len(rdataset) for record in
+                      self.zone.state.store.records()
+                      for rdataset in record.node.rdatasets)
+        self.assertEqual(len(answer), records + 1)
+
+    def testShared(self):
+        q = dns.message.make_query('test.', dns.rdatatype.AXFR)
+        first = self.zone.getTransfer(q, False, self.client)
+        next(first)
+        stream = self.zone.state.transfers[('axfr', )]
+
+        # a transfer started meanwhile reads the same bodies
+        second = self.zone.getTransfer(q, False, self.client)
+        self.assertIs(self.zone.state.transfers[('axfr', )], stream)
+        self.assertEqual(self.zone.getTransferSize(), stream.size)
+        self.assertGreater(stream.size, 0)
+        self.assertEqual(self.zone.getStats()['transfers'], 2)
+
+        list(first)
+        list(second)
+        del first, second, stream
+
+        # and they are dropped once both are done
+        self.assertEqual(len(self.zone.state.transfers), 0)
+        self.assertEqual(self.zone.getTransferSize(), 0)
+
+    def testRefused(self):
+        self.assertIsNone(self.transfer(
+            dns.rdatatype.AXFR,
+            client=('198.51.100.1', 53)
+        ))
+        self.assertIsNone(self.transfer(dns.rdatatype.AXFR, client=None))
+        self.assertIsNone(self.transfer(dns.rdatatype.AXFR, isUdp=True))
+
+        zone = providers.file.ZoneFile(io.StringIO(testZone), 'test.')
+        q = dns.message.make_query('test.', dns.rdatatype.AXFR)
+        self.assertIsNone(zone.getTransfer(q, False, self.client))
+
+    def testIxfr(self):
+        self.write(testZone.replace(' 1 2000', ' 2 2000')
+                   .replace('192.0.2.1', '192.0.2.9'))
+        self.assertTrue(self.zone.reload())
+
+        answer = self.transfer(dns.rdatatype.IXFR, 1)
+
+        self.assertEqual(
+            [(rrset.rdtype, rrset[0].to_text()) for rrset in answer
+             if rrset.rdtype == dns.rdatatype.A],
+            [(dns.rdatatype.A, '192.0.2.1'), (dns.rdatatype.A, '192.0.2.9')]
+        )
+        self.assertEqual(len(answer), 6)
+
+        # a serial the journal doesn't know gets the whole zone
+        self.assertEqual(
+            len(self.transfer(dns.rdatatype.IXFR, 0)),
+            len(self.transfer(dns.rdatatype.AXFR))
+        )
+
+    def testIxfrCurrent(self):
+        answer = self.transfer(dns.rdatatype.IXFR, 1)
+
+        self.assertEqual(len(answer), 1)
+        self.assertEqual(answer[0].rdtype, dns.rdatatype.SOA)
+
+        # over UDP a client behind is told to come back over TCP
+        self.write(testZone.replace(' 1 2000', ' 2 2000'))
+        self.assertTrue(self.zone.reload())
+        answer = self.transfer(dns.rdatatype.IXFR, 1, isUdp=True)
+
+        self.assertEqual(len(answer), 1)
+        self.assertEqual(answer[0][0].serial, 2)
+
+
+class BrokenFile:
+    '''
+    A journal file that fails each write.
+    '''
+
+    def __init__(self, file):
+        self.file = file
+
+    def write(self, data):
+        raise OSError(errno.EIO, 'Input/output error')
+
+    def close(self):
+        self.file.close()
+
+
+class UpdateTest(unittest.TestCase):
+
+    client = ('192.0.2.53', 5353)
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'test.zone')
+        with open(self.path, 'w') as f:
+            f.write(testZone)
+
+        self.zone = self.open()
+
+    def tearDown(self):
+        self.zone.close()
+        for name in os.listdir(self.directory):
+            os.unlink(os.path.join(self.directory, name))
+        os.rmdir(self.directory)
+
+    def open(self, path=None, **options):
+        return providers.file.ZoneFile(
+            path or self.path,
+            'test.',
+            allowTransfer=['192.0.2.0/24'],
+            allowUpdate=['192.0.2.0/24'],
+            updateJournal=self.path + '.jnl',
+            **options
+        )
+
+    def send(self, update, client=client):
+        return self.zone.update(
+            dns.message.from_wire(update.to_wire()),
+            client
+        )
+
+    def query(self, zone, name, rdtype):
+        return zone.getResponse(dns.message.make_query(name, rdtype), None)
+
+    def serial(self, zone):
+        return zone.state.soa[0].serial
+
+    def testAdd(self):
+        update = dns.update.UpdateMessage('test.')
+        update.add('host', 60, 'A', '192.0.2.10')
+
+        self.assertEqual(self.send(update), dns.rcode.NOERROR)
+
+        response = self.query(self.zone, 'host.test.', 'A')
+        self.assertEqual(response.answer[0][0].to_text(), '192.0.2.10')
+        self.assertEqual(self.serial(self.zone), 2)
+        self.assertEqual(self.zone.getStats()['updates'], 1)
+
+    def testDelete(self):
+        update = dns.update.UpdateMessage('test.')
+        update.delete('mail', 'MX', '10 ns')
+        update.delete('ns')
+        # the apex keeps its SOA and NS
+        update.delete('test.')
+
+        self.assertEqual(self.send(update), dns.rcode.NOERROR)
+
+        response = self.query(self.zone, 'mail.test.', 'MX')
+        self.assertEqual(len(response.answer[0]), 1)
+        self.assertEqual(self.query(self.zone, 'ns.test.', 'A').rcode(),
+                         dns.rcode.NXDOMAIN)
+        self.assertEqual(len(self.query(self.zone, 'test.', 'NS').answer),
+                         1)
+
+    def testPrerequisites(self):
+        update = dns.update.UpdateMessage('test.')
+        update.absent('ns')
+        update.add('ns', 60, 'A', '192.0.2.10')
+        self.assertEqual(self.send(update), dns.rcode.YXDOMAIN)
+
+        update = dns.update.UpdateMessage('test.')
+        update.present('ns', 'A', '192.0.2.9')
+        self.assertEqual(self.send(update), dns.rcode.NXRRSET)
+
+        update = dns.update.UpdateMessage('test.')
+        update.present('ns', 'A', '192.0.2.1')
+        update.replace('ns', 60, 'A', '192.0.2.10')
+        self.assertEqual(self.send(update), dns.rcode.NOERROR)
+
+        response = self.query(self.zone, 'ns.test.', 'A')
+        self.assertEqual([rdata.to_text() for rdata in response.answer[0]],
+                         ['192.0.2.10'])
+
+    def testCname(self):
+        # a CNAME can't join other data, nor other data a CNAME
+        update = dns.update.UpdateMessage('test.')
+        update.add('ns', 60, 'CNAME', 'mail')
+        update.add('alias', 60, 'A', '192.0.2.10')
+
+        self.assertEqual(self.send(update), dns.rcode.NOERROR)
+        self.assertEqual(self.serial(self.zone), 1)
+
+    def testRefused(self):
+        update = dns.update.UpdateMessage('test.')
+        update.add('host', 60, 'A', '192.0.2.10')
+
+        self.assertEqual(self.send(update, ('198.51.100.1', 53)),
+                         dns.rcode.REFUSED)
+
+        update = dns.update.UpdateMessage('test.')
+        update.add('host.example.', 60, 'A', '192.0.2.10')
+        self.assertEqual(self.send(update), dns.rcode.NOTZONE)
+
+        update = dns.update.UpdateMessage('other.')
+        self.assertEqual(self.send(update), dns.rcode.NOTAUTH)
+
+        zone = providers.file.ZoneFile(io.StringIO(testZone), 'test.')
+        self.assertEqual(zone.update(update, self.client), dns.rcode.NOTAUTH)
+
+    def testReplay(self):
+        for host in range(3):
+            update = dns.update.UpdateMessage('test.')
+            update.add('host%d' % (host, ), 60, 'A', '192.0.2.10')
+            self.send(update)
+        self.zone.close()
+
+        zone = self.open()
+        self.addCleanup(zone.close)
+
+        self.assertEqual(self.serial(zone), 4)
+        self.assertEqual(zone.state.data, self.zone.state.data)
+
+        # the replayed updates are sent by IXFR
+        q = dns.message.make_query('test.', dns.rdatatype.IXFR)
+        q.authority.append(dns.rrset.from_text(
+            'test.', 300, 'IN', 'SOA', 'ns.test. hostmaster.test. 1 2 3 4 5'
+        ))
+        answer = [
+            rrset
+            for data in zone.getTransfer(q, False, self.client)
+            for rrset in dns.message.from_wire(data).answer
+        ]
+        self.assertEqual(answer[0][0].serial, 4)
+        self.assertEqual(
+            sum(1 for rrset in answer if rrset.rdtype == dns.rdatatype.A),
+            3
+        )
+
+    def testRecompile(self):
+        self.zone.close()
+        self.zone = self.open(compiled=True)
+
+        def answers(state):
+            return {
+                name: {
+                    rdtype: (answer.flags, answer.ancount, answer.nscount,
+                             answer.arcount, answer.body)
+                    for rdtype, answer in types.items()
+                }
+                for name, types in state.answers.items()
+            }
+
+        updates = [
+            # a dangling CNAME's target appears
+            [('add', 'missing', 60, 'A', '192.0.2.20')],
+            # the target of CNAMEs and of the MX and NS additional records
+            [('replace', 'ns', 60, 'A', '192.0.2.21')],
+            [('add', '*.hosts', 60, 'A', '192.0.2.30'),
+             ('add', 'mx2', 60, 'MX', '10 x.hosts'),
+             ('add', 'mx3', 60, 'MX', '10 y.hosts'),
+             ('add', 'alias2', 60, 'CNAME', 'ent')],
+            # a name shadows part of a wildcard, then the wildcard goes
+            [('add', 'x.hosts', 60, 'AAAA', '2001:db8::1')],
+            [('delete', '*.hosts')],
+            # an empty non-terminal goes
+            [('delete', 'a.ent')],
+        ]
+        for changes in updates:
+            update = dns.update.UpdateMessage('test.')
+            for change in changes:
+                getattr(update, change[0])(*change[1:])
+            self.assertEqual(self.send(update), dns.rcode.NOERROR)
+
+            state = self.zone.state
+            full = providers.file.ZoneState(state.data, state.store)
+            self.zone.compile(full)
+
+            self.assertEqual(answers(state), answers(full), changes)
+            self.assertEqual(state.lookups, full.lookups)
+            self.assertEqual(state.negatives, full.negatives)
+
+    def testCheckpoint(self):
+        update = dns.update.UpdateMessage('test.')
+        update.add('host', 60, 'A', '192.0.2.10')
+        self.send(update)
+
+        path = os.path.join(self.directory, 'test.snapshot')
+        self.zone.checkpoint(path)
+        self.assertEqual(self.zone.updateJournal.read(), [])
+
+        update = dns.update.UpdateMessage('test.')
+        update.add('host2', 60, 'A', '192.0.2.11')
+        self.send(update)
+        self.zone.close()
+
+        zone = self.open(path)
+        self.addCleanup(zone.close)
+
+        self.assertEqual(self.serial(zone), 3)
+        self.assertEqual(zone.state.data, self.zone.state.data)
+
+    def testCheckpointReload(self):
+        update = dns.update.UpdateMessage('test.')
+        update.add('host', 60, 'A', '192.0.2.10')
+        self.send(update)
+
+        path = os.path.join(self.directory, 'test.snapshot')
+        self.zone.checkpoint(path)
+        self.assertEqual(self.zone.file, path)
+
+        # the zone is read back from the snapshot, which holds the update
+        self.assertTrue(self.zone.reload())
+        self.assertEqual(self.serial(self.zone), 2)
+        response = self.query(self.zone, 'host.test.', 'A')
+        self.assertEqual(response.answer[0][0].to_text(), '192.0.2.10')
+
+    def testFailedWrite(self):
+        journalFile = self.zone.updateJournal
+        journalFile.file = BrokenFile(journalFile.file)
+
+        update = dns.update.UpdateMessage('test.')
+        update.add('host', 60, 'A', '192.0.2.10')
+        self.assertEqual(self.send(update), dns.rcode.SERVFAIL)
+
+        # nothing of the update is served or sent by IXFR
+        self.assertEqual(self.serial(self.zone), 1)
+        self.assertEqual(self.query(self.zone, 'host.test.', 'A').rcode(),
+                         dns.rcode.NXDOMAIN)
+        self.assertEqual(len(self.zone.journal), 0)
+        self.assertEqual(self.zone.getStats()['updateFailures'], 1)
+
+        # and the next update is written as usual
+        update = dns.update.UpdateMessage('test.')
+        update.add('host2', 60, 'A', '192.0.2.11')
+        self.assertEqual(self.send(update), dns.rcode.NOERROR)
+        self.assertEqual(self.serial(self.zone), 2)
+        self.zone.close()
+
+        zone = self.open()
+        self.addCleanup(zone.close)
+        self.assertEqual(zone.state.data, self.zone.state.data)
+
+    def testConcurrent(self):
+        def send(host):
+            update = dns.update.UpdateMessage('test.')
+            update.add('host%d' % (host, ), 60, 'A', '192.0.2.10')
+            self.send(update)
+
+        threads = [
+            threading.Thread(target=send, args=(host, ))
+            for host in range(20)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        stats = self.zone.getStats()
+        self.assertEqual(self.serial(self.zone), 21)
+        self.assertEqual(stats['updates'], 20)
+        self.assertLessEqual(stats['journalSyncs'], 20)
+        self.assertEqual(len(self.zone.updateJournal.read()), 20)
@@ -30,3 +30,138 @@ either expressed or implied, of the project author/s.
 import unittest
 
 import providers.reverseipv6
+
+import dns.message
+import dns.name
+import dns.rcode
+import dns.rdatatype
+import dns.reversename
+
+from utils import wire
+
+soa = {
+    'ns': 'localhost.',
+    'contact': 'hostmaster.example.',
+    'refresh': 7200,
+    'retry': 600,
+    'expire': 36000,
+    'minimum': 300,
+    'ttl': 7200
+}
+
+
+class AutoReverseIpv6Test(unittest.TestCase):
+
+    address = '2001:db8:1:2::abcd'
+    host = '2001-0db8-0001-0002-0000-0000-0000-abcd.v6.example.'
+
+    def setUp(self):
+        self.provider = providers.reverseipv6.AutoReverseIpv6(
+            'v6.example.',
+            '2001:db8:1:2::',
+            soa,
+            ['ns0.example.', 'ns1.example.'],
+            cacheSize=2
+        )
+
+    def query(self, name, rdtype):
+        return self.provider.getResponse(
+            dns.message.make_query(name, rdtype),
+            None
+        )
+
+    def wireQuery(self, name, rdtype):
+        data = dns.message.make_query(name, rdtype).to_wire()
+        response, ttl = self.provider.getWireResponse(
+            wire.parseQuery(data),
+            data,
+            None
+        )
+
+        return dns.message.from_wire(response)
+
+    def assertSameAnswer(self, name, rdtype):
+        full = self.query(name, rdtype)
+        fromWire = self.wireQuery(name, rdtype)
+
+        self.assertEqual(fromWire.rcode(), full.rcode())
+        self.assertEqual(fromWire.flags, full.flags)
+        self.assertEqual(fromWire.answer, full.answer)
+        self.assertEqual(fromWire.authority, full.authority)
+
+        return full
+
+    def testAaaa(self):
+        response = self.assertSameAnswer(self.host, dns.rdatatype.AAAA)
+
+        self.assertEqual(response.answer[0][0].address, self.address)
+        self.assertEqual(response.answer[0].ttl, 7200)
+
+        # any spelling of an address within the prefix
+        response = self.query('2001-DB8-1-2--ABCD.v6.example.',
+                              dns.rdatatype.AAAA)
+        self.assertEqual(response.answer[0][0].address, self.address)
+
+    def testAaaaOutsidePrefix(self):
+        for name in ('2001-0db8-0001-0003-0000-0000-0000-abcd.v6.example.',
+                     'www.v6.example.', 'v6.example.'):
+            response = self.assertSameAnswer(name, dns.rdatatype.AAAA)
+
+            self.assertEqual(response.rcode(), dns.rcode.NXDOMAIN)
+            self.assertEqual(response.authority[0].rdtype,
+                             dns.rdatatype.SOA)
+
+    def testPtr(self):
+        name = dns.reversename.from_address(self.address)
+        response = self.assertSameAnswer(name, dns.rdatatype.PTR)
+
+        self.assertEqual(response.answer[0][0].target.to_text(), self.host)
+        self.assertEqual(len(response.authority[0]), 2)
+
+        name = dns.name.from_text('x.2.0.0.0', self.provider.zone)
+        response = self.assertSameAnswer(name, dns.rdatatype.PTR)
+        self.assertEqual(response.rcode(), dns.rcode.NXDOMAIN)
+
+    def testPtrTooLong(self):
+        # more nibbles than an address has would make too long a label
+        name = dns.reversename.from_address(self.address)
+        name = dns.name.Name((b'1', ) * 16 + name.labels)
+        response = self.assertSameAnswer(name, dns.rdatatype.PTR)
+
+        self.assertEqual(response.rcode(), dns.rcode.NXDOMAIN)
+        self.assertEqual(self.provider.getStats()['cached'], 0)
+
+    def testZone(self):
+        for name in ('v6.example.', self.provider.zone):
+            response = self.assertSameAnswer(name, dns.rdatatype.NS)
+            self.assertEqual(len(response.answer[0]), 2)
+
+            response = self.assertSameAnswer(name, dns.rdatatype.SOA)
+            self.assertEqual(response.answer[0].name,
+                             dns.name.from_text(name)
+                             if isinstance(name, str) else name)
+
+            response = self.assertSameAnswer(name, dns.rdatatype.MX)
+            self.assertEqual(response.rcode(), dns.rcode.NOTIMP)
+
+    def testCache(self):
+        for i in range(3):
+            self.wireQuery(self.host, dns.rdatatype.AAAA)
+        self.wireQuery(self.host, dns.rdatatype.ANY)
+        self.wireQuery('v6.example.', dns.rdatatype.NS)
+
+        stats = self.provider.getStats()
+        self.assertEqual(stats['hits'], 2)
+        self.assertEqual(stats['misses'], 2)
+        self.assertEqual(stats['cached'], 2)
+
+        # the least recently used answer makes way
+        self.wireQuery(dns.reversename.from_address(self.address),
+                       dns.rdatatype.PTR)
+        self.assertEqual(self.provider.getStats()['cached'], 2)
+        self.assertNotIn(
+            (wire.parseQuery(dns.message.make_query(
+                self.host, dns.rdatatype.AAAA).to_wire()).qname,
+             dns.rdatatype.AAAA),
+            self.provider.answers
+        )
@@ -0,0 +1,249 @@
+"""
+Copyright (c) 2012, Nicholas Steicke
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this
+   list of conditions and the following disclaimer.
+2. Redistributions in binary form must reproduce the above copyright notice,
+   this list of conditions and the following disclaimer in the documentation
+   and/or other materials provided with the distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+The views and conclusions contained in the software and documentation are those
+of the authors and should not be interpreted as representing official policies,
+either expressed or implied, of the project author/s.
+"""
+
+
+import os
+import socket
+import tempfile
+import threading
+import time
+import unittest
+
+import dns.message
+import dns.opcode
+import dns.rcode
+import dns.rdatatype
+
+import ndns
+import providers.file
+import providers.secondary
+from utils import fork
+
+zoneText = '''
+$ORIGIN test.
+$TTL 300
+@       SOA     ns hostmaster {serial} 2000 2000 1814400 60
+        NS      ns
+ns      A       192.0.2.1
+{extra}
+'''
+
+
+def freePort():
+    # the server needs the port for both UDP and TCP
+    while True:
+        udp = socket.socket(socket.AF_INET6, socket.SOCK_DGRAM)
+        tcp = socket.socket(socket.AF_INET6, socket.SOCK_STREAM)
+        try:
+            udp.bind(('::', 0))
+            port = udp.getsockname()[1]
+            tcp.bind(('::', port))
+            return port
+        except OSError:
+            continue
+        finally:
+            udp.close()
+            tcp.close()
+
+
+class SecondaryZoneTest(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp()
+        os.close(fd)
+        self.write(1, ''.join('h%d A 192.0.2.%d\n' % (i, i)
+                              for i in range(100)))
+
+        self.primary = providers.file.ZoneFile(self.path, 'test.',
+                                               allowTransfer=['::1/128'])
+
+        self.port = freePort()
+        self.server = ndns.Ndns('::', self.port, workers=2)
+        self.server.registerProvider(self.primary)
+        self.thread = threading.Thread(target=self.server.run)
+        self.thread.start()
+
+        for i in range(100):
+            if self.server.tcp is not None:
+                break
+            time.sleep(0.01)
+
+        self.secondary = providers.secondary.SecondaryZone(
+            'test.',
+            '::1',
+            self.port,
+            timeout=5,
+            start=False
+        )
+
+    def tearDown(self):
+        self.secondary.close()
+        self.server.stop()
+        self.thread.join(5)
+        os.unlink(self.path)
+
+    def write(self, serial, extra):
+        with open(self.path, 'w') as f:
+            f.write(zoneText.format(serial=serial, extra=extra))
+
+    def query(self, name, rdtype=dns.rdatatype.A):
+        return self.secondary.getResponse(
+            dns.message.make_query(name, rdtype),
+            None
+        )
+
+    def testTransfer(self):
+        self.assertEqual(self.secondary.state.data, self.primary.state.data)
+
+        r = self.query('h5.test.')
+        self.assertEqual(r.answer[0][0].address, '192.0.2.5')
+
+    def testUpToDate(self):
+        self.assertFalse(self.secondary.refresh())
+        self.assertEqual(self.secondary.getStats()['refreshes'], 1)
+
+    def testIncremental(self):
+        old = self.secondary.state
+
+        self.write(2, ''.join('h%d A 192.0.2.%d\n' % (i, i + 1)
+                              for i in range(1, 100)) + 'new A 192.0.2.200\n')
+        self.assertTrue(self.primary.reload())
+
+        changed = []
+        self.secondary.addListener(changed.append)
+        self.assertTrue(self.secondary.refresh())
+
+        stats = self.secondary.getStats()
+        self.assertEqual(stats['incremental'], 1)
+        self.assertEqual(stats['serial'], 2)
+        self.assertEqual(changed, [self.secondary])
+        self.assertEqual(self.secondary.state.data, self.primary.state.data)
+
+        self.assertEqual(self.query('new.test.').answer[0][0].address,
+                         '192.0.2.200')
+        self.assertEqual(self.query('h0.test.').rcode(), dns.rcode.NXDOMAIN)
+        self.assertEqual(self.query('h5.test.').answer[0][0].address,
+                         '192.0.2.6')
+
+        # the old copy is untouched and the name that didn't change shared
+        self.assertEqual(old.store.soa[0].serial, 1)
+        self.assertIsNotNone(old.store.findKey((b'test', b'h0')))
+        self.assertIs(
+            old.store.findKey((b'test', b'ns')).node,
+            self.secondary.state.store.findKey((b'test', b'ns')).node
+        )
+
+        # changes are journalled so the secondary can serve IXFR in turn
+        self.assertEqual(len(self.secondary.journal), 1)
+
+    def testFullFallback(self):
+        # the primary can't send a delta across a serial it never saw
+        self.write(3, 'other A 192.0.2.50\n')
+        self.assertTrue(self.primary.reload())
+        self.primary.journal.clear()
+
+        self.assertTrue(self.secondary.refresh())
+        self.assertEqual(self.secondary.getStats()['incremental'], 0)
+        self.assertEqual(self.secondary.state.data, self.primary.state.data)
+
+    def testBrokenChain(self):
+        self.write(2, 'two A 192.0.2.2\n')
+        self.assertTrue(self.primary.reload())
+        self.write(3, 'two A 192.0.2.2\nthree A 192.0.2.3\n')
+        self.assertTrue(self.primary.reload())
+
+        # a primary whose deltas start from a serial other than the one
+        # held, 2 rather than 1
+        receive = self.secondary.receive
+        self.secondary.receive = lambda rdtype, serial=0: receive(
+            rdtype,
+            2 if rdtype == dns.rdatatype.IXFR else serial
+        )
+
+        with self.assertLogs('DNS.Secondary', 'WARNING'):
+            self.assertTrue(self.secondary.refresh())
+
+        self.assertEqual(self.secondary.getStats()['incremental'], 0)
+        self.assertEqual(self.secondary.getStats()['serial'], 3)
+        self.assertEqual(self.secondary.state.data, self.primary.state.data)
+
+    def testNotify(self):
+        self.secondary.start()
+
+        self.write(2, 'new A 192.0.2.200\n')
+        self.assertTrue(self.primary.reload())
+
+        q = dns.message.make_query('test.', dns.rdatatype.SOA)
+        q.set_opcode(dns.opcode.NOTIFY)
+
+        server = ndns.Ndns('::', 0)
+        server.registerProvider(self.secondary)
+
+        r = dns.message.from_wire(
+            server.handleRequest(q.to_wire(), True, ('198.51.100.1', 53))
+        )
+        self.assertEqual(r.rcode(), dns.rcode.REFUSED)
+
+        r = dns.message.from_wire(
+            server.handleRequest(q.to_wire(), True, ('::1', 53, 0, 0))
+        )
+        self.assertEqual(r.rcode(), dns.rcode.NOERROR)
+        self.assertEqual(r.opcode(), dns.opcode.NOTIFY)
+        self.assertEqual(r.id, q.id)
+
+        for i in range(500):
+            if self.secondary.getStats()['serial'] == 2:
+                break
+            time.sleep(0.01)
+
+        self.assertEqual(self.secondary.getStats()['serial'], 2)
+        self.assertEqual(self.secondary.getStats()['notifies'], 1)
+
+    @unittest.skipUnless(hasattr(os, 'fork'), 'needs fork')
+    def testFork(self):
+        self.secondary.start()
+        thread = self.secondary.thread
+
+        pid = os.fork()
+        if pid == 0:
+            # the refresh thread is started again in workers
+            fork.afterFork()
+            ok = self.secondary.thread is not thread \
+                and self.secondary.thread.is_alive()
+            os._exit(0 if ok else 1)
+
+        self.assertEqual(os.waitpid(pid, 0)[1], 0)
+
+    def testExpired(self):
+        self.secondary.expired = True
+
+        self.assertEqual(self.query('h5.test.').rcode(), dns.rcode.SERVFAIL)
+
+        self.assertFalse(self.secondary.refresh())
+        self.assertEqual(self.query('h5.test.').rcode(), dns.rcode.NOERROR)
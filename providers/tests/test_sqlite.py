@@ -0,0 +1,207 @@
+"""
+Copyright (c) 2012, Nicholas Steicke
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this
+   list of conditions and the following disclaimer.
+2. Redistributions in binary form must reproduce the above copyright notice,
+   this list of conditions and the following disclaimer in the documentation
+   and/or other materials provided with the distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+The views and conclusions contained in the software and documentation are those
+of the authors and should not be interpreted as representing official policies,
+either expressed or implied, of the project author/s.
+"""
+
+
+import io
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import unittest
+
+import dns.flags
+import dns.message
+import dns.name
+import dns.rcode
+import dns.rdatatype
+import dns.zone
+
+import ndns
+import providers.file
+import providers.sqlite
+from utils import nametrie
+
+zoneText = '''
+$ORIGIN test.
+$TTL 300
+@               SOA     ns hostmaster 1 2000 2000 1814400 60
+                NS      ns
+ns              A       192.0.2.1
+*.wild          TXT     "wild"
+a.ent           A       192.0.2.2
+alias           CNAME   ns
+mail            MX      10 ns
+'''
+
+
+class SqliteZonesTest(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp()
+        os.close(fd)
+
+        self.db = sqlite3.connect(self.path)
+        providers.sqlite.createSchema(self.db)
+        providers.sqlite.addZone(self.db, dns.zone.from_text(
+            zoneText,
+            origin='test.',
+            relativize=False
+        ))
+        self.db.commit()
+
+        self.zones = providers.sqlite.SqliteZones(self.path, checkInterval=0)
+        self.text = providers.file.ZoneFile(io.StringIO(zoneText), 'test.')
+
+    def tearDown(self):
+        self.zones.close()
+        self.db.close()
+        os.unlink(self.path)
+
+    def query(self, name, rdtype=dns.rdatatype.A):
+        return self.zones.getResponse(
+            dns.message.make_query(name, rdtype),
+            None
+        )
+
+    def testZones(self):
+        self.assertEqual(self.zones.getZones(None),
+                         [dns.name.from_text('test.')])
+
+    def testMatchesZoneFile(self):
+        queries = [
+            ('ns.test.', dns.rdatatype.A),
+            ('NS.TEST.', dns.rdatatype.A),
+            ('ns.test.', dns.rdatatype.MX),
+            ('test.', dns.rdatatype.NS),
+            ('test.', dns.rdatatype.ANY),
+            ('ent.test.', dns.rdatatype.A),
+            ('nothing.test.', dns.rdatatype.A),
+            ('b.ent.test.', dns.rdatatype.A),
+            ('x.ns.test.', dns.rdatatype.A),
+            ('x.wild.test.', dns.rdatatype.TXT),
+            ('y.x.wild.test.', dns.rdatatype.TXT),
+            ('x.wild.test.', dns.rdatatype.A),
+            ('wild.test.', dns.rdatatype.TXT),
+            ('zzz.test.', dns.rdatatype.A),
+        ]
+
+        for name, rdtype in queries:
+            q = dns.message.make_query(name, rdtype)
+            expected = self.text.getResponse(q, None)
+            r = self.zones.getResponse(q, None)
+
+            self.assertEqual(r.rcode(), expected.rcode(), name)
+            self.assertEqual(
+                sorted(r.answer, key=lambda rrset: rrset.rdtype),
+                sorted(expected.answer, key=lambda rrset: rrset.rdtype),
+                name
+            )
+            self.assertEqual(r.authority, expected.authority, name)
+            self.assertTrue(r.flags & dns.flags.AA)
+
+    def testCname(self):
+        r = self.query('alias.test.')
+
+        self.assertEqual(r.answer[0].rdtype, dns.rdatatype.CNAME)
+
+    def testCache(self):
+        self.query('ns.test.')
+        self.query('ns.test.')
+        self.query('nothing.test.')
+        self.query('nothing.test.')
+
+        stats = self.zones.getStats()
+        self.assertEqual(stats['hits'], 2)
+        self.assertEqual(stats['misses'], 2)
+        self.assertEqual(stats['cached'], 2)
+
+    def testInvalidate(self):
+        changed = []
+        self.zones.addListener(changed.append)
+
+        self.assertEqual(self.query('new.test.').rcode(), dns.rcode.NXDOMAIN)
+
+        self.db.execute(providers.sqlite.INSERT, (
+            providers.sqlite.keyColumn((b'test', b'new')),
+            dns.rdatatype.A,
+            300,
+            '192.0.2.9'
+        ))
+        self.db.commit()
+
+        r = self.query('new.test.')
+        self.assertEqual(r.answer[0][0].address, '192.0.2.9')
+        self.assertEqual(changed, [self.zones])
+        self.assertEqual(self.zones.getStats()['invalidations'], 1)
+
+    def testServerCacheInvalidated(self):
+        zones = providers.sqlite.SqliteZones(self.path, checkInterval=0.05)
+        self.addCleanup(zones.close)
+        server = ndns.Ndns('::', 0)
+        server.registerProvider(zones)
+
+        def address():
+            q = dns.message.make_query('ns.test.', dns.rdatatype.A)
+            r = dns.message.from_wire(server.handleRequest(q.to_wire(),
+                                                           True,
+                                                           None))
+            return r.answer[0][0].address
+
+        self.assertEqual(address(), '192.0.2.1')
+        self.assertEqual(address(), '192.0.2.1')
+
+        self.db.execute('UPDATE records SET rdata = ? WHERE rdata = ?',
+                        ('192.0.2.8', '192.0.2.1'))
+        self.db.commit()
+
+        # only the provider's thread can notice, as every query is
+        # answered from the server's cache
+        for i in range(200):
+            if address() == '192.0.2.8':
+                break
+            time.sleep(0.01)
+
+        self.assertEqual(address(), '192.0.2.8')
+
+    def testThreadConnections(self):
+        self.query('ns.test.')
+
+        thread = threading.Thread(target=self.query, args=('a.ent.test.', ))
+        thread.start()
+        thread.join()
+
+        self.assertEqual(self.zones.getStats()['connections'], 2)
+
+    def testColumn(self):
+        name = dns.name.Name([b'a\x00b', b'\x01\x01', b'test', b''])
+        column = providers.sqlite.keyColumn(nametrie.nameKey(name))
+
+        self.assertEqual(column.count(b'\x00'), 3)
+        self.assertEqual(providers.sqlite.columnName(column), name)
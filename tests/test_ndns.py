@@ -0,0 +1,862 @@
+"""
+Copyright (c) 2012, Nicholas Steicke
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this
+   list of conditions and the following disclaimer.
+2. Redistributions in binary form must reproduce the above copyright notice,
+   this list of conditions and the following disclaimer in the documentation
+   and/or other materials provided with the distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+The views and conclusions contained in the software and documentation are those
+of the authors and should not be interpreted as representing official policies,
+either expressed or implied, of the project author/s.
+"""
+
+import asyncio
+import io
+import os
+import os.path
+import signal
+import socket
+import struct
+import threading
+import time
+import unittest
+
+import dns.edns
+import dns.exception
+import dns.flags
+import dns.message
+import dns.name
+import dns.query
+import dns.rcode
+import dns.rdata
+import dns.rdataclass
+import dns.rdatatype
+import dns.update
+import dns.zone
+
+import ndns
+from providers import file
+
+examplePath = os.path.join(
+    os.path.dirname(__file__),
+    '..', 'providers', 'example.txt'
+)
+
+
+def freePort():
+    # the server needs the port for both UDP and TCP
+    while True:
+        udp = socket.socket(socket.AF_INET6, socket.SOCK_DGRAM)
+        tcp = socket.socket(socket.AF_INET6, socket.SOCK_STREAM)
+        try:
+            udp.bind(('::', 0))
+            port = udp.getsockname()[1]
+            tcp.bind(('::', port))
+            return port
+        except OSError:
+            continue
+        finally:
+            udp.close()
+            tcp.close()
+
+
+class ServerTestMixin:
+
+    def setUp(self):
+        self.port = freePort()
+        self.server = self.makeServer(self.port)
+        self.server.registerProvider(file.ZoneFile(examplePath, 'example.'))
+
+        self.thread = threading.Thread(target=self.server.run)
+        self.thread.start()
+
+        # wait for the sockets to be bound
+        for i in range(100):
+            if self.server.tcp is not None:
+                break
+            time.sleep(0.01)
+
+    def tearDown(self):
+        self.server.stop()
+        self.thread.join(5)
+
+    def testUdp(self):
+        q = dns.message.make_query('c.example.', dns.rdatatype.A)
+        r = dns.query.udp(q, '::1', port=self.port, timeout=5)
+
+        self.assertEqual(r.id, q.id)
+        self.assertEqual(r.answer[0][0].address, '73.80.65.49')
+
+    def testLargeUdpQuery(self):
+        # queries may be larger than the responses the server sends
+        q = dns.message.make_query(
+            'c.example.',
+            dns.rdatatype.A,
+            use_edns=0,
+            payload=4096,
+            options=[dns.edns.GenericOption(65001, b'\0' * 2000)]
+        )
+        r = dns.query.udp(q, '::1', port=self.port, timeout=5)
+
+        self.assertEqual(r.id, q.id)
+        self.assertEqual(r.answer[0][0].address, '73.80.65.49')
+
+    def testTcp(self):
+        q = dns.message.make_query('c.example.', dns.rdatatype.A)
+        r = dns.query.tcp(q, '::1', port=self.port, timeout=5)
+
+        self.assertEqual(r.id, q.id)
+        self.assertEqual(r.answer[0][0].address, '73.80.65.49')
+
+    def testUdpBurst(self):
+        s = socket.socket(socket.AF_INET6, socket.SOCK_DGRAM)
+        s.settimeout(5)
+
+        ids = set()
+        for i in range(50):
+            q = dns.message.make_query('c.example.', dns.rdatatype.A)
+            # random ids may repeat, one answer would then go uncounted
+            q.id = i
+            ids.add(q.id)
+            s.sendto(q.to_wire(), ('::1', self.port))
+
+        answered = set()
+        for i in range(len(ids)):
+            r = dns.message.from_wire(s.recv(512))
+            answered.add(r.id)
+
+        s.close()
+
+        self.assertEqual(answered, ids)
+
+    def readTcpMessage(self, s):
+        def recvExactly(size):
+            data = b''
+            while len(data) < size:
+                chunk = s.recv(size - len(data))
+                self.assertTrue(chunk)
+                data += chunk
+            return data
+
+        length = struct.unpack('!H', recvExactly(2))[0]
+        return recvExactly(length)
+
+    def readTcpResponse(self, s):
+        return dns.message.from_wire(self.readTcpMessage(s))
+
+    def testTcpPipelined(self):
+        s = socket.create_connection(('::1', self.port), timeout=5)
+
+        queries = {}
+        data = b''
+        for name in ('c.example.', 'd.example.', 't.example.'):
+            q = dns.message.make_query(name, dns.rdatatype.A)
+            queries[q.id] = name
+            wire = q.to_wire()
+            data += struct.pack('!H', len(wire)) + wire
+
+        # several queries in one segment, the last split over two
+        s.sendall(data[:-5])
+        time.sleep(0.05)
+        s.sendall(data[-5:])
+
+        answered = {}
+        for i in range(len(queries)):
+            r = self.readTcpResponse(s)
+            answered[r.id] = r.question[0].name.to_text()
+        self.assertEqual(answered, queries)
+
+        # the connection stays open for more queries
+        q = dns.message.make_query('f.example.', dns.rdatatype.A)
+        wire = q.to_wire()
+        s.sendall(struct.pack('!H', len(wire)) + wire)
+        s.shutdown(socket.SHUT_WR)
+
+        r = self.readTcpResponse(s)
+        self.assertEqual(r.id, q.id)
+        self.assertEqual(r.answer[0][0].address, '73.80.65.52')
+
+        self.assertEqual(s.recv(1), b'')
+        s.close()
+
+    def testTcpIdleTimeout(self):
+        self.server.tcpIdleTimeout = 0.2
+
+        with socket.create_connection(('::1', self.port), timeout=5) as s:
+            # http://www.ietf.org/rfc/rfc7766.txt
+            # 6.2.3.
+            self.assertEqual(s.recv(1), b'')
+
+    def testNoProvider(self):
+        q = dns.message.make_query('example.org.', dns.rdatatype.A)
+        r = dns.query.udp(q, '::1', port=self.port, timeout=5)
+
+        self.assertEqual(r.rcode(), dns.rcode.NXDOMAIN)
+
+    def addTransferZone(self):
+        text = '@ 300 SOA ns hostmaster 1 2 3 4 5\n@ 300 NS ns\n'
+        for i in range(2000):
+            text += 'r%d 300 TXT "%s"\n' % (i, 'x' * 100)
+
+        zone = file.ZoneFile(io.StringIO(text), 'xfr.',
+                             allowTransfer=['::1/128', '127.0.0.1/32'])
+        self.server.registerProvider(zone)
+        return zone
+
+    def testAxfr(self):
+        zone = self.addTransferZone()
+
+        messages = list(dns.query.xfr('::1', 'xfr.', port=self.port,
+                                      timeout=5, relativize=False))
+        received = dns.zone.from_xfr(iter(messages), relativize=False)
+
+        self.assertGreater(len(messages), 3)
+        self.assertEqual(received, zone.state.data)
+
+        # the connection is answered in order after a transfer
+        self.testTcp()
+
+    def testTransferBackpressure(self):
+        provider = StreamProvider(1000, 60000)
+        self.server.registerProvider(provider)
+
+        s = socket.create_connection(('::1', self.port), timeout=5)
+        wire = dns.message.make_query('stream.example.',
+                                      dns.rdatatype.AXFR).to_wire()
+        s.sendall(struct.pack('!H', len(wire)) + wire)
+
+        # messages are only built as the client takes them, so one that
+        # isn't reading holds up no more than the socket buffers do
+        time.sleep(0.5)
+        self.assertLess(provider.produced, 500)
+
+        for i in range(1000):
+            self.assertEqual(self.readTcpMessage(s)[:4],
+                             struct.pack('!I', i))
+        s.close()
+
+    def testAxfrRefused(self):
+        self.assertRaises(
+            dns.query.TransferError,
+            lambda: list(dns.query.xfr('::1', 'example.', port=self.port,
+                                       timeout=5))
+        )
+
+        self.addTransferZone()
+        q = dns.message.make_query('xfr.', dns.rdatatype.AXFR)
+        r = dns.query.udp(q, '::1', port=self.port, timeout=5)
+
+        self.assertEqual(r.rcode(), dns.rcode.FORMERR)
+
+    def testUpdate(self):
+        zone = file.ZoneFile(
+            io.StringIO('@ 300 SOA ns hostmaster 1 2 3 4 5\n@ 300 NS ns\n'),
+            'dyn.',
+            allowUpdate=['::1/128']
+        )
+        self.server.registerProvider(zone)
+
+        q = dns.message.make_query('host.dyn.', dns.rdatatype.A)
+        r = dns.query.udp(q, '::1', port=self.port, timeout=5)
+        self.assertEqual(r.rcode(), dns.rcode.NXDOMAIN)
+
+        update = dns.update.UpdateMessage('dyn.')
+        update.add('host', 60, 'A', '192.0.2.10')
+        r = dns.query.tcp(update, '::1', port=self.port, timeout=5)
+        self.assertEqual(r.rcode(), dns.rcode.NOERROR)
+
+        # cached answers from before the update are dropped
+        r = dns.query.udp(q, '::1', port=self.port, timeout=5)
+        self.assertEqual(r.answer[0][0].to_text(), '192.0.2.10')
+
+        update = dns.update.UpdateMessage('example.')
+        update.add('host', 60, 'A', '192.0.2.10')
+        r = dns.query.udp(update, '::1', port=self.port, timeout=5)
+        self.assertEqual(r.rcode(), dns.rcode.REFUSED)
+
+
+class NdnsTest(ServerTestMixin, unittest.TestCase):
+
+    def makeServer(self, port):
+        return ndns.Ndns('::', port, workers=2)
+
+    def testLoopSurvivesErrors(self):
+        readUdp = self.server.readUdp
+
+        def failOnce():
+            self.server.readUdp = readUdp
+            raise RuntimeError('boom')
+
+        self.server.readUdp = failOnce
+
+        # the query left in the socket is read on the next pass
+        q = dns.message.make_query('c.example.', dns.rdatatype.A)
+        with self.assertLogs('DNS', 'ERROR'):
+            r = dns.query.udp(q, '::1', port=self.port, timeout=5)
+
+        self.assertEqual(r.answer[0][0].address, '73.80.65.49')
+
+    def testIdle(self):
+        start = time.process_time()
+        time.sleep(0.5)
+
+        self.assertLess(time.process_time() - start, 0.1)
+
+
+class AsyncNdnsTest(ServerTestMixin, unittest.TestCase):
+
+    def makeServer(self, port):
+        return ndns.AsyncNdns('::', port, workers=2)
+
+    def testOverload(self):
+        self.server.maxPending = 0
+
+        q = dns.message.make_query('c.example.', dns.rdatatype.A)
+        r = dns.query.udp(q, '::1', port=self.port, timeout=5)
+
+        self.assertEqual(r.rcode(), dns.rcode.SERVFAIL)
+
+    def testOverloadDrop(self):
+        self.server.maxPending = 0
+        self.server.overload = ndns.OVERLOAD_DROP
+
+        q = dns.message.make_query('c.example.', dns.rdatatype.A)
+        self.assertRaises(
+            dns.exception.Timeout,
+            dns.query.udp, q, '::1', port=self.port, timeout=0.2
+        )
+
+
+class TxtProvider:
+
+    zone = dns.name.from_text('big.example.')
+
+    def getZones(self, clientaddress):
+        return [self.zone]
+
+    def getResponse(self, request, clientaddress):
+        response = dns.message.make_response(request)
+        rrset = response.find_rrset(
+            response.answer,
+            request.question[0].name,
+            dns.rdataclass.IN,
+            dns.rdatatype.TXT,
+            create=True
+        )
+        for i in range(10):
+            rrset.add(dns.rdata.from_text(
+                dns.rdataclass.IN,
+                dns.rdatatype.TXT,
+                '"%s"' % ('%02d' % (i, ) * 50, )
+            ), 300)
+
+        return response
+
+    def getFilters(self):
+        return []
+
+
+class StreamProvider:
+    '''
+    Transfers count messages of size bytes, each starting with its number.
+    '''
+
+    zone = dns.name.from_text('stream.example.')
+
+    def __init__(self, count, size):
+        self.count = count
+        self.size = size
+        self.produced = 0
+
+    def getZones(self, clientaddress):
+        return [self.zone]
+
+    def getTransfer(self, request, isUdp, clientaddress):
+        return self.messages()
+
+    def messages(self):
+        for i in range(self.count):
+            self.produced += 1
+            yield struct.pack('!I', i) + bytes(self.size)
+
+    def getFilters(self):
+        return []
+
+
+class StubTransport:
+
+    def __init__(self):
+        self.closed = False
+        self.written = []
+
+    def get_extra_info(self, name):
+        return ('::1', 5353, 0, 0)
+
+    def get_write_buffer_size(self):
+        return 0
+
+    def is_closing(self):
+        return self.closed
+
+    def write(self, data):
+        self.written.append(data)
+
+    def close(self):
+        self.closed = True
+
+
+class StreamProtocolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.addCleanup(self.loop.close)
+
+        self.server = ndns.AsyncNdns('::', 0)
+        self.server.loop = self.loop
+        self.server.overload = ndns.OVERLOAD_DROP
+        self.futures = []
+        self.server.dispatch = self.dispatch
+
+        self.transport = StubTransport()
+        self.protocol = ndns.DnsStreamProtocol(self.server)
+        self.protocol.connection_made(self.transport)
+
+    def dispatch(self, request, isUdp, clientaddress, callback):
+        if self.server.maxPending == 0:
+            return None
+
+        future = self.loop.create_future()
+        self.futures.append(future)
+        return future
+
+    def send(self):
+        data = dns.message.make_query('c.example.', dns.rdatatype.A).to_wire()
+        self.protocol.data_received(struct.pack('!H', len(data)) + data)
+
+    def testOverloadClose(self):
+        self.server.maxPending = 0
+        self.send()
+
+        self.assertTrue(self.transport.closed)
+        self.assertEqual(self.protocol.pending, 0)
+
+    def testConnectionLost(self):
+        self.send()
+        self.assertEqual(self.protocol.pending, 1)
+
+        self.protocol.connection_lost(None)
+
+        # the query is dropped along with the idle timer
+        self.assertTrue(self.futures[0].cancelled())
+        self.assertEqual(self.protocol.pending, 0)
+        self.assertIsNone(self.protocol.timer)
+
+
+class EdnsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ndns.Ndns('::', 0, ednsPayload=1232)
+        self.server.registerProvider(TxtProvider())
+
+    def query(self, isUdp, **kwargs):
+        q = dns.message.make_query(
+            'big.example.',
+            dns.rdatatype.TXT,
+            **kwargs
+        )
+        wire = self.server.handleRequest(q.to_wire(), isUdp, None)
+        return wire, dns.message.from_wire(wire)
+
+    def testNoEdnsTruncated(self):
+        wire, r = self.query(True)
+
+        self.assertLessEqual(len(wire), 512)
+        self.assertTrue(r.flags & dns.flags.TC)
+        self.assertEqual(r.answer, [])
+        self.assertEqual(r.edns, -1)
+
+    def testEdnsFits(self):
+        wire, r = self.query(True, use_edns=0, payload=4096)
+
+        self.assertFalse(r.flags & dns.flags.TC)
+        self.assertEqual(len(r.answer[0]), 10)
+        self.assertEqual(r.edns, 0)
+        self.assertEqual(r.payload, 1232)
+
+    def testEdnsCappedByServer(self):
+        self.server.ednsPayload = 1024
+
+        wire, r = self.query(True, use_edns=0, payload=4096)
+
+        self.assertLessEqual(len(wire), 1024)
+        self.assertTrue(r.flags & dns.flags.TC)
+
+    def testTcpNotTruncated(self):
+        wire, r = self.query(False)
+
+        self.assertFalse(r.flags & dns.flags.TC)
+        self.assertEqual(len(r.answer[0]), 10)
+
+    def testDoBitCopied(self):
+        wire, r = self.query(
+            True,
+            use_edns=0,
+            payload=4096,
+            want_dnssec=True
+        )
+
+        self.assertTrue(r.ednsflags & dns.flags.DO)
+
+    def testBadVersion(self):
+        wire, r = self.query(True, use_edns=1)
+
+        self.assertEqual(r.rcode(), dns.rcode.BADVERS)
+
+
+class ZonesProvider:
+
+    def __init__(self, *zones):
+        self.zones = [dns.name.from_text(z) for z in zones]
+
+    def getZones(self, clientaddress):
+        return self.zones
+
+
+class ViewProvider:
+
+    def getView(self, clientaddress):
+        return clientaddress == 'inside'
+
+    def getZones(self, clientaddress):
+        if clientaddress == 'inside':
+            return [dns.name.from_text('corp.example.')]
+        return []
+
+
+class RoutingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ndns.Ndns('::', 0)
+        self.outer = ZonesProvider('example.', 'example.org.')
+        self.inner = ZonesProvider('sub.example.')
+        self.server.registerProvider(self.outer)
+        self.server.registerProvider(self.inner)
+
+    def find(self, name, clientaddress=None):
+        return self.server.findProvider(
+            dns.name.from_text(name),
+            clientaddress
+        )
+
+    def testLongestMatch(self):
+        self.assertIs(self.find('www.example.'), self.outer)
+        self.assertIs(self.find('www.SUB.example.'), self.inner)
+        self.assertIs(self.find('example.org.'), self.outer)
+        self.assertIsNone(self.find('example.com.'))
+
+    def testFirstRegisteredWins(self):
+        self.server.registerProvider(ZonesProvider('sub.example.'))
+
+        self.assertIs(self.find('sub.example.'), self.inner)
+
+    def testUnregister(self):
+        self.server.unregisterProvider(self.inner)
+
+        self.assertIs(self.find('www.sub.example.'), self.outer)
+
+    def testViews(self):
+        view = ViewProvider()
+        self.server.registerProvider(view)
+
+        self.assertIs(self.find('a.corp.example.', 'inside'), view)
+        self.assertIs(self.find('a.corp.example.', 'outside'), self.outer)
+        self.assertEqual(len(self.server.routes[2]), 2)
+
+
+class CountingProvider(file.ZoneFile):
+
+    queries = 0
+
+    def getResponse(self, request, clientaddress):
+        self.queries += 1
+        return super().getResponse(request, clientaddress)
+
+
+class CacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ndns.Ndns('::', 0)
+        self.provider = CountingProvider(examplePath, 'example.')
+        self.server.registerProvider(self.provider)
+
+    def query(self, name, rdtype=dns.rdatatype.A, isUdp=True, **kwargs):
+        q = dns.message.make_query(name, rdtype, **kwargs)
+        r = dns.message.from_wire(
+            self.server.handleRequest(q.to_wire(), isUdp, None)
+        )
+
+        self.assertEqual(r.id, q.id)
+        self.assertEqual(r.question[0].name.labels, q.question[0].name.labels)
+        return r
+
+    def testHit(self):
+        first = self.query('c.example.')
+        second = self.query('C.EXAMPLE.')
+
+        self.assertEqual(self.provider.queries, 1)
+        self.assertEqual(first.answer, second.answer)
+        self.assertEqual(self.server.cache.getStats()['hits'], 1)
+
+    def testKeyedOnQuestionAndTransport(self):
+        self.query('c.example.')
+        self.query('c.example.', dns.rdatatype.TXT)
+        self.query('d.example.')
+        self.query('c.example.', isUdp=False)
+        self.query('c.example.', use_edns=0)
+
+        self.assertEqual(self.provider.queries, 5)
+
+    def testChangedDuringLookup(self):
+        lookup = self.provider.getResponse
+
+        def reloading(request, clientaddress):
+            # the zone is reloaded while this answer is being built
+            self.server.providerChanged(self.provider)
+            return lookup(request, clientaddress)
+
+        self.provider.getResponse = reloading
+        self.query('c.example.')
+        del self.provider.getResponse
+        self.query('c.example.')
+
+        self.assertEqual(self.provider.queries, 2)
+        self.assertEqual(self.server.cache.getStats()['stale'], 1)
+
+    def testNotCacheable(self):
+        self.provider.cacheable = False
+
+        self.query('c.example.')
+        self.query('c.example.')
+
+        self.assertEqual(self.provider.queries, 2)
+
+    def testDisabled(self):
+        self.server = ndns.Ndns('::', 0, cacheSize=0)
+        self.server.registerProvider(self.provider)
+
+        self.query('c.example.')
+        self.query('c.example.')
+
+        self.assertEqual(self.provider.queries, 2)
+        self.assertIsNone(self.server.cache)
+
+    def testProviderChanged(self):
+        self.query('c.example.')
+        self.provider.reload()
+        self.query('c.example.')
+
+        self.assertEqual(self.provider.queries, 2)
+
+        self.server.unregisterProvider(self.provider)
+        self.assertEqual(self.provider.listeners, [])
+
+
+class CompiledZoneTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ndns.Ndns('::', 0, cacheSize=0)
+        self.server.registerProvider(
+            file.ZoneFile(examplePath, 'example.', compiled=True)
+        )
+
+    def testEdns(self):
+        q = dns.message.make_query(
+            'e.example.',
+            dns.rdatatype.A,
+            use_edns=0,
+            payload=4096
+        )
+        r = dns.message.from_wire(
+            self.server.handleRequest(q.to_wire(), True, None)
+        )
+
+        self.assertEqual(r.id, q.id)
+        self.assertEqual(r.edns, 0)
+        self.assertEqual(r.payload, self.server.ednsPayload)
+        self.assertEqual(len(r.answer[0]), 4)
+
+
+class ForkedServer:
+
+    def __init__(self, pipe):
+        self.pipe = pipe
+        self.reusePort = False
+        self.running = True
+
+    def stop(self):
+        self.running = False
+
+    def run(self):
+        os.write(self.pipe, b'%d\n' % (os.getpid(), ))
+        while self.running:
+            time.sleep(0.01)
+
+
+class WorkerSupervisorTest(unittest.TestCase):
+
+    def testRestart(self):
+        r, w = os.pipe()
+        supervisor = ndns.WorkerSupervisor(
+            ForkedServer(w),
+            2,
+            restartDelay=0
+        )
+
+        started = []
+
+        def watch():
+            with os.fdopen(r) as pids:
+                for line in pids:
+                    started.append(int(line))
+                    if len(started) == 2:
+                        os.kill(started[0], signal.SIGKILL)
+                    elif len(started) == 3:
+                        supervisor.stop()
+
+        watcher = threading.Thread(target=watch)
+        watcher.start()
+
+        supervisor.run()
+        os.close(w)
+        watcher.join(5)
+
+        self.assertTrue(supervisor.ndns.reusePort)
+        self.assertEqual(len(started), 3)
+        self.assertEqual(supervisor.children, {})
+
+
+    def testInterrupt(self):
+        r, w = os.pipe()
+        supervisor = ndns.WorkerSupervisor(
+            ForkedServer(w),
+            2,
+            restartDelay=0
+        )
+
+        started = []
+        alive = []
+
+        def isAlive(pid):
+            try:
+                os.kill(pid, 0)
+            except ProcessLookupError:
+                return False
+            return True
+
+        def watch():
+            with os.fdopen(r) as pids:
+                for line in pids:
+                    started.append(int(line))
+                    if len(started) == 2:
+                        os.kill(started[1], signal.SIGINT)
+                    elif len(started) == 3:
+                        alive.extend(isAlive(pid) for pid in started[:2])
+                        supervisor.stop()
+
+        watcher = threading.Thread(target=watch)
+        watcher.start()
+
+        supervisor.run()
+        os.close(w)
+        watcher.join(5)
+
+        # only the interrupted worker stopped, not its sibling
+        self.assertEqual(alive, [True, False])
+
+
+class StubServer:
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.responses = []
+
+    def answerFirst(self, request, isUdp, clientaddress):
+        self.release.wait(5)
+        return request, None
+
+    def queueResponse(self, data, isUdp, clientaddress, messages=None):
+        self.responses.append((data, isUdp, clientaddress))
+
+
+class RequestPoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = StubServer()
+        self.pool = ndns.RequestPool(self.server, workers=1, depth=2)
+        self.pool.start()
+
+    def tearDown(self):
+        self.server.release.set()
+        self.pool.stop()
+
+    def testBackpressure(self):
+        # one request is picked up by the worker, two more fill the queue
+        self.assertTrue(self.pool.submit(b'1', True, 'a'))
+        while self.pool.queue.qsize():
+            time.sleep(0.01)
+
+        self.assertTrue(self.pool.submit(b'2', True, 'a'))
+        self.assertTrue(self.pool.submit(b'3', True, 'a'))
+        self.assertFalse(self.pool.submit(b'4', True, 'a'))
+
+        stats = self.pool.getStats()
+        self.assertEqual(stats['depth'], 2)
+        self.assertEqual(stats['rejected'], 1)
+        self.assertEqual(stats['submitted'], 3)
+
+        self.server.release.set()
+        self.pool.stop()
+
+        self.assertEqual(
+            [r[0] for r in self.server.responses],
+            [b'1', b'2', b'3']
+        )
+        self.assertEqual(self.pool.getStats()['depth'], 0)
+
+
+class OverloadResponseTest(unittest.TestCase):
+
+    def testPolicies(self):
+        q = dns.message.make_query('c.example.', dns.rdatatype.A)
+
+        for policy, rcode in (
+                (ndns.OVERLOAD_SERVFAIL, dns.rcode.SERVFAIL),
+                (ndns.OVERLOAD_REFUSED, dns.rcode.REFUSED)):
+            server = ndns.Ndns('::', 0, overload=policy)
+            r = dns.message.from_wire(server.overloadResponse(q.to_wire()))
+
+            self.assertEqual(r.id, q.id)
+            self.assertEqual(r.rcode(), rcode)
+
+        server = ndns.Ndns('::', 0, overload=ndns.OVERLOAD_DROP)
+        self.assertIsNone(server.overloadResponse(q.to_wire()))
+
+    def testUnknownPolicy(self):
+        self.assertRaises(ValueError, ndns.Ndns, '::', 0, overload='nope')
@@ -0,0 +1,133 @@
+"""
+Copyright (c) 2012, Nicholas Steicke
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this
+   list of conditions and the following disclaimer.
+2. Redistributions in binary form must reproduce the above copyright notice,
+   this list of conditions and the following disclaimer in the documentation
+   and/or other materials provided with the distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+The views and conclusions contained in the software and documentation are those
+of the authors and should not be interpreted as representing official policies,
+either expressed or implied, of the project author/s.
+"""
+
+import collections
+import threading
+import time
+
+# Rough per entry cost of the key, tuple and dict slot, added to the length
+# of the cached response when accounting against the byte budget.
+ENTRY_OVERHEAD = 200
+
+
+class ResponseCache:
+    '''
+    Cache of wire format responses. Entries expire after their TTL and the
+    least recently used are evicted once the cached bytes exceed maxBytes.
+    Safe to share between threads.
+
+    Every clear() starts a new generation. A lookup that reads generation
+    before it starts and hands it to put() is not cached if the data was
+    cleared meanwhile, since its answer may come from before the change.
+    '''
+
+    def __init__(self, maxBytes=32 * 1024 * 1024, maxTtl=3600):
+        self.maxBytes = maxBytes
+        self.maxTtl = maxTtl
+
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.size = 0
+        self.generation = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.stale = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        now = time.monotonic()
+
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            data, expires = entry
+            if expires <= now:
+                del self.entries[key]
+                self.size -= len(data) + ENTRY_OVERHEAD
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+
+            return data
+
+    def put(self, key, data, ttl, generation=None):
+        ttl = min(ttl, self.maxTtl)
+        cost = len(data) + ENTRY_OVERHEAD
+
+        if ttl <= 0 or cost > self.maxBytes:
+            return
+
+        expires = time.monotonic() + ttl
+
+        with self.lock:
+            if generation is not None and generation != self.generation:
+                self.stale += 1
+                return
+
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old[0]) + ENTRY_OVERHEAD
+
+            self.entries[key] = (data, expires)
+            self.size += cost
+
+            while self.size > self.maxBytes:
+                evicted, (data, expires) = self.entries.popitem(last=False)
+                self.size -= len(data) + ENTRY_OVERHEAD
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+            self.generation += 1
+
+    def getStats(self):
+        with self.lock:
+            return {
+                'entries': len(self.entries),
+                'bytes': self.size,
+                'maxBytes': self.maxBytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'stale': self.stale,
+            }
@@ -27,8 +27,26 @@ of the authors and should not be interpreted as representing official policies,
 either expressed or implied, of the project author/s.
 """
 
+import binascii
+
+import dns.exception
+import dns.ipv6
 import dns.name
 
+"""
+Conversions between IPv6 addresses, the nibble labels of their names below
+ip6.arpa and host labels naming them as the groups of the address joined by
+'-', such as 2001-0db8-0000-0000-0000-0000-0000-0001. Labels are expected
+lower cased, as utils.nametrie keys hold them.
+"""
+
+# Characters a lower cased nibble label may be, deleted by bytes.translate
+# to find any that are not
+HEX_DIGITS = b'0123456789abcdef'
+
+# Where the '-' between groups sit in a host label of eight full groups
+GROUP_SEPARATORS = b'-' * 7
+
 
 def prefixToReverseName(v6prefix):
     v6bits = v6prefix.strip(':').split(':')
@@ -37,3 +55,51 @@ def prefixToReverseName(v6prefix):
     v6bits.reverse()
 
     return dns.name.Name(v6bits + ['ip6', 'arpa', ''])
+
+
+def prefixToAddress(v6prefix):
+    '''
+    Returns the bytes of the whole groups written in v6prefix, which every
+    address within the prefix starts with.
+    '''
+
+    v6bits = v6prefix.strip(':').split(':')
+    return binascii.unhexlify(''.join(x.rjust(4, '0') for x in v6bits))
+
+
+def nibblesToLabel(nibbles):
+    '''
+    Returns the host label for the nibble labels of a name below ip6.arpa,
+    given most significant first: their digits in groups of four joined by
+    '-'. Returns None if a label is not a single hex digit, or if there
+    are more nibbles than the 32 of an address, whose label would outgrow
+    the 63 bytes a label may hold.
+    '''
+
+    digits = b''.join(nibbles)
+    if not nibbles or len(nibbles) > 32 or len(digits) != len(nibbles) \
+            or digits.translate(None, HEX_DIGITS):
+        return None
+
+    return b'-'.join([digits[i:i + 4] for i in range(0, len(digits), 4)])
+
+
+def labelToAddress(label):
+    '''
+    Returns the 16 bytes of the IPv6 address written in a host label, its
+    groups joined by '-' with '--' for '::', or None if it is not one.
+    '''
+
+    # The eight full groups nibblesToLabel writes are decoded by slicing
+    # and table lookups, anything shorter by the full parser
+    if len(label) == 39 and label[4::5] == GROUP_SEPARATORS:
+        digits = label.translate(None, b'-')
+        if len(digits) != 32 or digits.translate(None, HEX_DIGITS):
+            return None
+
+        return binascii.unhexlify(digits)
+
+    try:
+        return dns.ipv6.inet_aton(label.replace(b'-', b':'))
+    except dns.exception.SyntaxError:
+        return None
@@ -0,0 +1,442 @@
+"""
+Copyright (c) 2012, Nicholas Steicke
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this
+   list of conditions and the following disclaimer.
+2. Redistributions in binary form must reproduce the above copyright notice,
+   this list of conditions and the following disclaimer in the documentation
+   and/or other materials provided with the distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+The views and conclusions contained in the software and documentation are those
+of the authors and should not be interpreted as representing official policies,
+either expressed or implied, of the project author/s.
+"""
+
+import collections
+import logging
+import os
+import struct
+import threading
+import zlib
+
+import dns.name
+import dns.node
+
+from utils import zonestore
+
+"""
+Changes made to a zone, kept so that secondaries can be sent just what
+changed since the serial they hold, and written to an append only file
+so that dynamic updates survive a restart.
+"""
+
+logger = logging.getLogger('DNS.Journal')
+
+MAGIC = b'NDNSJRNL'
+VERSION = 1
+
+HEADER = struct.Struct('!8sH')
+# Each record is its length and CRC-32 followed by the packed delta
+RECORD = struct.Struct('!II')
+COUNT = struct.Struct('!I')
+RDCLASS = struct.Struct('!H')
+
+# Deltas kept per zone unless told otherwise
+DEFAULT_DELTAS = 64
+
+
+def serialOf(soa):
+    return soa[0].serial
+
+
+def serialGreater(a, b):
+    '''
+    Whether serial a is newer than serial b.
+    '''
+
+    # http://www.ietf.org/rfc/rfc1982.txt
+    # 3.2.
+    return a != b and ((a - b) & 0xffffffff) < 0x80000000
+
+
+class Delta:
+    '''
+    One change to a zone, from the version with SOA oldSoa to the version
+    with SOA newSoa. removed and added are lists of (name, rdataset)
+    without the SOA itself.
+    '''
+
+    __slots__ = ('oldSoa', 'newSoa', 'removed', 'added')
+
+    def __init__(self, oldSoa, newSoa, removed, added):
+        self.oldSoa = oldSoa
+        self.newSoa = newSoa
+        self.removed = removed
+        self.added = added
+
+
+class Journal:
+    '''
+    The most recent maxDeltas changes to a zone, oldest first. Safe to
+    share between threads.
+    '''
+
+    def __init__(self, maxDeltas=DEFAULT_DELTAS):
+        self.deltas = collections.deque(maxlen=maxDeltas)
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.deltas)
+
+    def append(self, oldSoa, newSoa, removed, added):
+        '''
+        Records a change. A change that does not carry on from the last one
+        recorded starts the journal afresh.
+        '''
+
+        delta = Delta(oldSoa, newSoa, removed, added)
+
+        with self.lock:
+            if self.deltas and \
+                    serialOf(self.deltas[-1].newSoa) != serialOf(oldSoa):
+                self.deltas.clear()
+
+            self.deltas.append(delta)
+
+    def clear(self):
+        with self.lock:
+            self.deltas.clear()
+
+    def since(self, serial, until=None):
+        '''
+        Returns the deltas leading from serial to serial until, or to the
+        latest version, or None if the journal does not cover that span.
+        '''
+
+        with self.lock:
+            deltas = list(self.deltas)
+
+        start = None
+        for index, delta in enumerate(deltas):
+            if start is None and serialOf(delta.oldSoa) == serial:
+                start = index
+
+            if start is not None and until is not None \
+                    and serialOf(delta.newSoa) == until:
+                return deltas[start:index + 1]
+
+        if start is None or until is not None:
+            return None
+
+        return deltas[start:]
+
+
+def packRdatasets(rdatasets):
+    '''
+    Packs a list of (name, rdataset) as their count, then per rdataset its
+    uncompressed owner name and its length and utils.zonestore.packNode
+    encoding.
+    '''
+
+    packed = [COUNT.pack(len(rdatasets))]
+    for name, rdataset in rdatasets:
+        node = dns.node.Node()
+        node.rdatasets.append(rdataset)
+        data = zonestore.packNode(node)
+
+        packed.append(name.to_wire())
+        packed.append(COUNT.pack(len(data)))
+        packed.append(data)
+
+    return b''.join(packed)
+
+
+def unpackRdatasets(data, offset, rdclass):
+    '''
+    Decodes rdatasets packed by packRdatasets starting at offset in data.
+    Returns them and the offset after them.
+    '''
+
+    count = COUNT.unpack_from(data, offset)[0]
+    offset += COUNT.size
+
+    rdatasets = []
+    for i in range(count):
+        name, used = dns.name.from_wire(data, offset)
+        offset += used
+        length = COUNT.unpack_from(data, offset)[0]
+        offset += COUNT.size
+
+        node = zonestore.unpackNode(data, offset, rdclass)
+        rdatasets.append((name, node.rdatasets[0]))
+        offset += length
+
+    return rdatasets, offset
+
+
+def packDelta(delta, origin):
+    rdclass = delta.newSoa.rdclass
+    return b''.join((
+        RDCLASS.pack(rdclass),
+        packRdatasets([(origin, delta.oldSoa), (origin, delta.newSoa)]),
+        packRdatasets(delta.removed),
+        packRdatasets(delta.added),
+    ))
+
+
+def unpackDelta(data):
+    rdclass = RDCLASS.unpack_from(data, 0)[0]
+    soas, offset = unpackRdatasets(data, RDCLASS.size, rdclass)
+    removed, offset = unpackRdatasets(data, offset, rdclass)
+    added, offset = unpackRdatasets(data, offset, rdclass)
+
+    return Delta(soas[0][1], soas[1][1], removed, added)
+
+
+class JournalFile:
+    '''
+    An append only file of the Deltas made to a zone. Appending only
+    queues a delta, sync makes it durable. Deltas appended while another
+    thread is syncing are written and synced together by the next caller,
+    so a burst of updates costs one fsync rather than one each. A failed
+    write loses the deltas queued at the time, which are cut from the
+    file again, and later deltas are written as usual. Safe to share
+    between threads.
+    '''
+
+    def __init__(self, path, origin):
+        self.path = path
+        self.origin = origin
+
+        self.condition = threading.Condition()
+        self.pending = []
+        self.appended = 0
+        self.synced = 0
+        self.syncing = False
+        self.failed = None
+        # (first, last, error) of the runs of deltas lost to failed writes
+        self.lost = []
+
+        self.records = 0
+        self.syncs = 0
+
+        self.recover()
+        self.size = os.path.getsize(path)
+        self.file = open(path, 'ab')
+
+    def recover(self):
+        '''
+        Starts a new file, or cuts a record left half written by a crash
+        from the end of an existing one.
+        '''
+
+        if not os.path.exists(self.path) \
+                or os.path.getsize(self.path) < HEADER.size:
+            with open(self.path, 'wb') as f:
+                f.write(HEADER.pack(MAGIC, VERSION))
+                f.flush()
+                os.fsync(f.fileno())
+            return
+
+        end, records = self.scan()
+        self.records = len(records)
+        if end < os.path.getsize(self.path):
+            logger.warning('Dropping a damaged record at the end of %s' % (
+                self.path,
+            ))
+            os.truncate(self.path, end)
+
+    def scan(self):
+        '''
+        Returns the offset the intact records of the file end at and the
+        records themselves.
+        '''
+
+        with open(self.path, 'rb') as f:
+            data = f.read()
+
+        magic, version = HEADER.unpack_from(data, 0)
+        if magic != MAGIC:
+            raise ValueError('%s is not a zone journal' % (self.path, ))
+        if version != VERSION:
+            raise ValueError(
+                'Unsupported zone journal version %s' % (version, )
+            )
+
+        records = []
+        offset = HEADER.size
+        while offset + RECORD.size <= len(data):
+            length, crc = RECORD.unpack_from(data, offset)
+            start = offset + RECORD.size
+            record = data[start:start + length]
+            if len(record) != length or zlib.crc32(record) != crc:
+                break
+
+            records.append(record)
+            offset = start + length
+
+        return offset, records
+
+    def read(self):
+        '''
+        Returns every delta in the file, oldest first, once those still
+        waiting have been written.
+        '''
+
+        self.flush()
+
+        return [unpackDelta(record) for record in self.scan()[1]]
+
+    def append(self, delta):
+        '''
+        Queues delta to be written. Returns the number to pass to sync to
+        wait until it is on disk.
+        '''
+
+        record = packDelta(delta, self.origin)
+
+        with self.condition:
+            self.pending.append(RECORD.pack(len(record), zlib.crc32(record)))
+            self.pending.append(record)
+            self.appended += 1
+            self.records += 1
+            return self.appended
+
+    def lostError(self, sequence):
+        '''
+        Returns why the delta numbered sequence was lost, or None if it
+        wasn't. Call holding condition.
+        '''
+
+        for first, last, error in self.lost:
+            if first <= sequence <= last:
+                return error
+
+        return None
+
+    def isLost(self, sequence):
+        '''
+        Whether the delta numbered sequence will never reach the file.
+        '''
+
+        with self.condition:
+            if self.failed is not None and sequence > self.synced:
+                return True
+
+            return self.lostError(sequence) is not None
+
+    def sync(self, sequence):
+        '''
+        Returns once the delta numbered sequence and every one before it is
+        on disk. Raises OSError if writing the delta has failed.
+        '''
+
+        with self.condition:
+            while self.syncing and self.synced < sequence:
+                self.condition.wait()
+
+            if self.failed is not None:
+                raise OSError('Writing %s failed: %s' % (
+                    self.path,
+                    self.failed
+                ))
+
+            error = self.lostError(sequence)
+            if error is not None:
+                raise OSError('Writing %s failed: %s' % (self.path, error))
+
+            if self.synced >= sequence:
+                return
+
+            # Everything queued so far goes out with this fsync
+            self.syncing = True
+            pending = b''.join(self.pending)
+            self.pending = []
+            upto = self.appended
+
+        try:
+            self.file.write(pending)
+            self.file.flush()
+            os.fsync(self.file.fileno())
+        except Exception as e:
+            with self.condition:
+                self.discard(e)
+                self.syncing = False
+                self.condition.notify_all()
+            raise
+
+        with self.condition:
+            self.synced = upto
+            self.size += len(pending)
+            self.syncing = False
+            self.syncs += 1
+            self.condition.notify_all()
+
+    def discard(self, error):
+        '''
+        Drops every delta not yet on disk after a failed write, cutting
+        whatever part of them reached the file. Call holding condition.
+        '''
+
+        logger.error('Writing %s failed: %s' % (self.path, error))
+
+        self.lost.append((self.synced + 1, self.appended, error))
+        self.records -= self.appended - self.synced
+        self.pending = []
+
+        try:
+            try:
+                self.file.close()
+            except OSError:
+                pass
+            os.truncate(self.path, self.size)
+            self.file = open(self.path, 'ab')
+        except OSError as e:
+            # the file can't be trusted to hold only whole deltas
+            self.failed = e
+
+    def flush(self):
+        '''
+        Writes and syncs every delta still waiting.
+        '''
+
+        with self.condition:
+            sequence = self.appended
+            if self.lostError(sequence) is not None:
+                # nothing was queued since the last failed write
+                return
+
+        self.sync(sequence)
+
+    def truncate(self):
+        '''
+        Empties the file once the deltas in it are held elsewhere, such as
+        in a snapshot of the zone.
+        '''
+
+        self.flush()
+
+        with self.condition:
+            self.file.truncate(HEADER.size)
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.size = HEADER.size
+            self.records = 0
+
+    def close(self):
+        self.file.close()
@@ -0,0 +1,230 @@
+"""
+Copyright (c) 2012, Nicholas Steicke
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this
+   list of conditions and the following disclaimer.
+2. Redistributions in binary form must reproduce the above copyright notice,
+   this list of conditions and the following disclaimer in the documentation
+   and/or other materials provided with the distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+The views and conclusions contained in the software and documentation are those
+of the authors and should not be interpreted as representing official policies,
+either expressed or implied, of the project author/s.
+"""
+
+WILDCARD = b'*'
+
+
+def nameKey(name):
+    '''
+    Returns the trie key for a dns.name.Name, its labels lower cased and
+    ordered from the root down, without the empty root label.
+    '''
+
+    return tuple(label.lower() for label in reversed(name.labels) if label)
+
+
+class NameTrieNode:
+
+    __slots__ = ('children', 'value', 'hasValue')
+
+    def __init__(self):
+        self.children = {}
+        self.value = None
+        self.hasValue = False
+
+
+class NameTrie:
+    '''
+    Maps DNS names to values with one trie level per label, starting at the
+    root. Finding the longest stored name that a query name is equal to or
+    below takes a single walk down the query's labels, however many names
+    are stored.
+    '''
+
+    def __init__(self):
+        self.root = NameTrieNode()
+        self.size = 0
+
+        # ids of the nodes a clone may change in place, None when it owns
+        # them all
+        self.owned = None
+
+    def __len__(self):
+        return self.size
+
+    def clone(self):
+        '''
+        Returns a trie sharing every node with this one. Changes to the
+        clone copy the nodes along the path they touch first, so this trie
+        is never changed by them and can go on being read meanwhile.
+        '''
+
+        trie = NameTrie()
+        trie.root = self.root
+        trie.size = self.size
+        trie.owned = set()
+
+        return trie
+
+    def own(self, node):
+        if self.owned is None or id(node) in self.owned:
+            return node
+
+        copy = NameTrieNode()
+        copy.children = dict(node.children)
+        copy.value = node.value
+        copy.hasValue = node.hasValue
+        self.owned.add(id(copy))
+
+        return copy
+
+    def path(self, key):
+        '''
+        Returns the nodes from the root down to key, creating those missing
+        and copying those shared with the trie this was cloned from.
+        '''
+
+        node = self.root = self.own(self.root)
+        nodes = [node]
+        for label in key:
+            child = node.children.get(label)
+            if child is None:
+                child = NameTrieNode()
+                if self.owned is not None:
+                    self.owned.add(id(child))
+            else:
+                child = self.own(child)
+
+            node.children[label] = child
+            node = child
+            nodes.append(node)
+
+        return nodes
+
+    def node(self, key, create=False):
+        if create:
+            return self.path(key)[-1]
+
+        node = self.root
+        for label in key:
+            node = node.children.get(label)
+            if node is None:
+                return None
+
+        return node
+
+    def insert(self, name, value):
+        self.insertKey(nameKey(name), value)
+
+    def insertKey(self, key, value):
+        node = self.node(key, True)
+        if not node.hasValue:
+            self.size += 1
+
+        node.value = value
+        node.hasValue = True
+
+    def removeKey(self, key):
+        '''
+        Removes the value stored for key, and the nodes left with nothing
+        below them. Returns whether there was one.
+        '''
+
+        node = self.node(key)
+        if node is None or not node.hasValue:
+            return False
+
+        nodes = self.path(key)
+        node = nodes[-1]
+        node.value = None
+        node.hasValue = False
+        self.size -= 1
+
+        for depth in range(len(key), 0, -1):
+            node = nodes[depth]
+            if node.hasValue or node.children:
+                break
+
+            del nodes[depth - 1].children[key[depth - 1]]
+
+        return True
+
+    def setdefault(self, name, value):
+        '''
+        Stores value for name unless it already has one, returns the value
+        that ends up stored.
+        '''
+
+        node = self.node(nameKey(name), True)
+        if not node.hasValue:
+            self.size += 1
+            node.value = value
+            node.hasValue = True
+
+        return node.value
+
+    def get(self, name, default=None):
+        node = self.node(nameKey(name))
+        if node is None or not node.hasValue:
+            return default
+
+        return node.value
+
+    def longestMatch(self, name):
+        return self.longestMatchKey(nameKey(name))
+
+    def longestMatchKey(self, key):
+        '''
+        Returns (depth, value) for the deepest stored name that key is equal
+        to or below, depth being its number of labels, or None.
+        '''
+
+        node = self.root
+        match = (0, node.value) if node.hasValue else None
+
+        depth = 0
+        for label in key:
+            node = node.children.get(label)
+            if node is None:
+                break
+
+            depth += 1
+            if node.hasValue:
+                match = (depth, node.value)
+
+        return match
+
+    def closestKey(self, key):
+        '''
+        Returns (depth, node) for the deepest node that exists along key,
+        stored value or not, depth being its number of labels.
+        '''
+
+        node = self.root
+
+        depth = 0
+        for label in key:
+            child = node.children.get(label)
+            if child is None:
+                break
+
+            node = child
+            depth += 1
+
+        return depth, node
@@ -0,0 +1,288 @@
+"""
+Copyright (c) 2012, Nicholas Steicke
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this
+   list of conditions and the following disclaimer.
+2. Redistributions in binary form must reproduce the above copyright notice,
+   this list of conditions and the following disclaimer in the documentation
+   and/or other materials provided with the distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+The views and conclusions contained in the software and documentation are those
+of the authors and should not be interpreted as representing official policies,
+either expressed or implied, of the project author/s.
+"""
+
+import argparse
+import array
+import io
+import mmap
+import os
+import os.path
+import struct
+
+import dns.name
+import dns.rdatatype
+import dns.zone
+
+from utils import nametrie, zonestore
+
+"""
+A binary snapshot of a zone that can be served straight from an mmap.
+
+    header      magic, version, rdclass, name count, origin length
+    origin      the zone origin in wire format
+    offsets     one unsigned 32 bit offset per name, in name order
+    names       owner name in lower cased wire format, rdataset count,
+                then per rdataset its type, covered type, TTL, rdata
+                count and each rdata's length and uncompressed wire format
+
+Names are sorted by their utils.nametrie key, root label first, so that
+a name is found with a binary search over the offsets. Nothing is decoded
+until it is looked up, which keeps opening a snapshot cheap however large
+the zone is.
+
+    python -m utils.snapshot zonefile origin output
+"""
+
+MAGIC = b'NDNSZONE'
+VERSION = 1
+
+HEADER = struct.Struct('!8sHHIH')
+OFFSET = struct.Struct('!I')
+
+
+def isSnapshot(path):
+    with open(path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def dumps(data):
+    '''
+    Returns the snapshot of a dns.zone.Zone as bytes.
+    '''
+
+    return dumpsStore(zonestore.CompactStore.fromZone(data))
+
+
+def dumpsStore(store):
+    '''
+    Returns the snapshot of a utils.zonestore.CompactStore as bytes. Its
+    names are already in order and its nodes already packed the same way.
+    '''
+
+    origin = store.origin.canonicalize().to_wire()
+    count = len(store.keys)
+
+    base = HEADER.size + len(origin) + OFFSET.size * count
+    offsets = io.BytesIO()
+    body = io.BytesIO()
+    ends = list(store.offsets[1:]) + [len(store.packed)]
+    for key, start, end in zip(store.keys, store.offsets, ends):
+        offsets.write(OFFSET.pack(base + body.tell()))
+
+        for label in reversed(key):
+            body.write(bytes((len(label), )))
+            body.write(label)
+        body.write(b'\0')
+        body.write(store.packed[start:end])
+
+    header = HEADER.pack(
+        MAGIC,
+        VERSION,
+        store.rdclass,
+        count,
+        len(origin)
+    )
+
+    return header + origin + offsets.getvalue() + body.getvalue()
+
+
+def loadsStore(data):
+    '''
+    Returns a utils.zonestore.CompactStore holding the zone of snapshot
+    bytes, the reverse of dumpsStore. Nodes are copied as they are packed,
+    only the names are decoded.
+    '''
+
+    snapshot = SnapshotStore.fromBytes(data)
+    count = snapshot.count
+
+    labels = {}
+    keys = []
+    offsets = array.array('Q')
+    packed = bytearray()
+    for index in range(count):
+        names, start = snapshot.labelsAt(snapshot.offsetAt(index))
+        end = len(data)
+        if index + 1 < count:
+            end = snapshot.offsetAt(index + 1)
+
+        keys.append(tuple(labels.setdefault(label, label)
+                          for label in reversed(names)))
+        offsets.append(len(packed))
+        packed += data[start:end]
+
+    return zonestore.CompactStore(
+        snapshot.origin,
+        snapshot.rdclass,
+        keys,
+        offsets,
+        bytes(packed),
+        labels
+    )
+
+
+def write(data, path):
+    '''
+    Writes the snapshot of a dns.zone.Zone to path. The file is written
+    alongside and renamed into place, so a server mapping the old snapshot
+    keeps reading the old file.
+    '''
+
+    temp = '%s.%d.tmp' % (path, os.getpid())
+    try:
+        with open(temp, 'wb') as f:
+            f.write(dumps(data))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp, path)
+    except BaseException:
+        if os.path.exists(temp):
+            os.unlink(temp)
+        raise
+
+
+class SnapshotKeys:
+    '''
+    The sorted name keys of a snapshot as a sequence for bisect.
+    '''
+
+    def __init__(self, store):
+        self.store = store
+
+    def __len__(self):
+        return self.store.count
+
+    def __getitem__(self, index):
+        return self.store.keyAt(index)
+
+
+class SnapshotStore(zonestore.SortedStore):
+    '''
+    Serves a zone from a snapshot file through mmap, with the same lookups
+    as utils.zonestore.TrieStore. Records are decoded each time they are
+    found.
+    '''
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.open(
+                mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ),
+                path
+            )
+
+    @classmethod
+    def fromBytes(cls, data):
+        '''
+        Serves a snapshot held in memory, as returned by dumps.
+        '''
+
+        store = cls.__new__(cls)
+        store.open(data, '<bytes>')
+        return store
+
+    def open(self, data, path):
+        self.map = data
+
+        magic, version, self.rdclass, self.count, originLength = \
+            HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC:
+            raise ValueError('%s is not a zone snapshot' % (path, ))
+        if version != VERSION:
+            raise ValueError(
+                'Unsupported zone snapshot version %s' % (version, )
+            )
+
+        self.offsets = HEADER.size + originLength
+        self.origin = dns.name.from_wire(
+            self.map[HEADER.size:self.offsets],
+            0
+        )[0]
+        self.depth = len(nametrie.nameKey(self.origin))
+        self.keys = SnapshotKeys(self)
+
+        apex = self.findKey(nametrie.nameKey(self.origin))
+        self.soa = apex.node.get_rdataset(self.rdclass, dns.rdatatype.SOA)
+
+    def close(self):
+        if isinstance(self.map, mmap.mmap):
+            self.map.close()
+
+    def getSize(self):
+        # Mapped pages are only resident while in use, this is the most
+        # the snapshot can take
+        return len(self.map)
+
+    def offsetAt(self, index):
+        return OFFSET.unpack_from(
+            self.map,
+            self.offsets + index * OFFSET.size
+        )[0]
+
+    def labelsAt(self, offset):
+        data = self.map
+        labels = []
+        length = data[offset]
+        while length:
+            labels.append(data[offset + 1:offset + 1 + length])
+            offset += length + 1
+            length = data[offset]
+
+        return labels, offset + 1
+
+    def keyAt(self, index):
+        labels = self.labelsAt(self.offsetAt(index))[0]
+        labels.reverse()
+        return tuple(labels)
+
+    def record(self, index):
+        start = self.offsetAt(index)
+        labels, offset = self.labelsAt(start)
+        labels.append(b'')
+
+        return zonestore.ZoneName(
+            dns.name.Name(labels),
+            self.map[start:offset],
+            zonestore.unpackNode(self.map, offset, self.rdclass)
+        )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='write a zone file out as a snapshot'
+    )
+    parser.add_argument('zonefile')
+    parser.add_argument('origin')
+    parser.add_argument('output')
+    args = parser.parse_args()
+
+    write(
+        dns.zone.from_file(args.zonefile, origin=args.origin,
+                           relativize=False),
+        args.output
+    )
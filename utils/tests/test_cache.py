@@ -0,0 +1,114 @@
+"""
+Copyright (c) 2012, Nicholas Steicke
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this
+   list of conditions and the following disclaimer.
+2. Redistributions in binary form must reproduce the above copyright notice,
+   this list of conditions and the following disclaimer in the documentation
+   and/or other materials provided with the distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+The views and conclusions contained in the software and documentation are those
+of the authors and should not be interpreted as representing official policies,
+either expressed or implied, of the project author/s.
+"""
+
+import unittest
+import time
+
+from utils.cache import ResponseCache, ENTRY_OVERHEAD
+
+
+class ResponseCacheTest(unittest.TestCase):
+
+    def testHitMiss(self):
+        cache = ResponseCache()
+
+        self.assertIsNone(cache.get('a'))
+        cache.put('a', b'data', 60)
+        self.assertEqual(cache.get('a'), b'data')
+
+        stats = cache.getStats()
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['bytes'], 4 + ENTRY_OVERHEAD)
+
+    def testExpiry(self):
+        cache = ResponseCache()
+
+        cache.put('a', b'data', 0.01)
+        time.sleep(0.02)
+
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.getStats()['expirations'], 1)
+        self.assertEqual(cache.getStats()['bytes'], 0)
+
+    def testZeroTtlNotCached(self):
+        cache = ResponseCache()
+        cache.put('a', b'data', 0)
+
+        self.assertEqual(len(cache), 0)
+
+    def testMaxTtl(self):
+        cache = ResponseCache(maxTtl=0)
+        cache.put('a', b'data', 60)
+
+        self.assertEqual(len(cache), 0)
+
+    def testLruEviction(self):
+        cache = ResponseCache(maxBytes=3 * (10 + ENTRY_OVERHEAD))
+
+        for key in 'abc':
+            cache.put(key, b'0123456789', 60)
+
+        # touch a so b is the least recently used
+        cache.get('a')
+        cache.put('d', b'0123456789', 60)
+
+        self.assertIsNone(cache.get('b'))
+        self.assertIsNotNone(cache.get('a'))
+        self.assertIsNotNone(cache.get('c'))
+        self.assertIsNotNone(cache.get('d'))
+        self.assertEqual(cache.getStats()['evictions'], 1)
+
+    def testReplace(self):
+        cache = ResponseCache()
+        cache.put('a', b'one', 60)
+        cache.put('a', b'three', 60)
+
+        self.assertEqual(cache.get('a'), b'three')
+        self.assertEqual(cache.getStats()['bytes'], 5 + ENTRY_OVERHEAD)
+
+    def testTooLarge(self):
+        cache = ResponseCache(maxBytes=10)
+        cache.put('a', b'data', 60)
+
+        self.assertEqual(len(cache), 0)
+
+    def testStaleGeneration(self):
+        cache = ResponseCache()
+
+        # a lookup that started before the clear
+        generation = cache.generation
+        cache.clear()
+        cache.put('a', b'data', 60, generation)
+
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.getStats()['stale'], 1)
+
+        cache.put('a', b'data', 60, cache.generation)
+        self.assertEqual(cache.get('a'), b'data')
@@ -30,3 +30,48 @@ either expressed or implied, of the project author/s.
 import unittest
 
 import utils.ipv6
+
+
+class Ipv6Test(unittest.TestCase):
+
+    def testPrefixToReverseName(self):
+        self.assertEqual(
+            utils.ipv6.prefixToReverseName('2001:db8::').to_text(),
+            '8.b.d.0.1.0.0.2.ip6.arpa.'
+        )
+
+    def testPrefixToAddress(self):
+        self.assertEqual(utils.ipv6.prefixToAddress('2001:db8::'),
+                         b'\x20\x01\x0d\xb8')
+
+    def testNibblesToLabel(self):
+        nibbles = tuple(b'20010db8' + b'0' * 23 + b'1')
+
+        self.assertEqual(
+            utils.ipv6.nibblesToLabel([bytes((n, )) for n in nibbles]),
+            b'2001-0db8-0000-0000-0000-0000-0000-0001'
+        )
+        self.assertEqual(utils.ipv6.nibblesToLabel([b'2', b'0', b'0']),
+                         b'200')
+        self.assertIsNone(utils.ipv6.nibblesToLabel([b'2', b'00']))
+        self.assertIsNone(utils.ipv6.nibblesToLabel([b'2', b'g']))
+        self.assertIsNone(utils.ipv6.nibblesToLabel([]))
+        self.assertIsNone(utils.ipv6.nibblesToLabel([b'1'] * 33))
+
+    def testLabelToAddress(self):
+        address = b'\x20\x01\x0d\xb8' + b'\0' * 11 + b'\x01'
+
+        self.assertEqual(
+            utils.ipv6.labelToAddress(
+                b'2001-0db8-0000-0000-0000-0000-0000-0001'
+            ),
+            address
+        )
+        self.assertEqual(utils.ipv6.labelToAddress(b'2001-db8--1'), address)
+        self.assertIsNone(utils.ipv6.labelToAddress(
+            b'2001-0db8-0000-0000-0000-0000-0000-000g'
+        ))
+        self.assertIsNone(utils.ipv6.labelToAddress(
+            b'2001-0db8-0000-0000-0000-0000-00-0-0001'
+        ))
+        self.assertIsNone(utils.ipv6.labelToAddress(b'www'))
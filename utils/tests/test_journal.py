@@ -0,0 +1,214 @@
+"""
+Copyright (c) 2012, Nicholas Steicke
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this
+   list of conditions and the following disclaimer.
+2. Redistributions in binary form must reproduce the above copyright notice,
+   this list of conditions and the following disclaimer in the documentation
+   and/or other materials provided with the distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+The views and conclusions contained in the software and documentation are those
+of the authors and should not be interpreted as representing official policies,
+either expressed or implied, of the project author/s.
+"""
+
+
+import errno
+import os
+import tempfile
+import threading
+import unittest
+
+import dns.name
+import dns.rdataset
+
+from utils import journal
+
+
+def soa(serial):
+    return dns.rdataset.from_text(
+        'IN',
+        'SOA',
+        300,
+        'ns.test. hostmaster.test. %d 2 3 4 5' % (serial, )
+    )
+
+
+class BrokenFile:
+    '''
+    A file that fails each write half way through.
+    '''
+
+    def __init__(self, file):
+        self.file = file
+
+    def write(self, data):
+        self.file.write(data[:len(data) // 2])
+        self.file.flush()
+        raise OSError(errno.EIO, 'Input/output error')
+
+    def close(self):
+        self.file.close()
+
+
+class JournalTest(unittest.TestCase):
+
+    def setUp(self):
+        self.journal = journal.Journal(3)
+        for serial in (1, 2, 3):
+            self.journal.append(soa(serial), soa(serial + 1), [], [])
+
+    def serials(self, deltas):
+        return [journal.serialOf(delta.oldSoa) for delta in deltas]
+
+    def testSince(self):
+        self.assertEqual(self.serials(self.journal.since(1)), [1, 2, 3])
+        self.assertEqual(self.serials(self.journal.since(3)), [3])
+        self.assertEqual(self.serials(self.journal.since(1, 3)), [1, 2])
+        self.assertIsNone(self.journal.since(4))
+        self.assertIsNone(self.journal.since(1, 9))
+
+    def testBounded(self):
+        self.journal.append(soa(4), soa(5), [], [])
+
+        self.assertEqual(len(self.journal), 3)
+        self.assertIsNone(self.journal.since(1))
+        self.assertEqual(self.serials(self.journal.since(2)), [2, 3, 4])
+
+    def testGap(self):
+        # a change that doesn't follow on from the last starts afresh
+        self.journal.append(soa(7), soa(8), [], [])
+
+        self.assertEqual(len(self.journal), 1)
+        self.assertIsNone(self.journal.since(1))
+
+    def testSerialGreater(self):
+        self.assertTrue(journal.serialGreater(2, 1))
+        self.assertFalse(journal.serialGreater(1, 1))
+        self.assertFalse(journal.serialGreater(1, 2))
+
+        # http://www.ietf.org/rfc/rfc1982.txt
+        # 3.2. serials wrap around
+        self.assertTrue(journal.serialGreater(1, 0xffffffff))
+
+
+class JournalFileTest(unittest.TestCase):
+
+    origin = dns.name.from_text('test.')
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp()
+        os.close(fd)
+        os.unlink(self.path)
+
+        self.file = journal.JournalFile(self.path, self.origin)
+
+    def tearDown(self):
+        self.file.close()
+        os.unlink(self.path)
+
+    def delta(self, serial):
+        name = dns.name.from_text('host%d.test.' % (serial, ))
+        return journal.Delta(
+            soa(serial),
+            soa(serial + 1),
+            [(name, dns.rdataset.from_text('IN', 'A', 60, '192.0.2.1'))],
+            [(name, dns.rdataset.from_text('IN', 'A', 60, '192.0.2.2',
+                                           '192.0.2.3'))]
+        )
+
+    def testRoundTrip(self):
+        delta = self.delta(1)
+        self.file.sync(self.file.append(delta))
+
+        read = self.file.read()
+        self.assertEqual(len(read), 1)
+        self.assertEqual(read[0].oldSoa, delta.oldSoa)
+        self.assertEqual(read[0].newSoa, delta.newSoa)
+        self.assertEqual(read[0].removed, delta.removed)
+        self.assertEqual(read[0].added, delta.added)
+        self.assertEqual(read[0].added[0][1].ttl, 60)
+
+    def testGroupCommit(self):
+        # everything appended before a sync goes out with it
+        sequences = [self.file.append(self.delta(serial))
+                     for serial in range(5)]
+        self.file.sync(sequences[0])
+        self.file.sync(sequences[-1])
+
+        self.assertEqual(self.file.syncs, 1)
+
+        threads = [
+            threading.Thread(
+                target=lambda: self.file.sync(
+                    self.file.append(self.delta(5))
+                )
+            )
+            for i in range(10)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertLessEqual(self.file.syncs, 11)
+        self.assertEqual(len(self.file.read()), 15)
+
+    def testTornRecord(self):
+        self.file.sync(self.file.append(self.delta(1)))
+        self.file.sync(self.file.append(self.delta(2)))
+        self.file.close()
+
+        size = os.path.getsize(self.path)
+        os.truncate(self.path, size - 3)
+
+        self.file = journal.JournalFile(self.path, self.origin)
+        self.file.sync(self.file.append(self.delta(3)))
+
+        self.assertEqual(
+            [journal.serialOf(delta.oldSoa) for delta in self.file.read()],
+            [1, 3]
+        )
+
+    def testTruncate(self):
+        self.file.append(self.delta(1))
+        self.file.truncate()
+
+        self.assertEqual(self.file.read(), [])
+        self.file.sync(self.file.append(self.delta(2)))
+        self.assertEqual(len(self.file.read()), 1)
+
+    def testFailedWrite(self):
+        self.file.sync(self.file.append(self.delta(1)))
+        size = os.path.getsize(self.path)
+
+        self.file.file = BrokenFile(self.file.file)
+        sequence = self.file.append(self.delta(2))
+        self.assertRaises(OSError, self.file.sync, sequence)
+        self.assertRaises(OSError, self.file.sync, sequence)
+        self.assertTrue(self.file.isLost(sequence))
+        self.assertEqual(os.path.getsize(self.path), size)
+
+        # later deltas are written as usual
+        sequence = self.file.append(self.delta(3))
+        self.file.sync(sequence)
+        self.assertFalse(self.file.isLost(sequence))
+        self.assertEqual(
+            [journal.serialOf(delta.oldSoa) for delta in self.file.read()],
+            [1, 3]
+        )
@@ -0,0 +1,136 @@
+"""
+Copyright (c) 2012, Nicholas Steicke
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this
+   list of conditions and the following disclaimer.
+2. Redistributions in binary form must reproduce the above copyright notice,
+   this list of conditions and the following disclaimer in the documentation
+   and/or other materials provided with the distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+The views and conclusions contained in the software and documentation are those
+of the authors and should not be interpreted as representing official policies,
+either expressed or implied, of the project author/s.
+"""
+
+import unittest
+
+import dns.name
+
+from utils.nametrie import NameTrie, nameKey
+
+
+class NameTrieTest(unittest.TestCase):
+
+    def setUp(self):
+        self.trie = NameTrie()
+        self.trie.insert(dns.name.from_text('example.'), 'example')
+        self.trie.insert(dns.name.from_text('sub.Example.'), 'sub')
+        self.trie.insert(dns.name.from_text('org.'), 'org')
+
+    def testKey(self):
+        self.assertEqual(
+            nameKey(dns.name.from_text('WWW.example.')),
+            (b'example', b'www')
+        )
+        self.assertEqual(nameKey(dns.name.root), ())
+
+    def testExact(self):
+        self.assertEqual(
+            self.trie.longestMatch(dns.name.from_text('example.')),
+            (1, 'example')
+        )
+
+    def testLongest(self):
+        self.assertEqual(
+            self.trie.longestMatch(dns.name.from_text('a.b.SUB.example.')),
+            (2, 'sub')
+        )
+        self.assertEqual(
+            self.trie.longestMatch(dns.name.from_text('other.example.')),
+            (1, 'example')
+        )
+
+    def testNoMatch(self):
+        self.assertIsNone(
+            self.trie.longestMatch(dns.name.from_text('example.com.'))
+        )
+
+    def testRoot(self):
+        self.trie.insert(dns.name.root, 'root')
+
+        self.assertEqual(
+            self.trie.longestMatch(dns.name.from_text('example.com.')),
+            (0, 'root')
+        )
+
+    def testSetdefault(self):
+        name = dns.name.from_text('example.')
+
+        self.assertEqual(self.trie.setdefault(name, 'other'), 'example')
+        self.assertEqual(self.trie.get(name), 'example')
+        self.assertEqual(len(self.trie), 3)
+
+    def testGet(self):
+        self.assertIsNone(self.trie.get(dns.name.from_text('a.example.')))
+        self.assertEqual(
+            self.trie.get(dns.name.from_text('org.')),
+            'org'
+        )
+
+    def testClosest(self):
+        depth, node = self.trie.closestKey((b'example', b'sub', b'a'))
+
+        self.assertEqual(depth, 2)
+        self.assertEqual(node.value, 'sub')
+
+        depth, node = self.trie.closestKey((b'com', b'example'))
+
+        self.assertEqual(depth, 0)
+        self.assertIs(node, self.trie.root)
+
+    def testRemove(self):
+        self.trie.insert(dns.name.from_text('a.b.example.'), 'a')
+
+        self.assertTrue(self.trie.removeKey((b'example', b'b', b'a')))
+        self.assertFalse(self.trie.removeKey((b'example', b'b')))
+        self.assertEqual(len(self.trie), 3)
+
+        # the empty non-terminal left behind goes too
+        depth, node = self.trie.closestKey((b'example', b'b'))
+        self.assertEqual(depth, 1)
+
+    def testClone(self):
+        clone = self.trie.clone()
+        clone.insert(dns.name.from_text('a.sub.example.'), 'a')
+        clone.removeKey((b'org', ))
+
+        self.assertEqual(len(clone), 3)
+        self.assertEqual(clone.get(dns.name.from_text('a.sub.example.')),
+                         'a')
+        self.assertIsNone(clone.get(dns.name.from_text('org.')))
+
+        # the original is untouched
+        self.assertEqual(len(self.trie), 3)
+        self.assertIsNone(
+            self.trie.get(dns.name.from_text('a.sub.example.'))
+        )
+        self.assertEqual(self.trie.get(dns.name.from_text('org.')), 'org')
+        self.assertIs(
+            clone.root.children[b'example'].children[b'sub'].value,
+            self.trie.root.children[b'example'].children[b'sub'].value
+        )
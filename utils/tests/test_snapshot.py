@@ -0,0 +1,157 @@
+"""
+Copyright (c) 2012, Nicholas Steicke
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this
+   list of conditions and the following disclaimer.
+2. Redistributions in binary form must reproduce the above copyright notice,
+   this list of conditions and the following disclaimer in the documentation
+   and/or other materials provided with the distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+The views and conclusions contained in the software and documentation are those
+of the authors and should not be interpreted as representing official policies,
+either expressed or implied, of the project author/s.
+"""
+
+
+import os
+import os.path
+import tempfile
+import unittest
+
+import dns.name
+import dns.zone
+
+from utils import nametrie, snapshot, zonestore
+
+examplePath = os.path.join(
+    os.path.dirname(__file__),
+    '..', '..', 'providers', 'example.txt'
+)
+
+
+class SnapshotTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.data = dns.zone.from_file(
+            examplePath,
+            origin='example.',
+            relativize=False
+        )
+        cls.trie = zonestore.TrieStore(cls.data)
+
+        fd, cls.path = tempfile.mkstemp()
+        os.close(fd)
+        snapshot.write(cls.data, cls.path)
+        cls.store = snapshot.SnapshotStore(cls.path)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.store.close()
+        os.unlink(cls.path)
+
+    def find(self, store, name):
+        return store.findKey(nametrie.nameKey(dns.name.from_text(name)))
+
+    def testHeader(self):
+        self.assertTrue(snapshot.isSnapshot(self.path))
+        self.assertFalse(snapshot.isSnapshot(examplePath))
+        self.assertEqual(self.store.origin, self.data.origin)
+        self.assertEqual(len(self.store), len(self.data.nodes))
+        self.assertEqual(self.store.soa, self.trie.soa)
+
+    def testRecords(self):
+        for record in self.store.records():
+            node = self.data.nodes[record.name]
+
+            self.assertEqual(record.wire, record.name.to_wire())
+            self.assertEqual(
+                sorted(record.node.rdatasets, key=str),
+                sorted(node.rdatasets, key=str)
+            )
+
+    def testSorted(self):
+        keys = [self.store.keyAt(i) for i in range(len(self.store))]
+
+        self.assertEqual(keys, sorted(keys))
+
+    def testMatchesTrie(self):
+        names = [
+            'example.', 'E.example.', 'nothing.example.', 'a.b.example.',
+            'x.e.example.', 'u.example.', 'b.u.example.', 'c.u.example.',
+            's.example.', 'ns.s.example.', 'x.ns.s.example.',
+            'zzzz.example.', '0.example.', '*.example.',
+        ]
+
+        for name in names:
+            expected = self.find(self.trie, name)
+            found = self.find(self.store, name)
+
+            if expected is None or expected is zonestore.EMPTY:
+                self.assertIs(found, expected, name)
+            else:
+                self.assertEqual(found.wire, expected.wire, name)
+
+    def testLoadsStore(self):
+        compact = zonestore.CompactStore.fromZone(self.data)
+        store = snapshot.loadsStore(snapshot.dumpsStore(compact))
+
+        self.assertIsInstance(store, zonestore.CompactStore)
+        self.assertEqual(store.keys, compact.keys)
+        self.assertEqual(store.offsets, compact.offsets)
+        self.assertEqual(store.packed, compact.packed)
+        self.assertEqual(store.soa, compact.soa)
+
+    def testEmptyNonTerminal(self):
+        data = dns.zone.from_text(
+            '@ 300 SOA ns hostmaster 1 2 3 4 5\n'
+            '@ 300 NS ns\n'
+            'a.b.c 300 A 192.0.2.1\n'
+            'x.*.w 300 A 192.0.2.2\n',
+            origin='test.',
+            relativize=False
+        )
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            snapshot.write(data, path)
+            store = snapshot.SnapshotStore(path)
+
+            self.assertIs(self.find(store, 'b.c.test.'), zonestore.EMPTY)
+            self.assertIs(self.find(store, 'c.test.'), zonestore.EMPTY)
+            self.assertIsNone(self.find(store, 'x.c.test.'))
+            self.assertIs(self.find(store, 'q.w.test.'), zonestore.EMPTY)
+            self.assertEqual(
+                self.find(store, 'a.b.c.test.').node.rdatasets[0][0].address,
+                '192.0.2.1'
+            )
+            store.close()
+        finally:
+            os.unlink(path)
+
+    def testBadVersion(self):
+        fd, path = tempfile.mkstemp()
+        try:
+            data = bytearray(snapshot.dumps(self.data))
+            data[len(snapshot.MAGIC) + 1] = snapshot.VERSION + 1
+            os.write(fd, data)
+            os.close(fd)
+
+            self.assertRaises(ValueError, snapshot.SnapshotStore, path)
+        finally:
+            os.unlink(path)
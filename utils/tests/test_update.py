@@ -0,0 +1,168 @@
+"""
+Copyright (c) 2012, Nicholas Steicke
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this
+   list of conditions and the following disclaimer.
+2. Redistributions in binary form must reproduce the above copyright notice,
+   this list of conditions and the following disclaimer in the documentation
+   and/or other materials provided with the distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+The views and conclusions contained in the software and documentation are those
+of the authors and should not be interpreted as representing official policies,
+either expressed or implied, of the project author/s.
+"""
+
+
+
+import unittest
+
+import dns.message
+import dns.name
+import dns.rcode
+import dns.rdataclass
+import dns.rrset
+import dns.update
+import dns.zone
+
+from utils import update, zonestore
+
+testZone = '''
+$ORIGIN test.
+$TTL 300
+@               SOA     ns hostmaster 1 2000 2000 1814400 60
+                NS      ns
+ns              A       192.0.2.1
+'''
+
+
+class UpdateTest(unittest.TestCase):
+
+    zone = dns.name.from_text('test.')
+
+    def setUp(self):
+        self.store = zonestore.TrieStore(dns.zone.from_text(
+            testZone,
+            'test.',
+            relativize=False
+        ))
+
+    def message(self, update):
+        return dns.message.from_wire(update.to_wire())
+
+    def changes(self, message):
+        message = self.message(message)
+        self.assertEqual(
+            update.prescan(self.zone, dns.rdataclass.IN, message.update),
+            dns.rcode.NOERROR
+        )
+
+        return update.changes(
+            self.store.data.nodes,
+            self.zone,
+            self.store.soa,
+            message.update
+        )
+
+    def testSerial(self):
+        message = dns.update.UpdateMessage('test.')
+        message.add('host', 60, 'A', '192.0.2.10')
+        delta = self.changes(message)
+
+        self.assertEqual(delta.newSoa[0].serial, 2)
+        self.assertEqual(delta.removed, [])
+        self.assertEqual(len(delta.added), 1)
+
+        # an SOA sent with the update is used as it is
+        message.add('test.', 300, 'SOA',
+                    'ns.test. hostmaster.test. 10 2 3 4 5')
+        self.assertEqual(self.changes(message).newSoa[0].serial, 10)
+
+        # but never to go backwards
+        message = dns.update.UpdateMessage('test.')
+        message.add('test.', 300, 'SOA',
+                    'ns.test. hostmaster.test. 0 2 3 4 5')
+        self.assertIsNone(self.changes(message))
+
+    def testLastNs(self):
+        message = dns.update.UpdateMessage('test.')
+        message.delete('test.', 'NS', 'ns.test.')
+        message.delete('test.', 'NS')
+        message.delete('test.', 'SOA')
+
+        self.assertIsNone(self.changes(message))
+
+    def testNoChange(self):
+        message = dns.update.UpdateMessage('test.')
+        message.add('ns', 300, 'A', '192.0.2.1')
+        message.delete('missing')
+
+        self.assertIsNone(self.changes(message))
+
+    def testTtl(self):
+        message = dns.update.UpdateMessage('test.')
+        message.add('ns', 60, 'A', '192.0.2.2')
+        delta = self.changes(message)
+
+        # the new TTL applies to the whole set
+        self.assertEqual(len(delta.removed[0][1]), 1)
+        self.assertEqual(len(delta.added[0][1]), 2)
+        self.assertEqual(delta.added[0][1].ttl, 60)
+
+        store = self.store.apply([delta])
+        rdataset = store.data.find_rdataset('ns.test.', 'A')
+        self.assertEqual(rdataset.ttl, 60)
+        self.assertEqual(len(rdataset), 2)
+
+    def testPrescan(self):
+        message = self.message(dns.update.UpdateMessage('test.'))
+        message.update.append(dns.rrset.from_text(
+            'ns.test.', 0, 'IN', 'ANY'
+        ))
+
+        self.assertEqual(
+            update.prescan(self.zone, dns.rdataclass.IN, message.update),
+            dns.rcode.FORMERR
+        )
+
+    def testPrerequisites(self):
+        def check(message):
+            return update.checkPrerequisites(
+                self.store.data.nodes,
+                self.zone,
+                dns.rdataclass.IN,
+                self.message(message).prerequisite
+            )
+
+        message = dns.update.UpdateMessage('test.')
+        message.present('ns')
+        message.present('ns', 'A')
+        message.absent('missing')
+        message.absent('ns', 'TXT')
+        self.assertEqual(check(message), dns.rcode.NOERROR)
+
+        message = dns.update.UpdateMessage('test.')
+        message.present('missing')
+        self.assertEqual(check(message), dns.rcode.NXDOMAIN)
+
+        message = dns.update.UpdateMessage('test.')
+        message.absent('ns', 'A')
+        self.assertEqual(check(message), dns.rcode.YXRRSET)
+
+        message = dns.update.UpdateMessage('test.')
+        message.present('ns.example.')
+        self.assertEqual(check(message), dns.rcode.NOTZONE)
@@ -0,0 +1,112 @@
+"""
+Copyright (c) 2012, Nicholas Steicke
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this
+   list of conditions and the following disclaimer.
+2. Redistributions in binary form must reproduce the above copyright notice,
+   this list of conditions and the following disclaimer in the documentation
+   and/or other materials provided with the distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+The views and conclusions contained in the software and documentation are those
+of the authors and should not be interpreted as representing official policies,
+either expressed or implied, of the project author/s.
+"""
+
+
+import os
+import os.path
+import shutil
+import tempfile
+import threading
+import unittest
+
+from utils import fork, watch
+
+
+class FileWatcherTest(unittest.TestCase):
+
+    useInotify = False
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'zone')
+        with open(self.path, 'w') as f:
+            f.write('one\n')
+
+        self.changed = threading.Event()
+        self.watcher = watch.FileWatcher(
+            self.path,
+            lambda path: self.changed.set(),
+            interval=0.05,
+            useInotify=self.useInotify
+        )
+        self.watcher.start()
+
+    def tearDown(self):
+        self.watcher.stop()
+        shutil.rmtree(self.dir)
+
+    def testUnchanged(self):
+        self.assertFalse(self.changed.wait(0.2))
+
+    def testWrite(self):
+        with open(self.path, 'w') as f:
+            f.write('two, longer\n')
+
+        self.assertTrue(self.changed.wait(5))
+
+    def testReplace(self):
+        temp = self.path + '.tmp'
+        with open(temp, 'w') as f:
+            f.write('three\n')
+        os.replace(temp, self.path)
+
+        self.assertTrue(self.changed.wait(5))
+
+    def testStop(self):
+        self.watcher.stop()
+
+        with open(self.path, 'w') as f:
+            f.write('two, longer\n')
+
+        self.assertFalse(self.changed.wait(0.2))
+
+    @unittest.skipUnless(hasattr(os, 'fork'), 'needs fork')
+    def testFork(self):
+        thread = self.watcher.thread
+
+        pid = os.fork()
+        if pid == 0:
+            # only workers, through the fork hooks, restart the thread, not
+            # any process that forks
+            ok = self.watcher.thread is thread
+            fork.afterFork()
+            ok = ok and self.watcher.thread is not thread \
+                and self.watcher.thread.is_alive()
+            os._exit(0 if ok else 1)
+
+        self.assertEqual(os.waitpid(pid, 0)[1], 0)
+
+
+@unittest.skipIf(watch.loadInotify() is None, 'inotify not available')
+class InotifyWatcherTest(FileWatcherTest):
+
+    useInotify = True
+
+    def testInotify(self):
+        self.assertIsNotNone(self.watcher.fd)
@@ -0,0 +1,175 @@
+"""
+Copyright (c) 2012, Nicholas Steicke
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this
+   list of conditions and the following disclaimer.
+2. Redistributions in binary form must reproduce the above copyright notice,
+   this list of conditions and the following disclaimer in the documentation
+   and/or other materials provided with the distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+The views and conclusions contained in the software and documentation are those
+of the authors and should not be interpreted as representing official policies,
+either expressed or implied, of the project author/s.
+"""
+
+import unittest
+
+import dns.flags
+import dns.message
+import dns.name
+import dns.opcode
+import dns.rcode
+import dns.rdataclass
+import dns.rdataset
+import dns.rdatatype
+
+from utils import wire
+
+
+class PatchResponseTest(unittest.TestCase):
+
+    def testPatch(self):
+        first = dns.message.make_query('www.example.', dns.rdatatype.A)
+        response = dns.message.make_response(first)
+        response.flags |= dns.flags.AA
+
+        second = dns.message.make_query('WWW.Example.', dns.rdatatype.A)
+        second.flags &= ~dns.flags.RD
+        second.flags |= dns.flags.CD
+
+        patched = dns.message.from_wire(wire.patchResponse(
+            response.to_wire(),
+            second.to_wire(),
+            12 + len(first.question[0].name.to_wire())
+        ))
+
+        self.assertEqual(patched.id, second.id)
+        self.assertFalse(patched.flags & dns.flags.RD)
+        self.assertTrue(patched.flags & dns.flags.CD)
+        self.assertTrue(patched.flags & dns.flags.AA)
+        self.assertTrue(patched.flags & dns.flags.QR)
+        self.assertEqual(
+            patched.question[0].name.labels,
+            (b'WWW', b'Example', b'')
+        )
+
+
+class ParseQueryTest(unittest.TestCase):
+
+    def testPlain(self):
+        q = dns.message.make_query('WWW.Example.', dns.rdatatype.AAAA)
+        query = wire.parseQuery(q.to_wire())
+
+        self.assertEqual(query.id, q.id)
+        self.assertEqual(query.qname, b'\x03www\x07example\x00')
+        self.assertEqual(query.nameKey, (b'example', b'www'))
+        self.assertEqual(query.qtype, dns.rdatatype.AAAA)
+        self.assertEqual(query.qclass, dns.rdataclass.IN)
+        self.assertEqual(query.questionEnd, 12 + len(query.qname))
+        self.assertEqual(query.edns, -1)
+        self.assertEqual(query.payload, 512)
+        self.assertFalse(query.do)
+
+    def testEdns(self):
+        q = dns.message.make_query(
+            'www.example.',
+            dns.rdatatype.A,
+            use_edns=0,
+            payload=4096,
+            want_dnssec=True
+        )
+        query = wire.parseQuery(q.to_wire())
+
+        self.assertEqual(query.edns, 0)
+        self.assertEqual(query.payload, 4096)
+        self.assertTrue(query.do)
+
+    def testRoot(self):
+        q = dns.message.make_query('.', dns.rdatatype.NS)
+        query = wire.parseQuery(q.to_wire())
+
+        self.assertEqual(query.qname, b'\x00')
+        self.assertEqual(query.nameKey, ())
+
+    def testUnusual(self):
+        q = dns.message.make_query('www.example.', dns.rdatatype.A)
+        data = q.to_wire()
+
+        # response
+        self.assertIsNone(wire.parseQuery(
+            dns.message.make_response(q).to_wire()
+        ))
+
+        # opcode NOTIFY
+        q.set_opcode(dns.opcode.NOTIFY)
+        self.assertIsNone(wire.parseQuery(q.to_wire()))
+
+        # two questions
+        two = dns.message.make_query('www.example.', dns.rdatatype.A)
+        two.question.append(
+            dns.message.make_query('a.example.', dns.rdatatype.A).question[0]
+        )
+        self.assertIsNone(wire.parseQuery(two.to_wire()))
+
+        # truncated, trailing data and a compression pointer
+        self.assertIsNone(wire.parseQuery(data[:-1]))
+        self.assertIsNone(wire.parseQuery(data + b'\x00'))
+        self.assertIsNone(wire.parseQuery(
+            data[:12] + b'\xc0\x0c' + data[-4:]
+        ))
+
+
+class AnswerTest(unittest.TestCase):
+
+    def testRender(self):
+        rdataset = dns.rdataset.from_text(
+            'IN', 'A', 300, '10.0.0.1', '10.0.0.2'
+        )
+        soa = dns.rdataset.from_text(
+            'IN', 'SOA', 3600, 'ns. host. 1 2 3 4 60'
+        )
+        answer = wire.Answer(
+            dns.rcode.NOERROR,
+            answer=[(wire.POINTER_QNAME, rdataset)],
+            authority=[(dns.name.from_text('example.').to_wire(), soa)]
+        )
+
+        self.assertEqual(answer.ttl, 60)
+
+        q = dns.message.make_query('Www.example.', dns.rdatatype.A)
+        data = q.to_wire()
+        r = dns.message.from_wire(answer.render(wire.parseQuery(data), data))
+
+        self.assertEqual(r.id, q.id)
+        self.assertTrue(r.flags & dns.flags.AA)
+        self.assertTrue(r.flags & dns.flags.RD)
+        self.assertEqual(r.answer[0].name, q.question[0].name)
+        self.assertEqual(len(r.answer[0]), 2)
+        self.assertEqual(r.authority[0].rdtype, dns.rdatatype.SOA)
+
+    def testAddOpt(self):
+        q = dns.message.make_query('www.example.', dns.rdatatype.A)
+        response = dns.message.make_response(q)
+
+        r = dns.message.from_wire(
+            wire.addOpt(response.to_wire(), 1232, 0x8000)
+        )
+
+        self.assertEqual(r.edns, 0)
+        self.assertEqual(r.payload, 1232)
+        self.assertTrue(r.ednsflags & dns.flags.DO)
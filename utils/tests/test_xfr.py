@@ -0,0 +1,224 @@
+"""
+Copyright (c) 2012, Nicholas Steicke
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this
+   list of conditions and the following disclaimer.
+2. Redistributions in binary form must reproduce the above copyright notice,
+   this list of conditions and the following disclaimer in the documentation
+   and/or other materials provided with the distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+The views and conclusions contained in the software and documentation are those
+of the authors and should not be interpreted as representing official policies,
+either expressed or implied, of the project author/s.
+"""
+
+
+import threading
+import unittest
+
+import dns.message
+import dns.name
+import dns.rdataset
+import dns.rdatatype
+import dns.zone
+
+from utils import journal, xfr, zonestore
+
+zoneText = '''
+@ 300 SOA ns hostmaster 7 2 3 4 5
+@ 300 NS ns
+ns 300 A 192.0.2.1
+'''
+
+
+def records(count):
+    owner = dns.name.from_text('a.test.').to_wire()
+    for i in range(count):
+        yield owner, dns.rdataset.from_text(
+            'IN',
+            'TXT',
+            300,
+            '"%s"' % ('x' * 200, )
+        )
+
+
+class ChunkTest(unittest.TestCase):
+
+    def testLimit(self):
+        bodies = list(xfr.chunk(records(1000)))
+
+        self.assertGreater(len(bodies), 1)
+        self.assertEqual(sum(count for count, body in bodies), 1000)
+        for count, body in bodies:
+            self.assertLessEqual(len(body), xfr.MAX_BODY)
+
+
+class StreamTest(unittest.TestCase):
+
+    def testShared(self):
+        drawn = []
+
+        def chunks():
+            for body in xfr.chunk(records(1000), 4096):
+                drawn.append(body)
+                yield body
+
+        stream = xfr.Stream(chunks())
+        results = []
+
+        def consume():
+            results.append(list(stream))
+
+        threads = [threading.Thread(target=consume) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results, [drawn] * 4)
+        self.assertEqual(list(stream), drawn)
+
+    def testLazy(self):
+        stream = xfr.Stream(xfr.chunk(records(1000), 4096))
+        next(iter(stream))
+
+        self.assertEqual(len(stream.bodies), 1)
+
+
+class TransferTest(unittest.TestCase):
+
+    def setUp(self):
+        self.zone = dns.zone.from_text(
+            zoneText,
+            origin='test.',
+            relativize=False
+        )
+        self.store = zonestore.TrieStore(self.zone)
+
+    def testAxfr(self):
+        q = dns.message.make_query('test.', dns.rdatatype.AXFR)
+        stream = xfr.Stream(xfr.chunk(xfr.axfrRecords(self.store), 60))
+        messages = [
+            dns.message.from_wire(data, one_rr_per_rrset=True)
+            for data in xfr.messages(q, stream)
+        ]
+
+        self.assertGreater(len(messages), 1)
+        self.assertEqual(len(messages[0].question), 1)
+        self.assertEqual(messages[1].question, [])
+        for message in messages:
+            self.assertEqual(message.id, q.id)
+
+        answer = [rrset for message in messages for rrset in message.answer]
+        self.assertEqual(answer[0].rdtype, dns.rdatatype.SOA)
+        self.assertEqual(answer[-1].rdtype, dns.rdatatype.SOA)
+        self.assertEqual(len(answer), 4)
+
+    def testIxfr(self):
+        old = dns.rdataset.from_text('IN', 'SOA', 300,
+                                     'ns.test. hostmaster.test. 6 2 3 4 5')
+        name = dns.name.from_text('b.test.')
+        delta = journal.Delta(
+            old,
+            self.store.soa,
+            [(name, dns.rdataset.from_text('IN', 'A', 300, '192.0.2.2'))],
+            [(name, dns.rdataset.from_text('IN', 'A', 300, '192.0.2.3'))]
+        )
+
+        answer = [
+            (rdataset.rdtype, rdataset[0])
+            for owner, rdataset in xfr.ixfrRecords(
+                self.store.origin,
+                self.store.soa,
+                [delta]
+            )
+        ]
+
+        self.assertEqual(
+            [rdtype for rdtype, rdata in answer],
+            [dns.rdatatype.SOA, dns.rdatatype.SOA, dns.rdatatype.A,
+             dns.rdatatype.SOA, dns.rdatatype.A, dns.rdatatype.SOA]
+        )
+        self.assertEqual(answer[1][1].serial, 6)
+        self.assertEqual(answer[3][1].serial, 7)
+
+
+class ReadTransferTest(unittest.TestCase):
+
+    def setUp(self):
+        self.origin = dns.name.from_text('test.')
+        self.zone = dns.zone.from_text(
+            zoneText,
+            origin=self.origin,
+            relativize=False
+        )
+        self.store = zonestore.TrieStore(self.zone)
+
+    def rrsets(self, records):
+        q = dns.message.make_query('test.', dns.rdatatype.IXFR)
+        return [
+            rrset
+            for data in xfr.messages(q, xfr.chunk(records))
+            for rrset in dns.message.from_wire(
+                data,
+                one_rr_per_rrset=True
+            ).answer
+        ]
+
+    def testFull(self):
+        soa, data, deltas = xfr.readTransfer(
+            self.origin,
+            self.rrsets(xfr.axfrRecords(self.store))
+        )
+
+        self.assertEqual(soa[0].serial, 7)
+        self.assertEqual(data, self.zone)
+        self.assertIsNone(deltas)
+
+    def testCurrent(self):
+        soa, data, deltas = xfr.readTransfer(
+            self.origin,
+            self.rrsets([(self.origin.to_wire(), self.store.soa)])
+        )
+
+        self.assertIsNone(data)
+        self.assertEqual(deltas, [])
+
+    def testIncremental(self):
+        old = dns.rdataset.from_text('IN', 'SOA', 300,
+                                     'ns.test. hostmaster.test. 6 2 3 4 5')
+        name = dns.name.from_text('b.test.')
+        delta = journal.Delta(
+            old,
+            self.store.soa,
+            [(name, dns.rdataset.from_text('IN', 'A', 300, '192.0.2.2'))],
+            [(name, dns.rdataset.from_text('IN', 'A', 300, '192.0.2.3'))]
+        )
+
+        soa, data, deltas = xfr.readTransfer(
+            self.origin,
+            self.rrsets(xfr.ixfrRecords(self.origin, self.store.soa,
+                                        [delta]))
+        )
+
+        self.assertIsNone(data)
+        self.assertEqual(len(deltas), 1)
+        self.assertEqual(deltas[0].oldSoa[0].serial, 6)
+        self.assertEqual(deltas[0].newSoa[0].serial, 7)
+        self.assertEqual(deltas[0].removed[0][0], name)
+        self.assertEqual(deltas[0].added[0][1][0].address, '192.0.2.3')
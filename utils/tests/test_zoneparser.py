@@ -0,0 +1,209 @@
+"""
+Copyright (c) 2012, Nicholas Steicke
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this
+   list of conditions and the following disclaimer.
+2. Redistributions in binary form must reproduce the above copyright notice,
+   this list of conditions and the following disclaimer in the documentation
+   and/or other materials provided with the distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+The views and conclusions contained in the software and documentation are those
+of the authors and should not be interpreted as representing official policies,
+either expressed or implied, of the project author/s.
+"""
+
+
+import io
+import os
+import os.path
+import shutil
+import tempfile
+import unittest
+
+import dns.exception
+import dns.name
+import dns.rdata
+import dns.rdatatype
+import dns.zone
+
+from utils import zoneparser, zonestore
+
+examplePath = os.path.join(
+    os.path.dirname(__file__),
+    '..', '..', 'providers', 'example.txt'
+)
+
+
+def zoneRecords(data):
+    return sorted(
+        (name, rdataset.ttl, rdata.to_text())
+        for name, node in data.nodes.items()
+        for rdataset in node.rdatasets
+        for rdata in rdataset
+    )
+
+
+class ReadRecordsTest(unittest.TestCase):
+
+    def read(self, text, origin='test.'):
+        return [
+            (name.to_text(), ttl, rdata.to_text())
+            for name, ttl, rdata in zoneparser.readRecords(
+                io.StringIO(text),
+                origin
+            )
+        ]
+
+    def testExample(self):
+        data = dns.zone.from_file(
+            examplePath,
+            origin='example.',
+            relativize=False
+        )
+        records = sorted(
+            (name, ttl, rdata.to_text())
+            for name, ttl, rdata in zoneparser.readRecords(
+                examplePath,
+                'example.'
+            )
+        )
+
+        self.assertEqual(records, zoneRecords(data))
+
+    def testDirectives(self):
+        records = self.read(
+            '$TTL 1h\n'
+            '@ IN SOA ns hostmaster ( 1 2 3\n'
+            '    4 5 ) ; serial and timers\n'
+            '  NS ns\n'
+            '\n'
+            '$ORIGIN sub.test.\n'
+            'a 60 IN A 192.0.2.1\n'
+            'b IN 60 A 192.0.2.2\n'
+            '  TXT "two words" ; comment\n'
+        )
+
+        self.assertEqual(records, [
+            ('test.', 3600, 'ns.test. hostmaster.test. 1 2 3 4 5'),
+            ('test.', 3600, 'ns.test.'),
+            ('a.sub.test.', 60, '192.0.2.1'),
+            ('b.sub.test.', 60, '192.0.2.2'),
+            ('b.sub.test.', 3600, '"two words"'),
+        ])
+
+    def testLastTtl(self):
+        records = self.read(
+            '@ SOA ns hostmaster 1 2 3 4 5\n'
+            'a 60 A 192.0.2.1\n'
+            'b A 192.0.2.2\n'
+        )
+
+        self.assertEqual([ttl for name, ttl, rdata in records], [5, 60, 60])
+
+    def testInclude(self):
+        path = tempfile.mkdtemp()
+        try:
+            with open(os.path.join(path, 'hosts'), 'w') as f:
+                f.write('a A 192.0.2.1\n$ORIGIN other.test.\nb A 192.0.2.2\n')
+            with open(os.path.join(path, 'zone'), 'w') as f:
+                f.write(
+                    '$TTL 300\n'
+                    '@ SOA ns hostmaster 1 2 3 4 5\n'
+                    '$INCLUDE hosts sub\n'
+                    'c A 192.0.2.3\n'
+                )
+
+            records = [
+                name.to_text()
+                for name, ttl, rdata in zoneparser.readRecords(
+                    os.path.join(path, 'zone'),
+                    'test.'
+                )
+            ]
+        finally:
+            shutil.rmtree(path)
+
+        self.assertEqual(
+            records,
+            ['test.', 'a.sub.test.', 'b.other.test.', 'c.test.']
+        )
+
+    def testErrors(self):
+        for text in (
+                'a A 192.0.2.1\n',
+                '$TTL 300\na.example. A 192.0.2.1\n',
+                '$TTL 300\n  A 192.0.2.1\n',
+                '$TTL 300\na CH A 192.0.2.1\n',
+                '$GENERATE 1-2 a$ A 192.0.2.$\n'):
+            self.assertRaises(dns.exception.SyntaxError, self.read, text)
+
+    def testBatches(self):
+        batches = list(zoneparser.readBatches(examplePath, 'example.',
+                                              size=50))
+
+        self.assertEqual([len(batch) for batch in batches], [50, 50, 14])
+
+
+class FromRecordsTest(unittest.TestCase):
+
+    def testMatchesZone(self):
+        data = dns.zone.from_file(
+            examplePath,
+            origin='example.',
+            relativize=False
+        )
+        expected = zonestore.CompactStore.fromZone(data)
+        store = zonestore.CompactStore.fromRecords(
+            data.origin,
+            zoneparser.readBatches(examplePath, 'example.')
+        )
+
+        self.assertEqual(store.keys, expected.keys)
+        for record in store.records():
+            self.assertEqual(record.node, data.nodes[record.name])
+
+    def testMerge(self):
+        store = zonestore.CompactStore.fromRecords(
+            dns.name.from_text('test.'),
+            zoneparser.readBatches(io.StringIO(
+                '@ 300 SOA ns hostmaster 1 2 3 4 5\n'
+                'a 300 A 192.0.2.1\n'
+                'b 300 A 192.0.2.9\n'
+                'a 60 A 192.0.2.2\n'
+                'a 300 A 192.0.2.1\n'
+                'c 300 CNAME a\n'
+                'c 300 CNAME b\n'
+            ), 'test.')
+        )
+
+        rdatasets = store.findKey((b'test', b'a')).node.rdatasets
+        self.assertEqual(len(rdatasets), 1)
+        self.assertEqual(len(rdatasets[0]), 2)
+        self.assertEqual(rdatasets[0].ttl, 60)
+
+        cname = store.findKey((b'test', b'c')).node.rdatasets[0]
+        self.assertEqual(cname[0].target.to_text(), 'b.test.')
+
+    def testNoSoa(self):
+        self.assertRaises(
+            dns.zone.NoSOA,
+            zonestore.CompactStore.fromRecords,
+            dns.name.from_text('test.'),
+            [[(dns.name.from_text('a.test.'), 300,
+               dns.rdata.from_text('IN', 'A', '192.0.2.1'))]]
+        )
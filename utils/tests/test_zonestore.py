@@ -0,0 +1,244 @@
+"""
+Copyright (c) 2012, Nicholas Steicke
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this
+   list of conditions and the following disclaimer.
+2. Redistributions in binary form must reproduce the above copyright notice,
+   this list of conditions and the following disclaimer in the documentation
+   and/or other materials provided with the distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+The views and conclusions contained in the software and documentation are those
+of the authors and should not be interpreted as representing official policies,
+either expressed or implied, of the project author/s.
+"""
+
+
+import os.path
+import unittest
+
+import dns.name
+import dns.rdataset
+import dns.zone
+
+from utils import journal, nametrie, zonestore
+
+examplePath = os.path.join(
+    os.path.dirname(__file__),
+    '..', '..', 'providers', 'example.txt'
+)
+
+
+class CompactStoreTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.data = dns.zone.from_file(
+            examplePath,
+            origin='example.',
+            relativize=False
+        )
+        cls.trie = zonestore.TrieStore(cls.data)
+        cls.store = zonestore.CompactStore.fromZone(cls.data)
+
+    def find(self, store, name):
+        return store.findKey(nametrie.nameKey(dns.name.from_text(name)))
+
+    def testRecords(self):
+        self.assertEqual(len(self.store), len(self.data.nodes))
+        self.assertEqual(self.store.soa, self.trie.soa)
+
+        for record in self.store.records():
+            node = self.data.nodes[record.name]
+
+            self.assertEqual(record.wire, record.name.to_wire())
+            self.assertEqual(record.node.rdatasets, node.rdatasets)
+
+    def testInterned(self):
+        labels = {}
+        for key in self.store.keys:
+            for label in key:
+                self.assertIs(labels.setdefault(label, label), label)
+
+    def testMatchesTrie(self):
+        names = [
+            'example.', 'E.example.', 'nothing.example.', 'a.b.example.',
+            'x.e.example.', 'u.example.', 'b.u.example.', 'c.u.example.',
+            's.example.', 'ns.s.example.', 'x.ns.s.example.',
+            'zzzz.example.', '0.example.', '*.example.',
+        ]
+
+        for name in names:
+            expected = self.find(self.trie, name)
+            found = self.find(self.store, name)
+
+            if expected is None or expected is zonestore.EMPTY:
+                self.assertIs(found, expected, name)
+            else:
+                self.assertEqual(found.wire, expected.wire, name)
+
+
+class PackNodeTest(unittest.TestCase):
+
+    def testRoundTrip(self):
+        data = dns.zone.from_file(
+            examplePath,
+            origin='example.',
+            relativize=False
+        )
+
+        for name, node in data.nodes.items():
+            packed = b'\0' + zonestore.packNode(node)
+
+            self.assertEqual(
+                zonestore.unpackNode(packed, 1, data.rdclass).rdatasets,
+                node.rdatasets
+            )
+
+
+class DiffTest(unittest.TestCase):
+
+    def testDiff(self):
+        zone = '@ 300 SOA ns hostmaster 1 2 3 4 5\n@ 300 NS ns\n'
+        old = dns.zone.from_text(
+            zone + 'a 300 A 192.0.2.1\nb 300 A 192.0.2.2\n',
+            origin='test.',
+            relativize=False
+        )
+        new = dns.zone.from_text(
+            zone + 'a 300 A 192.0.2.1\nb 300 A 192.0.2.3\nc 300 A 192.0.2.4\n',
+            origin='test.',
+            relativize=False
+        )
+
+        added, removed, changed = zonestore.diff(
+            zonestore.TrieStore(old),
+            zonestore.CompactStore.fromZone(new)
+        )
+
+        self.assertEqual(added, [dns.name.from_text('c.test.')])
+        self.assertEqual(removed, [])
+        self.assertEqual(changed, [dns.name.from_text('b.test.')])
+
+        added, removed, changed = zonestore.diff(
+            zonestore.TrieStore(new),
+            zonestore.TrieStore(old)
+        )
+
+        self.assertEqual(added, [])
+        self.assertEqual(removed, [dns.name.from_text('c.test.')])
+
+
+class ChangesTest(unittest.TestCase):
+
+    def records(self, records):
+        return sorted(
+            (name.to_text(), rdata.to_text())
+            for name, rdataset in records
+            for rdata in rdataset
+        )
+
+    def testChanges(self):
+        zone = '@ 300 NS ns\na 300 A 192.0.2.1\n'
+        old = dns.zone.from_text(
+            '@ 300 SOA ns hostmaster 1 2 3 4 5\n' + zone +
+            'b 300 A 192.0.2.2\nb 300 A 192.0.2.5\nd 300 TXT "gone"\n',
+            origin='test.',
+            relativize=False
+        )
+        new = dns.zone.from_text(
+            '@ 300 SOA ns hostmaster 2 2 3 4 5\n' + zone +
+            'b 300 A 192.0.2.2\nb 300 A 192.0.2.3\nc 300 A 192.0.2.4\n',
+            origin='test.',
+            relativize=False
+        )
+
+        removed, added = zonestore.changes(
+            zonestore.TrieStore(old),
+            zonestore.CompactStore.fromZone(new)
+        )
+
+        self.assertEqual(self.records(removed), [
+            ('b.test.', '192.0.2.5'),
+            ('d.test.', '"gone"'),
+        ])
+        self.assertEqual(self.records(added), [
+            ('b.test.', '192.0.2.3'),
+            ('c.test.', '192.0.2.4'),
+        ])
+
+    def testTtlChange(self):
+        old = dns.zone.from_text(
+            '@ 300 SOA ns hostmaster 1 2 3 4 5\n@ 300 NS ns\n',
+            origin='test.',
+            relativize=False
+        )
+        new = dns.zone.from_text(
+            '@ 300 SOA ns hostmaster 1 2 3 4 5\n@ 600 NS ns\n',
+            origin='test.',
+            relativize=False
+        )
+
+        removed, added = zonestore.changes(
+            zonestore.TrieStore(old),
+            zonestore.TrieStore(new)
+        )
+
+        self.assertEqual(removed[0][1].ttl, 300)
+        self.assertEqual(added[0][1].ttl, 600)
+
+
+class ApplyTest(unittest.TestCase):
+
+    def testApply(self):
+        zone = dns.zone.from_text(
+            '@ 300 SOA ns hostmaster 1 2 3 4 5\n@ 300 NS ns\n'
+            'a.b 300 A 192.0.2.1\nc 300 A 192.0.2.2\nc 300 A 192.0.2.3\n',
+            origin='test.',
+            relativize=False
+        )
+        store = zonestore.TrieStore(zone)
+        newSoa = dns.rdataset.from_text('IN', 'SOA', 300,
+                                        'ns.test. hostmaster.test. 2 2 3 4 5')
+        a = dns.name.from_text('a.b.test.')
+        c = dns.name.from_text('c.test.')
+        d = dns.name.from_text('d.test.')
+
+        applied = store.apply([journal.Delta(
+            store.soa,
+            newSoa,
+            [
+                (a, zone.find_rdataset(a, dns.rdatatype.A)),
+                (c, dns.rdataset.from_text('IN', 'A', 300, '192.0.2.2')),
+            ],
+            [(d, dns.rdataset.from_text('IN', 'TXT', 300, '"new"'))]
+        )])
+
+        self.assertEqual(applied.soa[0].serial, 2)
+        self.assertIsNone(applied.findKey((b'test', b'b', b'a')))
+        self.assertIsNone(applied.findKey((b'test', b'b')))
+        node = applied.findKey((b'test', b'c')).node
+        self.assertEqual(len(node.rdatasets[0]), 1)
+        self.assertIsNotNone(applied.findKey((b'test', b'd')))
+        self.assertEqual(len(applied), 3)
+
+        # the original store is unchanged
+        self.assertEqual(store.soa[0].serial, 1)
+        self.assertIsNotNone(store.findKey((b'test', b'b', b'a')))
+        node = store.findKey((b'test', b'c')).node
+        self.assertEqual(len(node.rdatasets[0]), 2)
+        self.assertIsNone(store.findKey((b'test', b'd')))
@@ -0,0 +1,248 @@
+"""
+Copyright (c) 2012, Nicholas Steicke
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this
+   list of conditions and the following disclaimer.
+2. Redistributions in binary form must reproduce the above copyright notice,
+   this list of conditions and the following disclaimer in the documentation
+   and/or other materials provided with the distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+The views and conclusions contained in the software and documentation are those
+of the authors and should not be interpreted as representing official policies,
+either expressed or implied, of the project author/s.
+"""
+
+import dns.node
+import dns.rcode
+import dns.rdataclass
+import dns.rdataset
+import dns.rdatatype
+
+from utils import journal, zonestore
+
+"""
+Dynamic updates, http://www.ietf.org/rfc/rfc2136.txt. The prerequisite and
+update sections of an UPDATE are checked and carried out against the nodes
+of a zone held in a utils.zonestore.TrieStore, producing the change as a
+utils.journal.Delta that the store applies to a copy of itself.
+"""
+
+# Types that may sit beside a CNAME
+# http://www.ietf.org/rfc/rfc4035.txt
+# 2.5.
+CNAME_SIBLINGS = (
+    dns.rdatatype.CNAME,
+    dns.rdatatype.RRSIG,
+    dns.rdatatype.NSEC,
+)
+
+
+def inUse(node):
+    return node is not None and len(node.rdatasets) > 0
+
+
+def checkPrerequisites(nodes, zone, rdclass, prerequisites):
+    '''
+    Returns the rcode the prerequisite section of an UPDATE to zone fails
+    with against nodes, a dict of the zone's names and nodes, or NOERROR if
+    they all hold.
+    '''
+
+    # http://www.ietf.org/rfc/rfc2136.txt
+    # 3.2.
+    for rrset in prerequisites:
+        if rrset.ttl != 0 or rrset.rdclass != rdclass:
+            return dns.rcode.FORMERR
+
+        if not rrset.name.is_subdomain(zone):
+            return dns.rcode.NOTZONE
+
+        node = nodes.get(rrset.name)
+        existing = None
+        if node is not None:
+            existing = node.get_rdataset(rdclass, rrset.rdtype, rrset.covers)
+
+        if rrset.deleting == dns.rdataclass.ANY:
+            if len(rrset):
+                return dns.rcode.FORMERR
+
+            if rrset.rdtype == dns.rdatatype.ANY:
+                if not inUse(node):
+                    return dns.rcode.NXDOMAIN
+            elif existing is None:
+                return dns.rcode.NXRRSET
+        elif rrset.deleting == dns.rdataclass.NONE:
+            if len(rrset):
+                return dns.rcode.FORMERR
+
+            if rrset.rdtype == dns.rdatatype.ANY:
+                if inUse(node):
+                    return dns.rcode.YXDOMAIN
+            elif existing is not None:
+                return dns.rcode.YXRRSET
+        elif rrset.deleting is None:
+            # Records of the same name and type arrive gathered into one
+            # rrset, which has to match the whole set held
+            # 3.2.5.
+            if existing is None or set(existing) != set(rrset):
+                return dns.rcode.NXRRSET
+        else:
+            return dns.rcode.FORMERR
+
+    return dns.rcode.NOERROR
+
+
+def prescan(zone, rdclass, updates):
+    '''
+    Returns the rcode the update section of an UPDATE to zone is malformed
+    with, or NOERROR.
+    '''
+
+    # http://www.ietf.org/rfc/rfc2136.txt
+    # 3.4.1.3.
+    for rrset in updates:
+        if rrset.rdclass != rdclass:
+            return dns.rcode.FORMERR
+
+        if not rrset.name.is_subdomain(zone):
+            return dns.rcode.NOTZONE
+
+        meta = dns.rdatatype.is_metatype(rrset.rdtype)
+        if rrset.deleting is None:
+            if meta:
+                return dns.rcode.FORMERR
+        elif rrset.deleting == dns.rdataclass.ANY:
+            if rrset.ttl != 0 or len(rrset) \
+                    or (meta and rrset.rdtype != dns.rdatatype.ANY):
+                return dns.rcode.FORMERR
+        elif rrset.deleting == dns.rdataclass.NONE:
+            if rrset.ttl != 0 or meta:
+                return dns.rcode.FORMERR
+        else:
+            return dns.rcode.FORMERR
+
+    return dns.rcode.NOERROR
+
+
+def nextSerial(soa):
+    '''
+    Returns a copy of the SOA rdataset soa with its serial moved on by one.
+    '''
+
+    # http://www.ietf.org/rfc/rfc1982.txt
+    # 3.1.
+    serial = (journal.serialOf(soa) + 1) & 0xffffffff
+    return dns.rdataset.from_rdata(soa.ttl, soa[0].replace(serial=serial))
+
+
+def changes(nodes, zone, soa, updates):
+    '''
+    Carries out the update section of an UPDATE, already prescanned, on
+    copies of the nodes it touches. Returns the change as a
+    utils.journal.Delta from the zone's SOA soa, or None if it changes
+    nothing.
+    '''
+
+    rdclass = soa.rdclass
+    working = {}
+
+    def workingNode(name):
+        node = working.get(name)
+        if node is None:
+            node = dns.node.Node()
+            old = nodes.get(name)
+            if old is not None:
+                node.rdatasets = [
+                    rdataset.copy()
+                    for rdataset in old.rdatasets
+                ]
+            working[name] = node
+
+        return node
+
+    newSoa = soa
+
+    # http://www.ietf.org/rfc/rfc2136.txt
+    # 3.4.2.
+    for rrset in updates:
+        name = rrset.name
+        rdtype = rrset.rdtype
+        node = workingNode(name)
+
+        if rrset.deleting is None:
+            if rdtype == dns.rdatatype.SOA:
+                # only ever replaces the apex SOA, and only moving forward
+                if name == zone and journal.serialGreater(
+                        rrset[0].serial, journal.serialOf(newSoa)):
+                    newSoa = dns.rdataset.from_rdata(rrset.ttl, rrset[0])
+                continue
+
+            types = set(rdataset.rdtype for rdataset in node.rdatasets)
+            if rdtype == dns.rdatatype.CNAME:
+                if types.difference(CNAME_SIBLINGS):
+                    continue
+            elif dns.rdatatype.CNAME in types \
+                    and rdtype not in CNAME_SIBLINGS:
+                continue
+
+            target = node.find_rdataset(rdclass, rdtype, rrset.covers, True)
+            target.ttl = rrset.ttl
+            for rdata in rrset:
+                target.add(rdata)
+        elif rrset.deleting == dns.rdataclass.ANY:
+            if rdtype == dns.rdatatype.ANY:
+                node.rdatasets = [
+                    rdataset
+                    for rdataset in node.rdatasets
+                    if name == zone and rdataset.rdtype in (
+                        dns.rdatatype.SOA,
+                        dns.rdatatype.NS
+                    )
+                ]
+            elif name != zone or rdtype not in (dns.rdatatype.SOA,
+                                                dns.rdatatype.NS):
+                node.delete_rdataset(rdclass, rdtype, rrset.covers)
+        else:
+            target = node.get_rdataset(rdclass, rdtype, rrset.covers)
+            if target is None or rdtype == dns.rdatatype.SOA:
+                continue
+
+            for rdata in rrset:
+                if name == zone and rdtype == dns.rdatatype.NS \
+                        and len(target) == 1:
+                    # the zone keeps its last NS record
+                    break
+                target.discard(rdata)
+
+            if not target:
+                node.delete_rdataset(rdclass, rdtype, rrset.covers)
+
+    removed = []
+    added = []
+    for name, node in working.items():
+        zonestore.nodeChanges(name, nodes.get(name), node, removed, added)
+
+    if not removed and not added:
+        if newSoa is soa:
+            return None
+    elif newSoa is soa:
+        # http://www.ietf.org/rfc/rfc2136.txt
+        # 3.6.
+        newSoa = nextSerial(soa)
+
+    return journal.Delta(soa, newSoa, removed, added)
@@ -0,0 +1,206 @@
+"""
+Copyright (c) 2012, Nicholas Steicke
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this
+   list of conditions and the following disclaimer.
+2. Redistributions in binary form must reproduce the above copyright notice,
+   this list of conditions and the following disclaimer in the documentation
+   and/or other materials provided with the distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+The views and conclusions contained in the software and documentation are those
+of the authors and should not be interpreted as representing official policies,
+either expressed or implied, of the project author/s.
+"""
+
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import threading
+import weakref
+
+from utils import fork
+
+"""
+Calls back when a file changes, woken by inotify on Linux and otherwise
+by polling its inode, size and modification time.
+"""
+
+logger = logging.getLogger('DNS.Watch')
+
+# inotify(7)
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+watchers = weakref.WeakSet()
+
+
+def loadInotify():
+    '''
+    Returns libc through ctypes if it provides inotify, otherwise None.
+    '''
+
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        libc.inotify_init1
+        libc.inotify_add_watch
+    except (OSError, AttributeError):
+        return None
+
+    return libc
+
+
+def signature(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+
+    return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+
+class FileWatcher:
+    '''
+    Watches path from a daemon thread and calls callback(path) whenever its
+    inode, size or modification time changes. The directory holding path
+    is watched with inotify when available, so that files replaced by
+    rename are seen too, and the file is checked at least every interval
+    seconds regardless.
+
+    Threads do not survive fork, so a WorkerSupervisor worker starts its
+    own watcher thread for every watcher that was running in the parent.
+    '''
+
+    def __init__(self, path, callback, interval=1.0, useInotify=True):
+        self.path = os.path.abspath(path)
+        self.callback = callback
+        self.interval = interval
+        self.useInotify = useInotify
+
+        self.last = signature(self.path)
+        self.fd = None
+        self.thread = None
+        self.stopped = threading.Event()
+
+    def start(self):
+        self.stopped.clear()
+        self.fd = self.openInotify()
+
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        watchers.add(self)
+
+    def stop(self):
+        self.stopped.set()
+        watchers.discard(self)
+
+        if self.thread is not None \
+                and self.thread is not threading.current_thread():
+            self.thread.join()
+        self.thread = None
+
+    def openInotify(self):
+        if not self.useInotify:
+            return None
+
+        libc = loadInotify()
+        if libc is None:
+            return None
+
+        fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            return None
+
+        wd = libc.inotify_add_watch(
+            fd,
+            os.fsencode(os.path.dirname(self.path)),
+            IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+        )
+        if wd < 0:
+            logger.warning('Unable to watch %s: %s' % (
+                self.path,
+                os.strerror(ctypes.get_errno())
+            ))
+            os.close(fd)
+            return None
+
+        return fd
+
+    def closeInotify(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def drain(self):
+        # Any event in the directory is only a hint to check the file
+        try:
+            while os.read(self.fd, 65536):
+                pass
+        except BlockingIOError:
+            pass
+
+    def check(self):
+        current = signature(self.path)
+        if current is None or current == self.last:
+            return False
+
+        self.last = current
+        return True
+
+    def run(self):
+        fd = self.fd
+        try:
+            while not self.stopped.is_set():
+                if fd is None:
+                    self.stopped.wait(self.interval)
+                elif select.select([fd], [], [], self.interval)[0]:
+                    self.drain()
+
+                if self.stopped.is_set():
+                    break
+
+                if self.check():
+                    try:
+                        self.callback(self.path)
+                    except Exception:
+                        logger.exception('Watch callback for %s failed' % (
+                            self.path,
+                        ))
+        finally:
+            if self.fd == fd:
+                self.closeInotify()
+
+    def afterFork(self):
+        # The inotify descriptor is shared with the parent, whose thread
+        # would otherwise see half of the events.
+        self.closeInotify()
+        self.thread = None
+        self.start()
+
+
+def restartWatchers():
+    for watcher in list(watchers):
+        if not watcher.stopped.is_set():
+            watcher.afterFork()
+
+
+fork.register(restartWatchers)
@@ -0,0 +1,291 @@
+"""
+Copyright (c) 2012, Nicholas Steicke
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this
+   list of conditions and the following disclaimer.
+2. Redistributions in binary form must reproduce the above copyright notice,
+   this list of conditions and the following disclaimer in the documentation
+   and/or other materials provided with the distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+The views and conclusions contained in the software and documentation are those
+of the authors and should not be interpreted as representing official policies,
+either expressed or implied, of the project author/s.
+"""
+
+import struct
+
+"""
+Helpers working directly on wire format messages.
+"""
+
+HEADER = struct.Struct('!HHHHHH')
+QUESTION = struct.Struct('!HH')
+OPT = struct.Struct('!HHIH')
+
+# Header flag bits, as they sit in the third and fourth bytes
+FLAG_RD = 0x01
+FLAG_CD = 0x10
+
+
+def patchResponse(response, request, questionEnd):
+    '''
+    Adapts a cached response to a new request for the same question. The
+    ID, RD and CD flags are copied from the request, as is the question
+    name so the client's capitalisation is echoed back. questionEnd is the
+    offset just past the question name, which is the same in both.
+    '''
+
+    data = bytearray(response)
+
+    data[0:2] = request[0:2]
+    data[2] = (data[2] & ~FLAG_RD) | (request[2] & FLAG_RD)
+    data[3] = (data[3] & ~FLAG_CD) | (request[3] & FLAG_CD)
+    data[12:questionEnd] = request[12:questionEnd]
+
+    return bytes(data)
+
+
+def questionType(data):
+    '''
+    Returns the type asked for by a wire format message with a single
+    question, or None.
+    '''
+
+    size = len(data)
+    if size < 17 or HEADER.unpack_from(data)[2] != 1:
+        return None
+
+    offset = 12
+    while offset < size:
+        length = data[offset]
+        if length == 0:
+            if offset + 5 > size:
+                return None
+            return QUESTION.unpack_from(data, offset + 1)[0]
+        elif length > 63:
+            return None
+
+        offset += length + 1
+
+    return None
+
+
+class Query:
+    '''
+    The parts of a query needed to route it and look it up in the cache.
+    qname is the question name in lower cased wire format and nameKey its
+    labels ordered from the root, as used by utils.nametrie.
+    '''
+
+    __slots__ = (
+        'id', 'flags', 'qname', 'nameKey', 'qtype', 'qclass',
+        'questionEnd', 'edns', 'payload', 'do'
+    )
+
+
+def parseQuery(data):
+    '''
+    Pulls the question and EDNS details straight out of a wire format
+    query. Returns None for anything but a plain QUERY with one
+    uncompressed question and at most an OPT record alongside it, leaving
+    those to the full parser.
+    '''
+
+    size = len(data)
+    if size < 17:
+        return None
+
+    (ident, flags, qdcount, ancount, nscount, arcount) = \
+        HEADER.unpack_from(data)
+
+    if flags & 0xf800 or qdcount != 1 or ancount or nscount or arcount > 1:
+        # a response, an opcode other than QUERY, or something unusual
+        return None
+
+    labels = []
+    offset = 12
+    while True:
+        if offset >= size:
+            return None
+
+        length = data[offset]
+        if length == 0:
+            offset += 1
+            break
+        elif length > 63:
+            return None
+
+        offset += length + 1
+        labels.append(bytes(data[offset - length:offset]).lower())
+
+    questionEnd = offset
+    if questionEnd + 4 > size:
+        return None
+
+    query = Query()
+    query.id = ident
+    query.flags = flags
+    query.qname = bytes(data[12:questionEnd]).lower()
+    query.nameKey = tuple(reversed(labels))
+    query.qtype, query.qclass = QUESTION.unpack_from(data, questionEnd)
+    query.questionEnd = questionEnd
+    query.edns = -1
+    query.payload = 512
+    query.do = 0
+
+    offset = questionEnd + 4
+    if arcount:
+        # http://www.ietf.org/rfc/rfc6891.txt
+        # 6.1.2.
+        if offset + 11 > size or data[offset] != 0:
+            return None
+
+        rdtype, payload, ttl, rdlength = OPT.unpack_from(data, offset + 1)
+        if rdtype != 41:
+            return None
+
+        offset += 11 + rdlength
+
+        query.edns = (ttl >> 16) & 0xff
+        query.payload = payload
+        query.do = ttl & 0x8000
+
+    if offset != size:
+        return None
+
+    return query
+
+
+# Compression pointer to the question name, which always starts right after
+# the header.
+POINTER_QNAME = b'\xc0\x0c'
+
+RECORD = struct.Struct('!HHIH')
+
+FLAG_QR = 0x8000
+FLAG_AA = 0x0400
+FLAGS_FROM_QUERY = 0x0110  # RD and CD
+
+
+def packRdataset(owner, rdataset, ttl=None):
+    '''
+    Returns the records of rdataset in wire format, each with the given
+    owner name wire bytes. Record data is written without compression so
+    the result can be placed anywhere in a message.
+    '''
+
+    if ttl is None:
+        ttl = rdataset.ttl
+
+    data = bytearray()
+    for rdata in rdataset:
+        rdataWire = rdata.to_wire()
+
+        data += owner
+        data += RECORD.pack(
+            rdataset.rdtype,
+            rdataset.rdclass,
+            ttl,
+            len(rdataWire)
+        )
+        data += rdataWire
+
+    return bytes(data)
+
+
+class Answer:
+    '''
+    A precomputed response to a single question: the header fields and
+    everything after the question section in wire format. Sections are
+    lists of (owner wire bytes, rdataset). An owner of POINTER_QNAME lets
+    one Answer serve any question name, as for wildcards.
+    '''
+
+    __slots__ = ('flags', 'ancount', 'nscount', 'arcount', 'body', 'ttl')
+
+    def __init__(self, rcode, answer=(), authority=(), additional=(),
+                 authoritative=True):
+        self.flags = FLAG_QR | rcode
+        if authoritative:
+            self.flags |= FLAG_AA
+
+        body = bytearray()
+        ttls = []
+        counts = []
+        for section in (answer, authority, additional):
+            count = 0
+            for owner, rdataset in section:
+                body += packRdataset(owner, rdataset)
+                count += len(rdataset)
+                ttls.append(rdataset.ttl)
+
+                if section is authority and rdataset.rdtype == 6:
+                    # SOA, limited to its minimum as for negative caching
+                    ttls.append(rdataset[0].minimum)
+
+            counts.append(count)
+
+        self.ancount, self.nscount, self.arcount = counts
+        self.body = bytes(body)
+        self.ttl = min(ttls) if ttls else 0
+
+    @classmethod
+    def fromBody(cls, rcode, ancount, nscount, body, ttl,
+                 authoritative=True):
+        '''
+        Returns an Answer whose answer and authority records, ancount and
+        nscount of them, are already in wire format in body.
+        '''
+
+        answer = cls.__new__(cls)
+        answer.flags = FLAG_QR | rcode
+        if authoritative:
+            answer.flags |= FLAG_AA
+
+        answer.ancount = ancount
+        answer.nscount = nscount
+        answer.arcount = 0
+        answer.body = body
+        answer.ttl = ttl
+
+        return answer
+
+    def render(self, query, data):
+        '''
+        Returns the response to query, whose wire format is data.
+        '''
+
+        return HEADER.pack(
+            query.id,
+            self.flags | (query.flags & FLAGS_FROM_QUERY),
+            1,
+            self.ancount,
+            self.nscount,
+            self.arcount
+        ) + data[12:query.questionEnd + 4] + self.body
+
+
+def addOpt(data, payload, do):
+    '''
+    Appends an EDNS0 OPT record to a response that has none.
+    '''
+
+    arcount = HEADER.unpack_from(data)[5]
+
+    return data[:10] + struct.pack('!H', arcount + 1) + data[12:] + \
+        b'\x00' + RECORD.pack(41, payload, do, 0)
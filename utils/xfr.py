@@ -0,0 +1,247 @@
+"""
+Copyright (c) 2012, Nicholas Steicke
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this
+   list of conditions and the following disclaimer.
+2. Redistributions in binary form must reproduce the above copyright notice,
+   this list of conditions and the following disclaimer in the documentation
+   and/or other materials provided with the distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+The views and conclusions contained in the software and documentation are those
+of the authors and should not be interpreted as representing official policies,
+either expressed or implied, of the project author/s.
+"""
+
+import threading
+
+import dns.exception
+import dns.rdatatype
+import dns.zone
+
+from utils import journal, wire
+
+"""
+Outbound zone transfers, http://www.ietf.org/rfc/rfc5936.txt (AXFR) and
+http://www.ietf.org/rfc/rfc1995.txt (IXFR). A transfer is produced as a
+stream of message bodies, each holding as many records as fit in one TCP
+message, which are built as they are first needed and kept so that every
+secondary transferring the same version at the same time shares them.
+"""
+
+# http://www.ietf.org/rfc/rfc5936.txt
+# 2.2.
+MAX_MESSAGE = 65535
+
+# Room for the header and the longest possible question
+MAX_BODY = MAX_MESSAGE - wire.HEADER.size - 255 - wire.QUESTION.size
+
+
+def packRecords(owner, rdataset):
+    '''
+    Yields the records of rdataset one at a time in wire format, owned by
+    the name with wire format owner.
+    '''
+
+    for rdata in rdataset:
+        rdataWire = rdata.to_wire()
+
+        yield owner + wire.RECORD.pack(
+            rdataset.rdtype,
+            rdataset.rdclass,
+            rdataset.ttl,
+            len(rdataWire)
+        ) + rdataWire
+
+
+def chunk(records, limit=MAX_BODY):
+    '''
+    Packs [(owner wire, rdataset), ...] into message bodies of at most
+    limit bytes, yielding (record count, body).
+    '''
+
+    body = bytearray()
+    count = 0
+    for owner, rdataset in records:
+        for record in packRecords(owner, rdataset):
+            if count and len(body) + len(record) > limit:
+                yield count, bytes(body)
+                body = bytearray()
+                count = 0
+
+            body += record
+            count += 1
+
+    if count:
+        yield count, bytes(body)
+
+
+def axfrRecords(store):
+    '''
+    Yields the records of a full transfer of store, opened and closed by
+    its SOA.
+    '''
+
+    # http://www.ietf.org/rfc/rfc5936.txt
+    # 2.2.
+    apex = store.origin.to_wire()
+
+    yield apex, store.soa
+    for record in store.records():
+        owner = record.name.to_wire()
+        for rdataset in record.node.rdatasets:
+            if rdataset.rdtype != store.soa.rdtype:
+                yield owner, rdataset
+    yield apex, store.soa
+
+
+def ixfrRecords(apex, soa, deltas):
+    '''
+    Yields the records of an incremental transfer applying deltas, a list
+    of utils.journal.Delta, to bring a secondary up to soa.
+    '''
+
+    # http://www.ietf.org/rfc/rfc1995.txt
+    # 4.
+    apex = apex.to_wire()
+
+    yield apex, soa
+    for delta in deltas:
+        yield apex, delta.oldSoa
+        for name, rdataset in delta.removed:
+            yield name.to_wire(), rdataset
+
+        yield apex, delta.newSoa
+        for name, rdataset in delta.added:
+            yield name.to_wire(), rdataset
+    yield apex, soa
+
+
+def readTransfer(origin, rrsets):
+    '''
+    Makes sense of the answer records of an AXFR or IXFR response, taken
+    in order. Returns the zone's SOA as sent, then a dns.zone.Zone if the
+    whole zone was sent, or else a list of utils.journal.Delta, which is
+    empty if the SOA was all there was.
+    '''
+
+    rrsets = list(rrsets)
+    if not rrsets or rrsets[0].rdtype != dns.rdatatype.SOA:
+        raise dns.exception.FormError('Transfer does not start with an SOA')
+
+    soa = rrsets[0].to_rdataset()
+    if len(rrsets) == 1:
+        return soa, None, []
+
+    if len(rrsets) == 2 or rrsets[1].rdtype != dns.rdatatype.SOA:
+        data = dns.zone.Zone(origin, soa.rdclass, relativize=False)
+        for rrset in rrsets[:-1]:
+            data.find_rdataset(
+                rrset.name,
+                rrset.rdtype,
+                rrset.covers,
+                True
+            ).update(rrset)
+
+        return soa, data, None
+
+    # http://www.ietf.org/rfc/rfc1995.txt
+    # 4. each delta is the old SOA, what went, the new SOA, what came
+    deltas = []
+    delta = None
+    adding = False
+    for rrset in rrsets[1:-1]:
+        rdataset = rrset.to_rdataset()
+        if rrset.rdtype == dns.rdatatype.SOA and rrset.name == origin:
+            if delta is None or adding:
+                delta = journal.Delta(rdataset, None, [], [])
+                deltas.append(delta)
+                adding = False
+            else:
+                delta.newSoa = rdataset
+                adding = True
+        elif adding:
+            delta.added.append((rrset.name, rdataset))
+        else:
+            delta.removed.append((rrset.name, rdataset))
+
+    if not adding:
+        raise dns.exception.FormError('Transfer ends part way into a delta')
+
+    return soa, None, deltas
+
+
+class Stream:
+    '''
+    The bodies of one transfer, drawn from a chunk generator the first time
+    they are asked for and then kept. Any number of threads may iterate
+    over a Stream at once, each getting every body in order.
+    '''
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.bodies = []
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def __iter__(self):
+        index = 0
+        while True:
+            if index < len(self.bodies):
+                yield self.bodies[index]
+                index += 1
+                continue
+
+            with self.lock:
+                if index < len(self.bodies):
+                    continue
+                if self.chunks is None:
+                    return
+
+                body = next(self.chunks, None)
+                if body is None:
+                    self.chunks = None
+                    return
+
+                self.bodies.append(body)
+                self.size += len(body[1])
+
+
+def messages(request, bodies):
+    '''
+    Yields the wire format messages answering request, a dns.message, with
+    bodies. Only the first message repeats the question.
+    '''
+
+    question = request.question[0]
+    flags = wire.FLAG_QR | wire.FLAG_AA | \
+        (request.flags & wire.FLAGS_FROM_QUERY)
+    questionWire = question.name.to_wire() + wire.QUESTION.pack(
+        question.rdtype,
+        question.rdclass
+    )
+
+    # http://www.ietf.org/rfc/rfc5936.txt
+    # 2.2.1.
+    first = True
+    for count, body in bodies:
+        if first:
+            yield wire.HEADER.pack(request.id, flags, 1, count, 0, 0) + \
+                questionWire + body
+            first = False
+        else:
+            yield wire.HEADER.pack(request.id, flags, 0, count, 0, 0) + body
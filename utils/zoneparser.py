@@ -0,0 +1,228 @@
+"""
+Copyright (c) 2012, Nicholas Steicke
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this
+   list of conditions and the following disclaimer.
+2. Redistributions in binary form must reproduce the above copyright notice,
+   this list of conditions and the following disclaimer in the documentation
+   and/or other materials provided with the distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+The views and conclusions contained in the software and documentation are those
+of the authors and should not be interpreted as representing official policies,
+either expressed or implied, of the project author/s.
+"""
+
+import os.path
+
+import dns.exception
+import dns.name
+import dns.rdata
+import dns.rdataclass
+import dns.rdatatype
+import dns.tokenizer
+import dns.ttl
+
+"""
+Reads a master file (http://www.ietf.org/rfc/rfc1035.txt 5.) one record at
+a time, so that a zone can be stored as it is read instead of after the
+whole file has been turned into dnspython objects.
+"""
+
+DEFAULT_BATCH = 4096
+
+
+class Source:
+    '''
+    A file being read, with the origin and owner in effect in it.
+    '''
+
+    def __init__(self, file, origin):
+        if isinstance(file, str):
+            self.file = open(file)
+            self.filename = file
+            self.owned = True
+        else:
+            self.file = file
+            self.filename = getattr(file, 'name', '<file>')
+            self.owned = False
+
+        self.tok = dns.tokenizer.Tokenizer(self.file, self.filename)
+        self.origin = origin
+        self.name = None
+
+    def close(self):
+        if self.owned:
+            self.file.close()
+
+
+def readRecords(file, origin, rdclass=dns.rdataclass.IN):
+    '''
+    Yields (name, ttl, rdata) for every record in the zone file, which may
+    be a path or an open file, with names made absolute. Handles $ORIGIN,
+    $TTL (http://www.ietf.org/rfc/rfc2308.txt 4.), $INCLUDE and records
+    split over lines with parentheses.
+    '''
+
+    if isinstance(origin, str):
+        origin = dns.name.from_text(origin)
+
+    zone = origin
+    sources = [Source(file, origin)]
+    defaultTtl = None
+    lastTtl = None
+
+    try:
+        while sources:
+            source = sources[-1]
+            tok = source.tok
+
+            token = tok.get(want_leading=True)
+            if token.is_eof():
+                source.close()
+                sources.pop()
+                continue
+
+            if token.is_eol():
+                continue
+
+            if token.is_identifier() and token.value.startswith('$'):
+                directive = token.value.upper()
+                if directive == '$TTL':
+                    defaultTtl = dns.ttl.from_text(tok.get_string())
+                    tok.get_eol()
+                elif directive == '$ORIGIN':
+                    source.origin = tok.get_name(source.origin)
+                    tok.get_eol()
+                elif directive == '$INCLUDE':
+                    # the origin and owner go back to their old values at
+                    # the end of the included file
+                    path = tok.get_string()
+                    if not os.path.isabs(path) \
+                            and isinstance(source.filename, str):
+                        path = os.path.join(
+                            os.path.dirname(source.filename),
+                            path
+                        )
+
+                    includeOrigin = source.origin
+                    token = tok.get()
+                    if not token.is_eol_or_eof():
+                        includeOrigin = dns.name.from_text(
+                            token.value,
+                            source.origin
+                        )
+                        tok.get_eol()
+
+                    sources.append(Source(path, includeOrigin))
+                else:
+                    raise dns.exception.SyntaxError(
+                        'Unsupported directive %s' % (token.value, )
+                    )
+                continue
+
+            if token.is_whitespace():
+                # a line holding only whitespace
+                token = tok.get()
+                if token.is_eol_or_eof():
+                    tok.unget(token)
+                    continue
+
+                tok.unget(token)
+                if source.name is None:
+                    raise dns.exception.SyntaxError('No owner name')
+            else:
+                tok.unget(token)
+                source.name = tok.get_name(source.origin)
+
+            name = source.name
+            if not name.is_subdomain(zone):
+                raise dns.exception.SyntaxError(
+                    '%s is not in zone %s' % (name, zone)
+                )
+
+            # [<TTL>] [<class>] <type> or [<class>] [<TTL>] <type>
+            token = tok.get()
+            ttl = None
+            recordClass = None
+            for i in range(2):
+                if ttl is None:
+                    try:
+                        ttl = dns.ttl.from_text(token.value)
+                        token = tok.get()
+                        continue
+                    except dns.ttl.BadTTL:
+                        pass
+
+                if recordClass is None:
+                    try:
+                        recordClass = dns.rdataclass.from_text(token.value)
+                        token = tok.get()
+                    except dns.rdataclass.UnknownRdataclass:
+                        pass
+
+            if recordClass is not None and recordClass != rdclass:
+                raise dns.exception.SyntaxError('RR class is not zone class')
+
+            try:
+                rdtype = dns.rdatatype.from_text(token.value)
+                rdata = dns.rdata.from_text(
+                    rdclass,
+                    rdtype,
+                    tok,
+                    source.origin,
+                    False
+                )
+            except dns.exception.SyntaxError:
+                raise
+            except dns.exception.DNSException as e:
+                raise dns.exception.SyntaxError('%s:%d: %s' % (
+                    tok.where() + (e, )
+                ))
+
+            if ttl is None:
+                if defaultTtl is not None:
+                    ttl = defaultTtl
+                elif lastTtl is not None:
+                    ttl = lastTtl
+                elif rdtype == dns.rdatatype.SOA:
+                    ttl = rdata.minimum
+                else:
+                    raise dns.exception.SyntaxError('Missing default TTL')
+
+            lastTtl = ttl
+
+            yield name, ttl, rdata
+    finally:
+        for source in sources:
+            source.close()
+
+
+def readBatches(file, origin, rdclass=dns.rdataclass.IN, size=DEFAULT_BATCH):
+    '''
+    Yields the records of readRecords in lists of up to size.
+    '''
+
+    batch = []
+    for record in readRecords(file, origin, rdclass):
+        batch.append(record)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+
+    if batch:
+        yield batch
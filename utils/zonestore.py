@@ -0,0 +1,620 @@
+"""
+Copyright (c) 2012, Nicholas Steicke
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this
+   list of conditions and the following disclaimer.
+2. Redistributions in binary form must reproduce the above copyright notice,
+   this list of conditions and the following disclaimer in the documentation
+   and/or other materials provided with the distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+The views and conclusions contained in the software and documentation are those
+of the authors and should not be interpreted as representing official policies,
+either expressed or implied, of the project author/s.
+"""
+
+import array
+import bisect
+import copy
+import struct
+import sys
+
+import dns.name
+import dns.node
+import dns.rdata
+import dns.rdataclass
+import dns.rdataset
+import dns.rdatatype
+import dns.zone
+
+from utils import nametrie
+
+"""
+Indexes of a zone's owner names that answer closest encloser lookups for
+providers.file.ZoneFile.
+"""
+
+COUNT = struct.Struct('!H')
+RDATASET = struct.Struct('!HHIH')
+
+
+class ZoneName:
+    '''
+    An owner name found in a zone store, with its name in lower cased wire
+    format and its dns.node.Node.
+    '''
+
+    __slots__ = ('name', 'wire', 'node')
+
+    def __init__(self, name, wire, node):
+        self.name = name
+        self.wire = wire
+        self.node = node
+
+
+# Returned for empty non-terminals, names that exist only because names
+# below them do
+EMPTY = ZoneName(None, None, dns.node.Node())
+
+
+class TrieStore:
+    '''
+    Keeps a parsed dns.zone.Zone and a utils.nametrie.NameTrie of its owner
+    names. Walking the trie gives the closest encloser of any name below
+    the apex, and the nodes it creates between owners stand for the empty
+    non-terminals.
+    '''
+
+    def __init__(self, data):
+        self.data = data
+        self.origin = data.origin
+        self.depth = len(nametrie.nameKey(self.origin))
+        self.soa = data.find_rdataset(self.origin, dns.rdatatype.SOA)
+
+        names = nametrie.NameTrie()
+        for name, node in data.nodes.items():
+            names.insert(
+                name,
+                ZoneName(name, name.canonicalize().to_wire(), node)
+            )
+
+        self.names = names
+
+    @classmethod
+    def fromStore(cls, store):
+        '''
+        Returns a TrieStore holding the same names as any other store.
+        '''
+
+        data = dns.zone.Zone(store.origin, store.rdclass, relativize=False)
+        for record in store.records():
+            data.nodes[record.name] = record.node
+
+        return cls(data)
+
+    def __len__(self):
+        return len(self.data.nodes)
+
+    def records(self):
+        for name, node in self.data.nodes.items():
+            yield self.names.get(name)
+
+    def findKey(self, key):
+        '''
+        Returns the ZoneName that answers for a utils.nametrie key, either
+        the name itself or the wildcard below its closest encloser, EMPTY
+        for empty non-terminals, or None if the name does not exist.
+        '''
+
+        # http://www.ietf.org/rfc/rfc4592.txt
+        # 3.3.1.
+        depth, node = self.names.closestKey(key)
+        if depth < self.depth:
+            return None
+
+        if depth < len(key):
+            node = node.children.get(nametrie.WILDCARD)
+            if node is None:
+                return None
+
+        if not node.hasValue:
+            return EMPTY
+
+        return node.value
+
+    def apply(self, deltas):
+        '''
+        Returns a new TrieStore with deltas, a list of utils.journal.Delta,
+        applied in order. It shares every name the deltas leave alone with
+        this store, which is not changed and can go on serving meanwhile.
+        '''
+
+        data = dns.zone.Zone(self.origin, self.data.rdclass, relativize=False)
+        data.nodes = dict(self.data.nodes)
+
+        changed = {}
+
+        def changedNode(name):
+            node = changed.get(name)
+            if node is None:
+                node = dns.node.Node()
+                old = data.nodes.get(name)
+                if old is not None:
+                    node.rdatasets = [
+                        rdataset.copy()
+                        for rdataset in old.rdatasets
+                    ]
+                changed[name] = node
+
+            return node
+
+        for delta in deltas:
+            for name, rdataset in delta.removed:
+                node = changedNode(name)
+                target = node.get_rdataset(
+                    rdataset.rdclass,
+                    rdataset.rdtype,
+                    rdataset.covers
+                )
+                if target is None:
+                    continue
+
+                for rdata in rdataset:
+                    target.discard(rdata)
+
+                if not target:
+                    node.delete_rdataset(
+                        rdataset.rdclass,
+                        rdataset.rdtype,
+                        rdataset.covers
+                    )
+
+            for name, rdataset in delta.added:
+                target = changedNode(name).find_rdataset(
+                    rdataset.rdclass,
+                    rdataset.rdtype,
+                    rdataset.covers,
+                    True
+                )
+                target.ttl = rdataset.ttl
+                for rdata in rdataset:
+                    target.add(rdata)
+
+            changedNode(self.origin).replace_rdataset(delta.newSoa.copy())
+
+        names = self.names.clone()
+        for name, node in changed.items():
+            key = nametrie.nameKey(name)
+            if node.rdatasets:
+                data.nodes[name] = node
+                names.insertKey(
+                    key,
+                    ZoneName(name, name.canonicalize().to_wire(), node)
+                )
+            else:
+                data.nodes.pop(name, None)
+                names.removeKey(key)
+
+        store = copy.copy(self)
+        store.data = data
+        store.names = names
+        store.soa = data.find_rdataset(self.origin, dns.rdatatype.SOA)
+
+        return store
+
+
+def packNode(node):
+    '''
+    Returns the rdatasets of a dns.node.Node packed as their count, then
+    per rdataset its type, covered type, TTL, rdata count and each rdata's
+    length and uncompressed wire format.
+    '''
+
+    packed = [COUNT.pack(len(node.rdatasets))]
+    for rdataset in node.rdatasets:
+        packed.append(RDATASET.pack(
+            rdataset.rdtype,
+            rdataset.covers,
+            rdataset.ttl,
+            len(rdataset)
+        ))
+        for rdata in rdataset:
+            data = rdata.to_wire()
+            packed.append(COUNT.pack(len(data)))
+            packed.append(data)
+
+    return b''.join(packed)
+
+
+def unpackNode(data, offset, rdclass):
+    '''
+    Decodes a node packed by packNode starting at offset in data.
+    '''
+
+    node = dns.node.Node()
+    count = COUNT.unpack_from(data, offset)[0]
+    offset += COUNT.size
+    for i in range(count):
+        rdtype, covers, ttl, rdatas = RDATASET.unpack_from(data, offset)
+        offset += RDATASET.size
+
+        items = []
+        for j in range(rdatas):
+            length = COUNT.unpack_from(data, offset)[0]
+            offset += COUNT.size
+            items.append(dns.rdata.from_wire(
+                rdclass,
+                rdtype,
+                data[offset:offset + length],
+                0,
+                length
+            ))
+            offset += length
+
+        # Packed rdatasets are already free of duplicates, filling the set
+        # directly skips Rdataset.add comparing every rdata twice
+        rdataset = dns.rdataset.Rdataset(rdclass, rdtype, covers, ttl)
+        rdataset.items = dict.fromkeys(items)
+
+        node.rdatasets.append(rdataset)
+
+    return node
+
+
+def diff(old, new):
+    '''
+    Compares two stores name by name. Returns the names only in new, the
+    names only in old, and the names in both whose records differ.
+    '''
+
+    nodes = {}
+    for record in old.records():
+        nodes[record.wire] = record
+
+    added = []
+    changed = []
+    for record in new.records():
+        previous = nodes.pop(record.wire, None)
+        if previous is None:
+            added.append(record.name)
+        elif previous.node != record.node:
+            changed.append(record.name)
+
+    removed = [record.name for record in nodes.values()]
+
+    return added, removed, changed
+
+
+def typeMap(node):
+    return {
+        (rdataset.rdtype, rdataset.covers): rdataset
+        for rdataset in node.rdatasets
+    }
+
+
+def ttls(node):
+    return [rdataset.ttl for rdataset in node.rdatasets]
+
+
+def nodeChanges(name, old, new, removed, added):
+    '''
+    Adds the records at name only in node old to removed and those only in
+    node new to added, each as (name, rdataset), leaving out the SOA.
+    Either node may be None for a name that is only in the other.
+    '''
+
+    before = {}
+    if old is not None:
+        before = typeMap(old)
+
+    after = {}
+    if new is not None:
+        after = typeMap(new)
+
+    for key, rdataset in after.items():
+        oldRdataset = before.pop(key, None)
+        if key[0] == dns.rdatatype.SOA:
+            continue
+
+        if oldRdataset is None:
+            added.append((name, rdataset))
+        elif oldRdataset.ttl != rdataset.ttl:
+            # a new TTL replaces the whole set
+            removed.append((name, oldRdataset))
+            added.append((name, rdataset))
+        elif oldRdataset != rdataset:
+            gone = oldRdataset.difference(rdataset)
+            if gone:
+                removed.append((name, gone))
+
+            extra = rdataset.difference(oldRdataset)
+            if extra:
+                added.append((name, extra))
+
+    for key, rdataset in before.items():
+        if key[0] != dns.rdatatype.SOA:
+            removed.append((name, rdataset))
+
+
+def changes(old, new):
+    '''
+    Compares two stores record by record. Returns the records only in old
+    and the records only in new, each as a list of (name, rdataset), as
+    carried by an IXFR delta. The apex SOA is left out, deltas carry it
+    separately.
+    '''
+
+    nodes = {}
+    for record in old.records():
+        nodes[record.wire] = record
+
+    removed = []
+    added = []
+    for record in new.records():
+        previous = nodes.pop(record.wire, None)
+        if previous is not None and previous.node == record.node \
+                and ttls(previous.node) == ttls(record.node):
+            # rdatasets compare equal whatever their TTLs
+            continue
+
+        nodeChanges(
+            record.name,
+            previous.node if previous is not None else None,
+            record.node,
+            removed,
+            added
+        )
+
+    for record in nodes.values():
+        nodeChanges(record.name, record.node, None, removed, added)
+
+    return removed, added
+
+
+def commonDepth(a, b):
+    depth = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        depth += 1
+
+    return depth
+
+
+class SortedStore:
+    '''
+    Base for stores that keep their names as a sorted sequence of
+    utils.nametrie keys, self.keys, and decode the name at an index with
+    self.record.
+    '''
+
+    def __len__(self):
+        return len(self.keys)
+
+    def records(self):
+        for index in range(len(self.keys)):
+            yield self.record(index)
+
+    def findKey(self, key):
+        '''
+        Returns the ZoneName that answers for a utils.nametrie key, either
+        the name itself or the wildcard below its closest encloser, EMPTY
+        for empty non-terminals, or None if the name does not exist.
+        '''
+
+        keys = self.keys
+        count = len(keys)
+        index = bisect.bisect_left(keys, key)
+
+        # The names either side of where key sorts share the most labels
+        # with it, the closest encloser is the longer of the two.
+        depth = 0
+        if index < count:
+            found = keys[index]
+            if found == key:
+                return self.record(index)
+
+            depth = commonDepth(key, found)
+            if depth == len(key):
+                return EMPTY
+
+        if index > 0:
+            depth = max(depth, commonDepth(key, keys[index - 1]))
+
+        if depth < self.depth:
+            return None
+
+        # http://www.ietf.org/rfc/rfc4592.txt
+        # 3.3.1.
+        wildcard = key[:depth] + (nametrie.WILDCARD, )
+        index = bisect.bisect_left(keys, wildcard)
+        if index < count:
+            found = keys[index]
+            if found == wildcard:
+                return self.record(index)
+
+            if found[:len(wildcard)] == wildcard:
+                return EMPTY
+
+        return None
+
+
+class CompactBuilder:
+    '''
+    Collects records one at a time into a CompactStore. Until build is
+    called each name keeps its records as packed bytes in the order they
+    were added, so a zone read record by record never exists as dnspython
+    objects all at once.
+    '''
+
+    def __init__(self, origin, rdclass=dns.rdataclass.IN):
+        self.origin = origin
+        self.rdclass = rdclass
+
+        self.labels = {}
+        self.pending = {}
+
+    def add(self, name, ttl, rdata):
+        labels = self.labels
+        key = tuple(labels.setdefault(label, label)
+                    for label in nametrie.nameKey(name))
+
+        packed = self.pending.get(key)
+        if packed is None:
+            packed = bytearray()
+            self.pending[key] = packed
+
+        data = rdata.to_wire()
+        packed += RDATASET.pack(rdata.rdtype, rdata.covers(), ttl, len(data))
+        packed += data
+
+    def addBatch(self, records):
+        for name, ttl, rdata in records:
+            self.add(name, ttl, rdata)
+
+    def addZone(self, data):
+        for name, node in data.nodes.items():
+            for rdataset in node.rdatasets:
+                for rdata in rdataset:
+                    self.add(name, rdataset.ttl, rdata)
+
+    def packPending(self, packed):
+        '''
+        Turns the records added for one name into packNode's format,
+        merging them into rdatasets as dnspython does: duplicates are
+        dropped, an rdataset takes the lowest TTL of its records and
+        singleton types keep only their last record.
+        '''
+
+        rdatasets = {}
+        offset = 0
+        while offset < len(packed):
+            rdtype, covers, ttl, length = RDATASET.unpack_from(packed, offset)
+            offset += RDATASET.size
+            data = bytes(packed[offset:offset + length])
+            offset += length
+
+            rdataset = rdatasets.get((rdtype, covers))
+            if rdataset is None:
+                rdatasets[(rdtype, covers)] = [ttl, {data: None}]
+                continue
+
+            rdataset[0] = min(rdataset[0], ttl)
+            if dns.rdatatype.is_singleton(rdtype):
+                rdataset[1] = {data: None}
+            else:
+                rdataset[1][data] = None
+
+        node = [COUNT.pack(len(rdatasets))]
+        for (rdtype, covers), (ttl, rdatas) in rdatasets.items():
+            node.append(RDATASET.pack(rdtype, covers, ttl, len(rdatas)))
+            for data in rdatas:
+                node.append(COUNT.pack(len(data)))
+                node.append(data)
+
+        return b''.join(node)
+
+    def build(self):
+        keys = []
+        offsets = array.array('Q')
+        packed = bytearray()
+
+        # names are packed into place as their pending records are freed
+        pending = self.pending
+        for key in sorted(pending):
+            keys.append(key)
+            offsets.append(len(packed))
+            packed += self.packPending(pending.pop(key))
+
+        store = CompactStore(
+            self.origin,
+            self.rdclass,
+            keys,
+            offsets,
+            bytes(packed),
+            self.labels
+        )
+        self.labels = {}
+
+        return store
+
+
+class CompactStore(SortedStore):
+    '''
+    Holds a zone in a few flat objects instead of dnspython's per record
+    ones: a sorted list of name keys built from shared label strings, and
+    every name's rdatasets packed by packNode into one bytes object, found
+    through an array of offsets. Nodes are decoded each time they are
+    found. Built by CompactBuilder, or with fromZone and fromRecords.
+    '''
+
+    def __init__(self, origin, rdclass, keys, offsets, packed, labels):
+        self.origin = origin
+        self.rdclass = rdclass
+        self.depth = len(nametrie.nameKey(self.origin))
+
+        self.keys = keys
+        self.offsets = offsets
+        self.packed = packed
+
+        self.size = sys.getsizeof(self.packed) + \
+            sys.getsizeof(self.offsets) + sys.getsizeof(self.keys) + \
+            sum(sys.getsizeof(key) for key in keys) + \
+            sum(sys.getsizeof(label) for label in labels)
+
+        apex = self.findKey(nametrie.nameKey(self.origin))
+        if apex is None or apex is EMPTY:
+            raise dns.zone.NoSOA
+
+        self.soa = apex.node.get_rdataset(self.rdclass, dns.rdatatype.SOA)
+        if self.soa is None:
+            raise dns.zone.NoSOA
+
+    @classmethod
+    def fromZone(cls, data):
+        builder = CompactBuilder(data.origin, data.rdclass)
+        builder.addZone(data)
+        return builder.build()
+
+    @classmethod
+    def fromRecords(cls, origin, batches, rdclass=dns.rdataclass.IN):
+        '''
+        Builds a store from batches of (name, ttl, rdata), as yielded by
+        utils.zoneparser.readBatches.
+        '''
+
+        builder = CompactBuilder(origin, rdclass)
+        for batch in batches:
+            builder.addBatch(batch)
+
+        return builder.build()
+
+    def getSize(self):
+        '''
+        Returns roughly how many bytes of memory the store holds.
+        '''
+
+        return self.size
+
+    def record(self, index):
+        name = dns.name.Name(tuple(reversed(self.keys[index])) + (b'', ))
+
+        return ZoneName(
+            name,
+            name.to_wire(),
+            unpackNode(self.packed, self.offsets[index], self.rdclass)
+        )